@@ -0,0 +1,92 @@
+"""
+Lớp truy cập database bất đồng bộ cho các route async.
+
+DB_BACKEND=postgrest (mặc định): Supabase REST qua httpx.AsyncClient có pool
+keep-alive. DB_BACKEND=sqlite: file SQLite cục bộ (DB_SQLITE_PATH) cùng schema,
+để chạy và load-test không cần Supabase.
+
+Code chạy ngoài event loop (thread nền như write-behind) dùng run_sync() để
+gửi truy vấn sang loop của app, dùng chung pool kết nối.
+"""
+
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.db.base import (
+    AsyncDatabase,
+    DatabaseError,
+    DatabaseTimeout,
+    DB_QUERY_TIMEOUT_SECONDS,
+    Where,
+)
+from app.db.pagination import InvalidCursor, paginate
+from app.utils.metrics import gauge
+
+DB_BACKEND = os.getenv("DB_BACKEND", "postgrest").lower()
+
+_db: Optional[AsyncDatabase] = None
+_db_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _create_db() -> AsyncDatabase:
+    if DB_BACKEND == "sqlite":
+        from app.db.sqlite import SQLiteDatabase
+        return SQLiteDatabase()
+    if DB_BACKEND == "postgrest":
+        from app.config import settings
+        from app.db.postgrest import PostgrestDatabase
+        return PostgrestDatabase(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+    raise ValueError(f"DB_BACKEND không hỗ trợ: {DB_BACKEND}")
+
+
+def get_db() -> AsyncDatabase:
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                _db = _create_db()
+    return _db
+
+
+def bind_loop(loop: asyncio.AbstractEventLoop):
+    """Gọi trong lifespan: loop sở hữu pool kết nối, run_sync() gửi truy vấn về đây"""
+    global _loop
+    _loop = loop
+
+
+def run_sync(factory: Callable[[AsyncDatabase], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+    """Chạy một truy vấn từ thread không phải event loop (vd. write-behind flusher)"""
+    if not is_bound():
+        raise DatabaseError("Không có event loop nào được bind (hoặc đang ở chính thread của loop)")
+    future = asyncio.run_coroutine_threadsafe(factory(get_db()), _loop)
+    return future.result(timeout=timeout)
+
+
+def is_bound() -> bool:
+    """run_sync() dùng được từ thread hiện tại không (False ngay trên thread của loop)"""
+    if _loop is None or not _loop.is_running():
+        return False
+    try:
+        return asyncio.get_running_loop() is not _loop
+    except RuntimeError:
+        return True
+
+
+async def close_db():
+    global _db, _loop
+    if _db is not None:
+        await _db.close()
+        _db = None
+    _loop = None
+
+
+def db_stats() -> Dict[str, Any]:
+    if _db is None:
+        return {"backend": DB_BACKEND, "initialized": False}
+    return {"initialized": True, **_db.stats()}
+
+
+gauge("db_in_flight_queries", lambda: _db.in_flight() if _db is not None else 0, "Database queries in flight")
@@ -0,0 +1,191 @@
+"""
+Giao diện chung của lớp database bất đồng bộ: select / insert / update / delete /
+upsert trên một bảng, điều kiện dạng (cột, toán tử, giá trị). Mỗi truy vấn có
+timeout riêng và được đo vào histogram db_query_ms{op="..."}.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from app.utils.metrics import histogram
+
+DB_QUERY_TIMEOUT_SECONDS = float(os.getenv("DB_QUERY_TIMEOUT_SECONDS", "5"))
+
+QUERY_MS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+OPERATORS = ("eq", "neq", "gt", "gte", "lt", "lte", "in", "is")
+
+Condition = Tuple[str, str, Any]
+# {"id": x} (so sánh bằng) hoặc [("created_at", "gte", t), ("status", "in", [...])]
+Where = Union[Dict[str, Any], Sequence[Condition], None]
+Rows = Union[Dict[str, Any], List[Dict[str, Any]]]
+
+
+class DatabaseError(Exception):
+    """Truy vấn bị database từ chối hoặc lỗi kết nối"""
+
+
+class DatabaseTimeout(DatabaseError):
+    """Truy vấn vượt quá timeout"""
+
+
+def normalize_where(where: Where) -> List[Condition]:
+    if not where:
+        return []
+    if isinstance(where, dict):
+        return [(column, "eq", value) for column, value in where.items()]
+    conditions = []
+    for column, op, value in where:
+        if op not in OPERATORS:
+            raise ValueError(f"Toán tử không hỗ trợ: {op}")
+        conditions.append((column, op, value))
+    return conditions
+
+
+def normalize_rows(rows: Rows) -> List[Dict[str, Any]]:
+    return [rows] if isinstance(rows, dict) else list(rows)
+
+
+def order_columns(order: Optional[str]) -> List[str]:
+    """"created_at, id" -> ["created_at", "id"]"""
+    return [column.strip() for column in order.split(",") if column.strip()] if order else []
+
+
+class AsyncDatabase:
+    """Lớp cơ sở; backend cài đặt các hàm _select/_insert/_update/_delete/_upsert"""
+
+    backend = "base"
+
+    def __init__(self, timeout: float = DB_QUERY_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._counters = {"queries": 0, "errors": 0, "timeouts": 0}
+        self._query_ms = {
+            op: histogram("db_query_ms", QUERY_MS_BUCKETS, "Database query latency (ms)", labels={"op": op})
+            for op in ("select", "insert", "update", "delete", "upsert")
+        }
+
+    async def _run(self, op: str, coro, timeout: Optional[float]):
+        started = time.perf_counter()
+        with self._stats_lock:
+            self._in_flight += 1
+            self._counters["queries"] += 1
+        try:
+            return await asyncio.wait_for(coro, timeout=timeout or self.timeout)
+        except asyncio.TimeoutError:
+            with self._stats_lock:
+                self._counters["timeouts"] += 1
+            raise DatabaseTimeout(f"{op} vượt quá {timeout or self.timeout}s")
+        except DatabaseError:
+            with self._stats_lock:
+                self._counters["errors"] += 1
+            raise
+        except Exception as e:
+            with self._stats_lock:
+                self._counters["errors"] += 1
+            raise DatabaseError(f"{op} lỗi: {e}") from e
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+            self._query_ms[op].observe((time.perf_counter() - started) * 1000)
+
+    async def select(
+        self,
+        table: str,
+        columns: str = "*",
+        where: Where = None,
+        order: Optional[str] = None,
+        desc: bool = False,
+        limit: Optional[int] = None,
+        timeout: Optional[float] = None,
+        after: Optional[Sequence[Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """order có thể gồm nhiều cột ("created_at, id"), cùng chiều desc.
+        after: giá trị các cột order của dòng cuối trang trước -> chỉ lấy các dòng
+        đứng sau nó theo thứ tự đó (keyset pagination, so sánh theo bộ giá trị)."""
+        columns_order = order_columns(order)
+        if after is not None and len(after) != len(columns_order):
+            raise ValueError("after phải có đúng một giá trị cho mỗi cột order")
+        return await self._run(
+            "select",
+            self._select(table, columns, normalize_where(where), columns_order, desc, limit, after),
+            timeout,
+        )
+
+    async def select_one(self, table: str, columns: str = "*", where: Where = None, **kwargs) -> Optional[Dict[str, Any]]:
+        rows = await self.select(table, columns, where, limit=1, **kwargs)
+        return rows[0] if rows else None
+
+    async def insert(
+        self, table: str, rows: Rows, returning: bool = True, timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        return await self._run("insert", self._insert(table, normalize_rows(rows), returning), timeout)
+
+    async def update(
+        self, table: str, values: Dict[str, Any], where: Where, timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        conditions = normalize_where(where)
+        if not conditions:
+            raise ValueError("update cần điều kiện where")
+        return await self._run("update", self._update(table, values, conditions), timeout)
+
+    async def delete(self, table: str, where: Where, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        conditions = normalize_where(where)
+        if not conditions:
+            raise ValueError("delete cần điều kiện where")
+        return await self._run("delete", self._delete(table, conditions), timeout)
+
+    async def upsert(
+        self, table: str, rows: Rows, on_conflict: str = "id", timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        return await self._run("upsert", self._upsert(table, normalize_rows(rows), on_conflict), timeout)
+
+    async def _select(self, table, columns, conditions, order, desc, limit, after):
+        raise NotImplementedError
+
+    async def _insert(self, table, rows, returning):
+        raise NotImplementedError
+
+    async def _update(self, table, values, conditions):
+        raise NotImplementedError
+
+    async def _delete(self, table, conditions):
+        raise NotImplementedError
+
+    async def _upsert(self, table, rows, on_conflict):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            counters = dict(self._counters)
+            in_flight = self._in_flight
+        return {
+            "backend": self.backend,
+            "timeout_seconds": self.timeout,
+            "in_flight": in_flight,
+            **counters,
+            "pool": self.pool_stats(),
+            "query_ms": {op: hist.snapshot() for op, hist in self._query_ms.items()},
+        }
+
+
+def columns_of(rows: Iterable[Dict[str, Any]]) -> List[str]:
+    """Hợp các cột của mọi dòng, giữ thứ tự xuất hiện"""
+    seen: Dict[str, None] = {}
+    for row in rows:
+        for column in row:
+            seen.setdefault(column, None)
+    return list(seen)
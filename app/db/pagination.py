@@ -0,0 +1,74 @@
+"""
+Keyset (cursor) pagination cho các endpoint dạng danh sách.
+Thứ tự ổn định theo (created_at, id); next_cursor là giá trị hai cột đó của dòng
+cuối trang, mã hóa base64url, để trang sau chỉ đọc "các dòng đứng sau" bằng index
+thay vì OFFSET. Mỗi trang lấy limit + 1 dòng để biết còn trang tiếp hay không.
+"""
+
+import base64
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.db.base import AsyncDatabase, Where
+
+API_PAGE_SIZE_DEFAULT = int(os.getenv("API_PAGE_SIZE_DEFAULT", "50"))
+API_PAGE_SIZE_MAX = int(os.getenv("API_PAGE_SIZE_MAX", "200"))
+
+PAGE_ORDER = ("created_at", "id")
+
+
+class InvalidCursor(ValueError):
+    """Cursor không giải mã được hoặc không khớp với thứ tự của danh sách"""
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps(list(values), ensure_ascii=False, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, size: int = len(PAGE_ORDER)) -> List[Any]:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except Exception as e:
+        raise InvalidCursor(f"Cursor không hợp lệ: {e}") from e
+    if not isinstance(values, list) or len(values) != size or any(v is None for v in values):
+        raise InvalidCursor("Cursor không hợp lệ")
+    return values
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return API_PAGE_SIZE_DEFAULT
+    return min(limit, API_PAGE_SIZE_MAX)
+
+
+async def paginate(
+    db: AsyncDatabase,
+    table: str,
+    columns: str,
+    where: Where = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    order: Sequence[str] = PAGE_ORDER,
+    desc: bool = True,
+) -> Dict[str, Any]:
+    """Một trang {"items": [...], "next_cursor": str | None}.
+
+    columns là danh sách cột cần trả (không lấy "*" để tránh kéo blob lớn);
+    các cột trong order luôn được chọn thêm vì cursor cần chúng.
+    """
+    limit = clamp_limit(limit)
+    after = decode_cursor(cursor, len(order)) if cursor else None
+    selected = [c.strip() for c in columns.split(",") if c.strip()]
+    selected += [c for c in order if c not in selected]
+    rows = await db.select(
+        table, ", ".join(selected), where=where, order=", ".join(order), desc=desc,
+        limit=limit + 1, after=after,
+    )
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor([items[-1][column] for column in order])
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,156 @@
+"""
+Backend Supabase: gọi thẳng PostgREST (/rest/v1) bằng một httpx.AsyncClient
+dùng chung, giữ kết nối keep-alive trong pool thay vì client đồng bộ của
+supabase-py (mỗi .execute() chặn event loop).
+"""
+
+import json
+import os
+import uuid
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.db.base import AsyncDatabase, Condition, DatabaseError, DB_QUERY_TIMEOUT_SECONDS
+
+DB_POOL_MAX_CONNECTIONS = int(os.getenv("DB_POOL_MAX_CONNECTIONS", "20"))
+DB_POOL_MAX_KEEPALIVE = int(os.getenv("DB_POOL_MAX_KEEPALIVE", "10"))
+DB_POOL_KEEPALIVE_EXPIRY = float(os.getenv("DB_POOL_KEEPALIVE_EXPIRY", "30"))
+
+
+def _json_default(value: Any):
+    if isinstance(value, (uuid.UUID, datetime, date)):
+        return str(value) if isinstance(value, uuid.UUID) else value.isoformat()
+    raise TypeError(f"Không serialize được {type(value).__name__}")
+
+
+def _literal(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return "null"
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _filter_params(conditions: List[Condition]) -> List[tuple]:
+    params = []
+    for column, op, value in conditions:
+        if op == "in":
+            # PostgREST: in.("a","b") - đặt trong ngoặc kép để giá trị có dấu phẩy không bị tách
+            quoted = ",".join('"' + _literal(v).replace('"', '\\"') + '"' for v in value)
+            params.append((column, f"in.({quoted})"))
+        else:
+            params.append((column, f"{op}.{_literal(value)}"))
+    return params
+
+
+def _quoted(value: Any) -> str:
+    # Giá trị trong or=(...) phải đặt trong ngoặc kép (timestamp có ':' , '+', ...)
+    return '"' + _literal(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _keyset_filter(order: List[str], after, desc: bool) -> str:
+    """(c1, c2) > (v1, v2) viết bằng logic tree của PostgREST:
+    or=(c1.gt.v1,and(c1.eq.v1,c2.gt.v2))"""
+    op = "lt" if desc else "gt"
+    branches = []
+    for i, column in enumerate(order):
+        equal = [f"{order[j]}.eq.{_quoted(after[j])}" for j in range(i)]
+        strict = f"{column}.{op}.{_quoted(after[i])}"
+        branches.append(f"and({','.join(equal + [strict])})" if equal else strict)
+    return f"({','.join(branches)})"
+
+
+class PostgrestDatabase(AsyncDatabase):
+    backend = "postgrest"
+
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        timeout: float = DB_QUERY_TIMEOUT_SECONDS,
+        max_connections: int = DB_POOL_MAX_CONNECTIONS,
+        max_keepalive: int = DB_POOL_MAX_KEEPALIVE,
+        keepalive_expiry: float = DB_POOL_KEEPALIVE_EXPIRY,
+    ):
+        super().__init__(timeout)
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self._client = httpx.AsyncClient(
+            base_url=f"{url.rstrip('/')}/rest/v1",
+            headers={
+                "apikey": key,
+                "Authorization": f"Bearer {key}",
+                "Content-Type": "application/json",
+            },
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            # Timeout theo truy vấn do AsyncDatabase._run áp; đây là trần cho từng pha HTTP
+            timeout=httpx.Timeout(timeout, pool=timeout),
+        )
+
+    async def _send(self, method: str, table: str, params=None, body=None, prefer: Optional[str] = None):
+        headers = {"Prefer": prefer} if prefer else None
+        content = json.dumps(body, ensure_ascii=False, default=_json_default) if body is not None else None
+        try:
+            response = await self._client.request(method, f"/{table}", params=params, content=content, headers=headers)
+        except httpx.TimeoutException as e:
+            raise DatabaseError(f"HTTP timeout: {e}") from e
+        except httpx.HTTPError as e:
+            raise DatabaseError(f"Lỗi kết nối: {e}") from e
+        if response.status_code >= 400:
+            raise DatabaseError(f"{response.status_code}: {response.text}")
+        if not response.content:
+            return []
+        return response.json()
+
+    async def _select(self, table, columns, conditions, order, desc, limit, after):
+        params = [("select", columns)] + _filter_params(conditions)
+        if after is not None:
+            params.append(("or", _keyset_filter(order, after, desc)))
+        if order:
+            direction = "desc" if desc else "asc"
+            params.append(("order", ",".join(f"{column}.{direction}" for column in order)))
+        if limit is not None:
+            params.append(("limit", str(limit)))
+        return await self._send("GET", table, params=params)
+
+    async def _insert(self, table, rows, returning):
+        prefer = "return=representation" if returning else "return=minimal"
+        return await self._send("POST", table, body=rows, prefer=prefer)
+
+    async def _update(self, table, values, conditions):
+        return await self._send(
+            "PATCH", table, params=_filter_params(conditions), body=values, prefer="return=representation"
+        )
+
+    async def _delete(self, table, conditions):
+        return await self._send("DELETE", table, params=_filter_params(conditions), prefer="return=representation")
+
+    async def _upsert(self, table, rows, on_conflict):
+        return await self._send(
+            "POST", table, params=[("on_conflict", on_conflict)], body=rows,
+            prefer="resolution=merge-duplicates,return=representation"
+        )
+
+    async def close(self):
+        await self._client.aclose()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "max_connections": self.max_connections,
+            "max_keepalive": self.max_keepalive,
+        }
+        # httpx không có API công khai cho trạng thái pool; đọc từ httpcore nếu có
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        if connections is not None:
+            stats["open_connections"] = len(connections)
+            stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+        return stats
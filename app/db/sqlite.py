@@ -0,0 +1,248 @@
+"""
+Backend SQLite thay cho Supabase khi chạy cục bộ / load-test offline.
+Mỗi thread của executor giữ một connection riêng (pool cố định pool_size);
+schema tạo từ sql/schema_sqlite.sql. Cột JSON lưu dạng text, BOOLEAN dạng 0/1,
+id (uuid) và created_at được sinh phía Python như default của Postgres.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.db.base import AsyncDatabase, Condition, DatabaseError, DB_QUERY_TIMEOUT_SECONDS, columns_of
+
+DB_SQLITE_PATH = os.getenv("DB_SQLITE_PATH", "data/voiceai_local.db")
+DB_SQLITE_POOL_SIZE = int(os.getenv("DB_SQLITE_POOL_SIZE", "4"))
+SQLITE_SCHEMA_PATH = Path(__file__).resolve().parent.parent.parent / "sql" / "schema_sqlite.sql"
+
+_SQL_OPERATORS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _q(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _where_sql(conditions: List[Condition]):
+    clauses, params = [], []
+    for column, op, value in conditions:
+        if op == "in":
+            values = list(value)
+            if not values:
+                clauses.append("0")
+                continue
+            clauses.append(f'{_q(column)} IN ({",".join("?" * len(values))})')
+            params.extend(_encode(v) for v in values)
+        elif op == "is":
+            clauses.append(f"{_q(column)} IS ?")
+            params.append(_encode(value))
+        else:
+            clauses.append(f"{_q(column)} {_SQL_OPERATORS[op]} ?")
+            params.append(_encode(value))
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+class SQLiteDatabase(AsyncDatabase):
+    backend = "sqlite"
+
+    def __init__(
+        self,
+        path: str = DB_SQLITE_PATH,
+        pool_size: int = DB_SQLITE_POOL_SIZE,
+        timeout: float = DB_QUERY_TIMEOUT_SECONDS,
+        schema_path: Path = SQLITE_SCHEMA_PATH,
+    ):
+        if path == ":memory:" or path.startswith("file::memory:"):
+            # Mỗi connection theo thread sẽ là một DB rỗng riêng
+            raise ValueError("SQLiteDatabase cần đường dẫn file, không hỗ trợ :memory:")
+        super().__init__(timeout)
+        self.path = path
+        self.pool_size = pool_size
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="sqlite")
+        self._columns: Dict[str, Dict[str, str]] = {}  # table -> {cột: kiểu khai báo}
+        with closing(self._connect()) as conn:
+            conn.executescript(schema_path.read_text(encoding="utf-8"))
+
+    def _connect(self) -> sqlite3.Connection:
+        # Mỗi connection chỉ được dùng trong thread của nó; check_same_thread=False để close() từ thread khác
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _table_columns(self, conn: sqlite3.Connection, table: str) -> Dict[str, str]:
+        columns = self._columns.get(table)
+        if columns is None:
+            rows = conn.execute(f"PRAGMA table_info({_q(table)})").fetchall()
+            if not rows:
+                raise DatabaseError(f"Bảng không tồn tại: {table}")
+            columns = {row["name"]: (row["type"] or "").upper() for row in rows}
+            self._columns[table] = columns
+        return columns
+
+    def _decode(self, conn: sqlite3.Connection, table: str, rows) -> List[Dict[str, Any]]:
+        types = self._table_columns(conn, table)
+        decoded = []
+        for row in rows:
+            item = dict(row)
+            for column, value in item.items():
+                kind = types.get(column)
+                if value is None or kind is None:
+                    continue
+                if kind == "JSON":
+                    item[column] = json.loads(value)
+                elif kind == "BOOLEAN":
+                    item[column] = bool(value)
+            decoded.append(item)
+        return decoded
+
+    async def _call(self, fn: Callable[[sqlite3.Connection], Any]):
+        def run():
+            conn = self._connection()
+            try:
+                with conn:  # commit / rollback
+                    return fn(conn)
+            except sqlite3.Error as e:
+                raise DatabaseError(str(e)) from e
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, run)
+
+    def _with_defaults(self, conn, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        types = self._table_columns(conn, table)
+        row = dict(row)
+        if "id" in types and row.get("id") is None:
+            row["id"] = str(uuid.uuid4())
+        if "created_at" in types and row.get("created_at") is None:
+            row["created_at"] = datetime.now(timezone.utc).isoformat()
+        return row
+
+    async def _select(self, table, columns, conditions, order, desc, limit, after):
+        def run(conn):
+            where, params = _where_sql(conditions)
+            if after is not None:
+                # Row value: (created_at, id) < (?, ?) - đúng thứ tự ORDER BY bên dưới
+                keyset = (
+                    f'({", ".join(_q(c) for c in order)}) {"<" if desc else ">"} '
+                    f'({", ".join("?" * len(order))})'
+                )
+                where = f"{where} AND {keyset}" if where else f" WHERE {keyset}"
+                params.extend(_encode(v) for v in after)
+            cols = "*" if columns.strip() == "*" else ", ".join(_q(c.strip()) for c in columns.split(","))
+            sql = f"SELECT {cols} FROM {_q(table)}{where}"
+            if order:
+                direction = "DESC" if desc else "ASC"
+                sql += " ORDER BY " + ", ".join(f"{_q(c)} {direction}" for c in order)
+            if limit is not None:
+                sql += f" LIMIT {int(limit)}"
+            return self._decode(conn, table, conn.execute(sql, params).fetchall())
+        return await self._call(run)
+
+    async def _insert(self, table, rows, returning):
+        def run(conn):
+            full_rows = [self._with_defaults(conn, table, row) for row in rows]
+            if not full_rows:
+                return []
+            columns = columns_of(full_rows)
+            sql = (
+                f'INSERT INTO {_q(table)} ({", ".join(_q(c) for c in columns)}) '
+                f'VALUES ({", ".join("?" * len(columns))})'
+            )
+            conn.executemany(sql, [[_encode(row.get(c)) for c in columns] for row in full_rows])
+            if not returning:
+                return []
+            ids = [row["id"] for row in full_rows]
+            placeholders = ",".join("?" * len(ids))
+            fetched = conn.execute(f"SELECT * FROM {_q(table)} WHERE id IN ({placeholders})", ids).fetchall()
+            by_id = {row["id"]: row for row in self._decode(conn, table, fetched)}
+            return [by_id[i] for i in ids if i in by_id]
+        return await self._call(run)
+
+    async def _update(self, table, values, conditions):
+        def run(conn):
+            where, params = _where_sql(conditions)
+            assignments = ", ".join(f"{_q(column)} = ?" for column in values)
+            sql = f'UPDATE {_q(table)} SET {assignments}{where} RETURNING *'
+            rows = conn.execute(sql, [_encode(v) for v in values.values()] + params).fetchall()
+            return self._decode(conn, table, rows)
+        return await self._call(run)
+
+    async def _delete(self, table, conditions):
+        def run(conn):
+            where, params = _where_sql(conditions)
+            rows = conn.execute(f"DELETE FROM {_q(table)}{where} RETURNING *", params).fetchall()
+            return self._decode(conn, table, rows)
+        return await self._call(run)
+
+    async def _upsert(self, table, rows, on_conflict):
+        def run(conn):
+            if not rows:
+                return []
+            # Giống PostgREST merge-duplicates: chỉ các cột được gửi bị ghi đè,
+            # id/created_at sinh thêm chỉ dùng khi dòng là dòng mới
+            full_rows = [self._with_defaults(conn, table, row) for row in rows]
+            columns = columns_of(full_rows)
+            conflict = [c.strip() for c in on_conflict.split(",")]
+            updates = [c for c in columns_of(rows) if c not in conflict]
+            if updates:
+                action = "DO UPDATE SET " + ", ".join(f"{_q(c)} = excluded.{_q(c)}" for c in updates)
+            else:
+                action = "DO NOTHING"
+            sql = (
+                f'INSERT INTO {_q(table)} ({", ".join(_q(c) for c in columns)}) '
+                f'VALUES ({", ".join("?" * len(columns))}) '
+                f'ON CONFLICT ({", ".join(_q(c) for c in conflict)}) {action} RETURNING *'
+            )
+            result = []
+            for row in full_rows:
+                result.extend(conn.execute(sql, [_encode(row.get(c)) for c in columns]).fetchall())
+            return self._decode(conn, table, result)
+        return await self._call(run)
+
+    async def close(self):
+        self._executor.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        with self._connections_lock:
+            open_connections = len(self._connections)
+        return {
+            "path": self.path,
+            "pool_size": self.pool_size,
+            "open_connections": open_connections,
+        }
@@ -4,7 +4,6 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from app.config import Settings, settings
 from app.models import TokenData
-from app.database import supabase
 
 @lru_cache()
 def get_settings() -> Settings:
@@ -1,16 +1,76 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from app.utils.logger import configure_logging, shutdown_logging
+
+# Cấu hình logging (queue + thread ghi nền) trước khi import các service
+configure_logging()
+
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from app.routers import auth, workflows, calls, feedback, admin, rl_monitor
+from app.routers import auth, workflows, calls, feedback, admin, rl_monitor, nlp
 from app.routers import rag as rag_router
 from app.dependencies import get_settings
+from app.services import nlp_service, readiness
+from app.services.write_behind import log_writer
+from app.services.call_analytics import call_analytics
+from app.services.reports import report_aggregator
+from app.services.feedback_journal import feedback_journal
+from app.db import bind_loop, close_db, db_stats
+from app.utils.metrics import render_prometheus
+from app.services.rag_service import rag_service
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Thành phần nặng được tải ở background sau khi app đã bind port
+_STARTUP_COMPONENTS = {
+    "intent_model": nlp_service.load_intent_model,
+    "sentiment_model": nlp_service.load_sentiment_model,
+    "intent_cascade": nlp_service.load_intent_cascade,
+    "rag_index": rag_service.build_index,
+}
+if nlp_service.NLP_WORKER_PROCESSES > 0:
+    _STARTUP_COMPONENTS["inference_pool"] = nlp_service.start_inference_pool
+
+async def _load_component(name: str, load_fn):
+    try:
+        with readiness.track(name):
+            await asyncio.to_thread(load_fn)
+    except Exception as e:
+        # Thành phần không bắt buộc lỗi -> service chạy fallback, /health/ready báo chi tiết
+        logger.error(f"Khong tai duoc {name}: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Truy vấn từ thread nền (write-behind) được gửi về loop này, dùng chung pool kết nối
+    bind_loop(asyncio.get_running_loop())
+    for name in _STARTUP_COMPONENTS:
+        readiness.register(name)
+    loader = asyncio.create_task(asyncio.gather(
+        *(_load_component(name, fn) for name, fn in _STARTUP_COMPONENTS.items())
+    ))
+    report_aggregator.start()
+    yield
+    loader.cancel()
+    await report_aggregator.stop()
+    nlp_service.stop_inference_pool()
+    # Ghi tổng hợp của các cuộc gọi còn dở (call_intents, call_entities), rồi xả
+    # write-behind (conversation_logs, feedback). Chạy ngoài loop: các buffer gửi
+    # truy vấn về chính loop này qua run_sync
+    await asyncio.to_thread(call_analytics.stop)
+    await asyncio.to_thread(log_writer.stop)
+    await asyncio.to_thread(feedback_journal.stop)
+    await close_db()
+    shutdown_logging()
 
 app = FastAPI(
     title="VoiceAI Backend API",
     description="API cho he thong AI Callbot (Da cap nhat Versioning & AI)",
-    version="1.1.0"
+    version="1.1.0",
+    lifespan=lifespan
 )
 
 # Cấu hình CORS
@@ -33,7 +93,29 @@ app.include_router(feedback.router, prefix="/api/feedback", tags=["Feedback"])
 app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
 app.include_router(rl_monitor.router, prefix="/api/rl-monitor", tags=["RL Monitoring"])
 app.include_router(rag_router.router, prefix="/api/rag", tags=["RAG"])
+app.include_router(nlp.router, prefix="/api/nlp", tags=["NLP"])
 
 @app.get("/", tags=["Health"])
 async def root():
-    return {"status": "ok", "message": "Welcome to VoiceAI API"}
\ No newline at end of file
+    return {"status": "ok", "message": "Welcome to VoiceAI API"}
+
+@app.get("/health/live", tags=["Health"])
+async def health_live():
+    """Tiến trình còn sống (không phụ thuộc model đã tải xong hay chưa)"""
+    return {"status": "ok"}
+
+@app.get("/health/ready", tags=["Health"])
+async def health_ready():
+    """200 khi mọi thành phần bắt buộc (READINESS_REQUIRED) đã sẵn sàng, ngược lại 503"""
+    status = readiness.get_status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+@app.get("/health/db", tags=["Health"])
+async def health_db():
+    """Backend database, pool kết nối, số truy vấn đang chạy / lỗi / timeout và latency"""
+    return db_stats()
+
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def metrics():
+    """Histogram latency theo stage và các metric nội bộ (Prometheus text format)"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
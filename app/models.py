@@ -59,6 +59,15 @@ class WorkflowWithCurrentVersion(Workflow):
     current_version: Optional[WorkflowVersion] = None
     workflow_json: Optional[dict] = None # JSON của phiên bản hiện tại
 
+# Một trang danh sách (keyset pagination): truyền next_cursor vào ?cursor= để lấy trang sau
+class WorkflowPage(BaseModel):
+    items: List[Workflow]
+    next_cursor: Optional[str] = None
+
+class WorkflowVersionPage(BaseModel):
+    items: List[WorkflowVersion]
+    next_cursor: Optional[str] = None
+
 # Model cho Rollback
 class WorkflowRollback(BaseModel):
     version_id: uuid.UUID
@@ -79,4 +88,14 @@ class WebhookInput(BaseModel):
 
 class WebhookResponse(BaseModel):
     bot_response_text: str
-    action: Optional[str] = None # vd: "hangup", "transfer"
\ No newline at end of file
+    action: Optional[str] = None # vd: "hangup", "transfer"
+    timings: Optional[dict] = None # chỉ có khi gọi với ?debug=true (ms theo stage)
+
+# --- NLP Batch Models ---
+class NlpBatchRequest(BaseModel):
+    texts: List[str]
+
+class NlpBatchResponse(BaseModel):
+    model: Optional[str] = None  # đường dẫn checkpoint intent đã dùng (None = fallback rules)
+    count: int
+    results: List[dict]
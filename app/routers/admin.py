@@ -1,37 +1,69 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List, Dict
+from fastapi import APIRouter, Depends, HTTPException, Query
+from functools import lru_cache
+from typing import List, Dict, Optional
 from redis import Redis
 from rq import Queue
 from rq.job import Job
 from app.dependencies import get_current_user_id
+from app.db.pagination import (
+    API_PAGE_SIZE_DEFAULT, API_PAGE_SIZE_MAX, InvalidCursor, decode_cursor, encode_cursor
+)
 
 router = APIRouter()
-redis_conn = Redis(host='localhost', port=6379, db=0)
-q = Queue('model_tasks', connection=redis_conn)
+
+
+@lru_cache()
+def get_redis_conn() -> Redis:
+    """Tạo kết nối Redis lần đầu khi cần (không mở lúc import)"""
+    return Redis(host='localhost', port=6379, db=0)
+
+
+@lru_cache()
+def get_queue() -> Queue:
+    return Queue('model_tasks', connection=get_redis_conn())
 
 @router.get("/jobs/status")
-async def get_jobs_status(current_user_id: str = Depends(get_current_user_id)):
+async def get_jobs_status(
+    limit: int = Query(API_PAGE_SIZE_DEFAULT, ge=1, le=API_PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    current_user_id: str = Depends(get_current_user_id)
+):
     """
-    Lấy trạng thái của tất cả các công việc huấn luyện trong hàng đợi
+    Lấy trạng thái các công việc huấn luyện trong hàng đợi, theo thứ tự vào hàng đợi.
+    Chỉ đọc các job của trang hiện tại; trang sau: ?cursor=<next_cursor>.
+    Chi tiết (result, exc_info) xem ở /jobs/{job_id}.
     """
     try:
-        # Lấy danh sách job
-        jobs = q.jobs
+        after_id = decode_cursor(cursor, 1)[0] if cursor else None
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        queue = get_queue()
+        redis_conn = get_redis_conn()
+        start = 0
+        if after_id:
+            # Hàng đợi FIFO: job của cursor đã bị lấy ra thì mọi job trước nó cũng vậy
+            position = redis_conn.lpos(queue.key, after_id)
+            start = position + 1 if position is not None else 0
+        job_ids = queue.get_job_ids(offset=start, length=limit + 1)
+        page_ids = job_ids[:limit]
         
         job_list = []
-        for job in jobs:
+        for job in Job.fetch_many(page_ids, connection=redis_conn):
+            if job is None:  # đã hết hạn giữa hai lệnh
+                continue
             job_info = {
                 "id": job.id,
                 "status": job.get_status(),
                 "created_at": job.created_at.isoformat() if job.created_at else None,
                 "ended_at": job.ended_at.isoformat() if job.ended_at else None,
-                "exc_info": job.exc_info if job.exc_info else None
             }
             job_list.append(job_info)
             
         return {
-            "total_jobs": len(job_list),
-            "jobs": job_list
+            "total_jobs": queue.count,
+            "jobs": job_list,
+            "next_cursor": encode_cursor([page_ids[-1]]) if len(job_ids) > limit else None,
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -42,7 +74,7 @@ async def get_job_status(job_id: str, current_user_id: str = Depends(get_current
     Lấy thông tin chi tiết về một công việc cụ thể
     """
     try:
-        job = Job.fetch(job_id, connection=redis_conn)
+        job = Job.fetch(job_id, connection=get_redis_conn())
         return {
             "id": job.id,
             "status": job.get_status(),
@@ -60,7 +92,7 @@ async def cancel_job(job_id: str, current_user_id: str = Depends(get_current_use
     Hủy một công việc đang chờ trong hàng đợi
     """
     try:
-        job = Job.fetch(job_id, connection=redis_conn)
+        job = Job.fetch(job_id, connection=get_redis_conn())
         
         if job.is_finished:
             raise HTTPException(status_code=400, detail="Công việc đã hoàn thành")
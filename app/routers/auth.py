@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from app.database import supabase
+from app.db import DatabaseError, get_db
 from app.models import Token, UserCreate
 from app.config import settings
 from jose import jwt
@@ -40,14 +40,13 @@ def create_access_token(data: dict, expires_delta: timedelta):
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    response = supabase.table("accounts").select("id, password_hash").eq("email", form_data.username).execute()
+    user = await get_db().select_one("accounts", "id, password_hash", where={"email": form_data.username})
     
-    if not response.data:
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
         )
-    user = response.data[0]
     
     # Kiểm tra mật khẩu
     if not verify_password(form_data.password, user['password_hash']):
@@ -67,8 +66,9 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 async def register_user(user_in: UserCreate):
     try:
         # Kiểm tra email đã tồn tại chưa
-        response = supabase.table("accounts").select("id").eq("email", user_in.email).execute()
-        if response.data:
+        db = get_db()
+        existing = await db.select_one("accounts", "id", where={"email": user_in.email})
+        if existing:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email đã được đăng ký",
@@ -87,17 +87,15 @@ async def register_user(user_in: UserCreate):
         logger.info(f"Creating new user account: {user_in.email}")
         
         # Insert vào database
-        insert_response = supabase.table("accounts").insert(new_user).execute()
-        
-        # Kiểm tra lỗi từ Supabase
-        if hasattr(insert_response, 'error') and insert_response.error:
-            logger.error(f"Supabase error during registration: {insert_response.error}")
-            error_detail = getattr(insert_response.error, 'message', str(insert_response.error))
-            raise HTTPException(status_code=500, detail=f"Lỗi Supabase: {error_detail}")
+        try:
+            inserted = await db.insert("accounts", new_user)
+        except DatabaseError as db_error:
+            logger.error(f"Database error during registration: {db_error}")
+            raise HTTPException(status_code=500, detail=f"Lỗi database: {db_error}")
         
         # Kiểm tra có data trả về không
-        if not insert_response.data:
-            raise HTTPException(status_code=500, detail="Không nhận được dữ liệu từ Supabase sau khi insert")
+        if not inserted:
+            raise HTTPException(status_code=500, detail="Không nhận được dữ liệu từ database sau khi insert")
             
         logger.info(f"Successfully created account: {user_in.email}")
         return {"message": "Tạo tài khoản thành công", "email": user_in.email}
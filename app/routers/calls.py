@@ -1,9 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from app.database import supabase
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, WebSocket, WebSocketDisconnect
+from app.db import InvalidCursor, get_db, paginate
+from app.db.pagination import API_PAGE_SIZE_DEFAULT, API_PAGE_SIZE_MAX
 from app.models import CallStartRequest, CallStartResponse, WebhookInput, WebhookResponse
-from app.services import asterisk_service, nlp_service, dialog_manager
+from app.services import asterisk_service, nlp_service, dialog_manager, call_sessions, workflow_cache
+from app.services.call_analytics import call_analytics
+from app.services.workflow_cache import WorkflowVersionError
+from app.services.streaming_nlp import PartialTranscriptSession
+from app.utils.timing import record, span, start_turn_trace
+from app.utils.logger import debug_sampled
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set, Tuple
+import asyncio
+import logging
+import time
 import uuid
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 @router.post("/start_call", response_model=CallStartResponse)
@@ -20,8 +33,10 @@ async def start_call(
     }
     
     try:
-        db_response = supabase.table("calls").insert(call_record).execute()
+        await get_db().insert("calls", call_record, returning=False)
         
+        # Nạp sẵn context workflow để lượt nói đầu tiên không phải truy vấn
+        background_tasks.add_task(_prefetch_call_context, new_call_id)
         background_tasks.add_task(
             asterisk_service.initiate_callout,
             call_id=new_call_id,
@@ -37,111 +52,301 @@ async def start_call(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi tạo cuộc gọi: {str(e)}")
 
-@router.post("/webhook", response_model=WebhookResponse)
+def _with_timings(response: dict, trace: Optional[Dict[str, float]], started: float) -> dict:
+    """Ghi webhook_total; nếu đang debug thì đính kèm breakdown từng stage"""
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    record("webhook_total", elapsed_ms)
+    if trace is not None:
+        response = {**response, "timings": {**trace, "webhook_total": elapsed_ms}}
+    return response
+
+def _fallback_nlp_data(user_text: str) -> dict:
+    return {
+        "text": user_text,
+        "intent": "unknown",
+        "intent_confidence": 0.0,
+        "sentiment": "neutral",
+        "entities": {}
+    }
+
+async def _load_active_version(call_id: str) -> dict:
+    """Lấy phiên bản workflow đang chạy của cuộc gọi (HTTPException nếu thiếu dữ liệu)"""
+    try:
+        # Chỉ cần workflow_id; version đọc qua workflow_cache (theo current_version_id)
+        call = await get_db().select_one("calls", "workflow_id", where={"id": call_id})
+
+        if call is None:
+            raise HTTPException(
+                status_code=404, 
+                detail=f"Khong tim thay thong tin cuoc goi: {call_id}"
+            )
+
+        workflow_id = call.get('workflow_id')
+        if not workflow_id:
+            raise HTTPException(
+                status_code=404, 
+                detail=f"Khong tim thay workflow cho cuoc goi: {call_id}"
+            )
+
+        active_version = await workflow_cache.get_active_version(workflow_id)
+    except HTTPException as he:
+        raise he
+    except WorkflowVersionError as e:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Khong tim thay workflow_json cho cuoc goi {call_id}: {e}"
+        )
+    except Exception as e:
+        logger.error(f"Loi khi truy van DB: {e}", extra={"call_id": call_id})
+        raise HTTPException(
+            status_code=500,
+            detail="Loi he thong khi truy van thong tin cuoc goi"
+        )
+    return active_version
+
+
+async def _get_call_context(call_id: str) -> dict:
+    """Phiên bản workflow của cuộc gọi, đọc từ session cache; lượt đầu mới truy vấn DB"""
+    active_version = call_sessions.get(call_id)
+    if active_version is None:
+        active_version = await _load_active_version(call_id)
+        call_sessions.put(call_id, active_version)
+    return active_version
+
+
+async def _prefetch_call_context(call_id: str):
+    try:
+        await _get_call_context(call_id)
+    except HTTPException as he:
+        logger.warning(f"Khong nap truoc duoc context: {he.detail}", extra={"call_id": call_id})
+
+
+# Giữ tham chiếu tới task ghi trạng thái kết thúc cho tới khi chạy xong
+_finish_tasks: Set[asyncio.Task] = set()
+
+
+async def _finish_call(call_id: str, status: str, last_intent: Optional[str]) -> bool:
+    """Ghi status / end_time / duration / last_intent khi cuộc gọi kết thúc.
+    Chỉ cập nhật cuộc gọi chưa kết thúc, nên hangup + DELETE session không ghi hai lần
+    (job reports cộng mỗi cuộc gọi đúng một lần theo end_time)."""
+    try:
+        db = get_db()
+        call = await db.select_one("calls", "start_time, created_at", where={"id": call_id})
+        if call is None:
+            return False
+        end_time = datetime.now(timezone.utc)
+        values = {"status": status, "end_time": end_time.isoformat()}
+        started_at = call.get("start_time") or call.get("created_at")
+        if started_at:
+            started = datetime.fromisoformat(str(started_at).replace("Z", "+00:00"))
+            if started.tzinfo is None:
+                started = started.replace(tzinfo=timezone.utc)
+            values["duration"] = round(max(0.0, (end_time - started).total_seconds()), 3)
+        if last_intent:
+            values["last_intent"] = last_intent
+        updated = await db.update(
+            "calls", values, [("id", "eq", call_id), ("status", "in", ["pending", "in_progress"])]
+        )
+        return bool(updated)
+    except Exception as e:
+        logger.error(f"Loi khi ghi ket thuc cuoc goi: {e}", extra={"call_id": call_id})
+        return False
+
+
+def _close_call(call_id: str, status: str = "completed") -> Tuple[bool, bool, Optional[asyncio.Task]]:
+    last_intent = call_analytics.last_intent(call_id)
+    evicted = call_sessions.evict(call_id)
+    flushed = call_analytics.end_call(call_id)
+    task = asyncio.get_running_loop().create_task(_finish_call(call_id, status, last_intent))
+    _finish_tasks.add(task)
+    task.add_done_callback(_finish_tasks.discard)
+    return evicted, flushed, task
+
+
+def _end_call_session(call_id: str, agent_response: dict, status: str = "completed"):
+    if agent_response.get("action") == "hangup":
+        # Ghi calls ở background, không cộng thêm latency vào lượt cuối
+        _close_call(call_id, status)
+
+
+@router.get("/sessions/stats")
+async def get_call_session_stats():
+    """Session cache: số cuộc gọi đang giữ context, ước lượng byte, hit rate"""
+    return call_sessions.stats()
+
+
+@router.delete("/{call_id}/session")
+async def end_call_session(call_id: str):
+    """Voice gateway báo cuộc gọi đã kết thúc: bỏ context khỏi session cache,
+    ghi call_intents / call_entities đã tổng hợp và trạng thái kết thúc vào calls"""
+    evicted, flushed, finish = _close_call(call_id)
+    return {
+        "call_id": call_id,
+        "evicted": evicted,
+        "analytics_flushed": flushed,
+        "finished": await finish,
+    }
+
+
+@router.get("/{call_id}/analytics")
+async def get_call_analytics(call_id: str):
+    """Intent (số lần, confidence trung bình) và entity của một cuộc gọi đã kết thúc"""
+    db = get_db()
+    intents, entities = await asyncio.gather(
+        db.select("call_intents", "intent_name, count, accuracy", where={"call_id": call_id}),
+        db.select("call_entities", "entity_name, value", where={"call_id": call_id}),
+    )
+    return {"call_id": call_id, "intents": intents, "entities": entities}
+
+
+@router.get("/{call_id}/transcript")
+async def get_call_transcript(
+    call_id: str,
+    limit: int = Query(API_PAGE_SIZE_DEFAULT, ge=1, le=API_PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+):
+    """Các lượt hội thoại của cuộc gọi theo thứ tự thời gian, từng trang (?cursor=<next_cursor>)"""
+    try:
+        page = await paginate(
+            get_db(), "conversation_logs", "id, speaker, text, intent, confidence, sentiment, created_at",
+            where={"call_id": call_id}, limit=limit, cursor=cursor, desc=False,
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"call_id": call_id, **page}
+
+
+@router.post("/webhook", response_model=WebhookResponse, response_model_exclude_unset=True)
 async def handle_voice_webhook(
     request: WebhookInput,
-    background_tasks: BackgroundTasks
+    debug: bool = False
 ):
+    """debug=true: đính kèm breakdown thời gian (ms) từng stage của lượt này vào response"""
+    trace = start_turn_trace() if debug else None
+    webhook_started = time.perf_counter()
     try:
         call_id = request.call_id
         user_text = request.speech_to_text
         
-        print(f"[Webhook] Nhan input tu call {call_id}: {user_text}")
+        verbose = logger.isEnabledFor(logging.DEBUG) and debug_sampled(call_id)
+        if verbose:
+            logger.debug(f"Nhan input: {user_text}", extra={"call_id": call_id})
         
         # 1. Lấy thông tin cuộc gọi VÀ workflow VÀ phiên bản active
-        try:
-            # Fix: Chỉ định rõ CẢNH 2 relationships để tránh "more than one relationship" error
-            call_res = supabase.table("calls").select(
-                "*, workflows!calls_workflow_id_fkey(*, workflow_versions!workflow_versions_workflow_id_fkey(*))"
-            ).eq("id", call_id).single().execute()
-            
-            if not call_res.data:
-                raise HTTPException(
-                    status_code=404, 
-                    detail=f"Khong tim thay thong tin cuoc goi: {call_id}"
-                )
-            
-            call_data = call_res.data
-            workflow_data = call_data.get('workflows')
-            if not workflow_data:
-                raise HTTPException(
-                    status_code=404, 
-                    detail=f"Khong tim thay workflow cho cuoc goi: {call_id}"
-                )
-                
-            # workflow_versions trả về array, lấy phần tử đầu tiên
-            versions = workflow_data.get('workflow_versions', [])
-            if not versions or not isinstance(versions, list) or len(versions) == 0:
-                raise HTTPException(
-                    status_code=404, 
-                    detail=f"Khong tim thay workflow_versions cho cuoc goi: {call_id}"
-                )
-            
-            active_version = versions[0]  # Lấy version đầu tiên (newest)
-            if not active_version.get('workflow_json'):
-                raise HTTPException(
-                    status_code=404, 
-                    detail=f"Khong tim thay workflow_json cho cuoc goi: {call_id}"
-                )
-        except HTTPException as he:
-            raise he
-        except Exception as e:
-            print(f"[Webhook] Loi khi truy van DB: {str(e)}")
-            raise HTTPException(
-                status_code=500,
-                detail="Loi he thong khi truy van thong tin cuoc goi"
-            )
+        with span("call_lookup"):
+            active_version = await _get_call_context(call_id)
 
         # 2. Xử lý NLP (async wrapper để không block event loop)
         try:
-            nlp_data = await nlp_service.process_nlp_tasks_async(user_text, call_id=call_id)
-            print(f"[Webhook] Ket qua NLP: {nlp_data}")
+            with span("nlp_total"):
+                nlp_data = await nlp_service.process_nlp_tasks_async(user_text, call_id=call_id)
+            if verbose:
+                logger.debug(f"Ket qua NLP: {nlp_data}", extra={"call_id": call_id})
         except Exception as e:
-            print(f"[Webhook] Loi khi xu ly NLP: {str(e)}")
-            nlp_data = {
-                "text": user_text,
-                "intent": "unknown",
-                "intent_confidence": 0.0,
-                "sentiment": "neutral",
-                "entities": {}
-            }
+            logger.error(f"Loi khi xu ly NLP: {e}", extra={"call_id": call_id})
+            nlp_data = _fallback_nlp_data(user_text)
         
-        # 3. Gọi Agent để lấy phản hồi
+        # 3. Gọi Agent để lấy phản hồi (dialog_manager cũng lưu log của bot)
         try:
-            agent_response = await dialog_manager.get_bot_response(
-                call_id=call_id,
-                workflow_json=active_version.get('workflow_json'),
-                nlp_data=nlp_data
-            )
+            with span("agent_total"):
+                agent_response = await dialog_manager.get_bot_response(
+                    call_id=call_id,
+                    workflow_json=active_version.get('workflow_json'),
+                    nlp_data=nlp_data
+                )
         except Exception as e:
-            print(f"[Webhook] Loi khi goi Agent: {str(e)}")
-            return {
+            logger.error(f"Loi khi goi Agent: {e}", extra={"call_id": call_id})
+            agent_response = {
                 "bot_response_text": "Xin loi, he thong dang gap su co. Vui long thu lai sau.",
                 "action": "hangup"
             }
+            _end_call_session(call_id, agent_response, status="failed")
+            return _with_timings(agent_response, trace, webhook_started)
         
-        # 4. Lưu log hội thoại (bot) — user log đã được lưu bởi nlp_service nếu call_id có truyền
-        try:
-            background_tasks.add_task(
-                supabase.table("conversation_logs").insert,
-                {
-                    "call_id": call_id,
-                    "speaker": "bot",
-                    "text": agent_response.get("bot_response_text")
-                }
-            )
-        except Exception as e:
-            print(f"[Webhook] Loi khi luu log: {str(e)}")
-            # Không raise exception vì đây là background task
-        
-        # 5. Trả về phản hồi cho Voice Gateway
-        return agent_response
+        # 4. Trả về phản hồi cho Voice Gateway
+        _end_call_session(call_id, agent_response)
+        return _with_timings(agent_response, trace, webhook_started)
         
     except HTTPException as he:
         raise he
     except Exception as e:
-        print(f"[Webhook] Loi khong mong muon: {str(e)}")
+        logger.exception(f"Loi khong mong muon: {e}")
         return {
             "bot_response_text": "Xin loi, he thong dang gap su co. Vui long thu lai sau.",
             "action": "hangup"
-        }
\ No newline at end of file
+        }
+
+@router.websocket("/{call_id}/stream")
+async def stream_voice_turns(websocket: WebSocket, call_id: str):
+    """
+    Streaming partial transcript cho một cuộc gọi (WebSocket).
+
+    Client gửi {"type": "partial", "text": ...} cho mỗi hypothesis ASR và
+    {"type": "final", "text": ...} khi user nói xong. Server trả "partial_result"
+    cho mỗi partial, "commit" ngay khi intent đã ổn định, và "final" (kết quả NLP
+    đầy đủ + đối chiếu với intent đã commit + phản hồi của Agent) cho mỗi lượt.
+    """
+    await websocket.accept()
+    logger.info("Mo stream", extra={"call_id": call_id})
+    # Tra cứu call/workflow ngay khi mở stream, song song với lúc user còn đang nói
+    context_task = asyncio.create_task(_get_call_context(call_id))
+    session = PartialTranscriptSession(call_id)
+    commit_sent = False
+
+    try:
+        while True:
+            message = await websocket.receive_json()
+            kind = message.get("type")
+            text = (message.get("text") or "").strip()
+
+            if kind == "partial":
+                if not text:
+                    continue
+                partial = await session.update(text)
+                await websocket.send_json(partial)
+                if session.committed is not None and not commit_sent:
+                    commit_sent = True
+                    await websocket.send_json({"type": "commit", **session.committed})
+
+            elif kind == "final":
+                try:
+                    active_version = await context_task
+                except HTTPException as he:
+                    await websocket.send_json({"type": "error", "status_code": he.status_code, "detail": he.detail})
+                    await websocket.close(code=1011)
+                    return
+
+                try:
+                    final = await session.finalize(text)
+                except Exception as e:
+                    logger.error(f"Loi khi xu ly NLP (stream): {e}", extra={"call_id": call_id})
+                    final = {"nlp_data": _fallback_nlp_data(text), "speculative": session.committed, "reconciliation": None}
+
+                call_status = "completed"
+                try:
+                    agent_response = await dialog_manager.get_bot_response(
+                        call_id=call_id,
+                        workflow_json=active_version.get('workflow_json'),
+                        nlp_data=final["nlp_data"]
+                    )
+                except Exception as e:
+                    logger.error(f"Loi khi goi Agent (stream): {e}", extra={"call_id": call_id})
+                    agent_response = {
+                        "bot_response_text": "Xin loi, he thong dang gap su co. Vui long thu lai sau.",
+                        "action": "hangup"
+                    }
+                    call_status = "failed"
+
+                await websocket.send_json({"type": "final", **final, **agent_response})
+                _end_call_session(call_id, agent_response, status=call_status)
+                # Lượt nói tiếp theo bắt đầu phiên suy đoán mới, context cuộc gọi dùng lại
+                session = PartialTranscriptSession(call_id)
+                commit_sent = False
+
+            else:
+                await websocket.send_json({"type": "error", "detail": f"Unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        logger.info("Dong stream", extra={"call_id": call_id})
+    finally:
+        if not context_task.done():
+            context_task.cancel()
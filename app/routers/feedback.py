@@ -1,19 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel
-from app.database import supabase
+from typing import Optional
+from app.db import InvalidCursor, get_db, paginate
+from app.db.pagination import API_PAGE_SIZE_DEFAULT, API_PAGE_SIZE_MAX
 from app.dependencies import get_current_user_id
-from pathlib import Path
-import csv
 import subprocess
 import os
+import logging
 from fastapi import BackgroundTasks
 from app.services import nlp_service
 from app.services.rl_threshold_tuner import get_tuner
+from app.services.feedback_journal import FEEDBACK_JOURNAL_DIR, feedback_journal
 
 router = APIRouter()
-
-FEEDBACK_CSV = Path('data/feedback.csv')
-FEEDBACK_CSV.parent.mkdir(parents=True, exist_ok=True)
+logger = logging.getLogger(__name__)
 
 class FeedbackIn(BaseModel):
     session_id: str
@@ -35,16 +35,48 @@ async def submit_feedback(feedback: FeedbackIn, current_user_id: str = Depends(g
     fb = feedback.dict()
     fb['user_id'] = current_user_id
     try:
-        res = supabase.table('feedback').insert(fb).execute()
+        await get_db().insert('feedback', fb, returning=False)
+        saved = True
     except Exception:
-        res = None
-
-    # Always append to local CSV as backup
-    with FEEDBACK_CSV.open('a', encoding='utf-8', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow([feedback.session_id, feedback.text, feedback.label or '', str(feedback.corrected)])
-
-    return {'ok': True, 'saved_to_supabase': (res is not None and not getattr(res,'error',None))}
+        saved = False
+
+    # Bản sao cục bộ cho pipeline retrain: journal ghi bằng thread nền, handler không chạm file
+    journaled = feedback_journal.append({
+        'session_id': feedback.session_id,
+        'text': feedback.text,
+        'label': feedback.label,
+        'corrected': feedback.corrected,
+        'user_id': current_user_id,
+    })
+
+    return {'ok': True, 'saved_to_supabase': saved, 'journaled': journaled}
+
+
+@router.get('/journal/stats')
+async def get_feedback_journal_stats(current_user_id: str = Depends(get_current_user_id)):
+    """Feedback journal: hàng đợi, số segment (đã niêm phong / đã nén), fsync"""
+    return feedback_journal.stats()
+
+
+@router.get('/')
+async def list_feedback(
+    reviewed: Optional[bool] = None,
+    limit: int = Query(API_PAGE_SIZE_DEFAULT, ge=1, le=API_PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    current_user_id: str = Depends(get_current_user_id)
+):
+    """Feedback mới nhất trước (lọc theo reviewed nếu có), từng trang qua ?cursor=<next_cursor>"""
+    where = {'reviewed': reviewed} if reviewed is not None else None
+    try:
+        return await paginate(
+            get_db(), 'feedback',
+            'id, call_id, text, intent, confidence, corrected, approved, reviewed, created_at',
+            where=where, limit=limit, cursor=cursor,
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Lỗi lấy feedback: {str(e)}')
 
 
 @router.post('/retrain')
@@ -55,7 +87,7 @@ async def trigger_retrain(current_user_id: str = Depends(get_current_user_id)):
     try:
         # Đưa công việc vào hàng đợi
         job_id = enqueue_retrain_job(
-            feedback_data_path=str(FEEDBACK_CSV),
+            feedback_data_path=str(FEEDBACK_JOURNAL_DIR),
             base_model_path="models/phobert-intent-classifier"
         )
         
@@ -69,11 +101,15 @@ async def trigger_retrain(current_user_id: str = Depends(get_current_user_id)):
 
 @router.post('/reload')
 async def reload_model_endpoint(current_user_id: str = Depends(get_current_user_id)):
-    """Trigger the running process to reload the intent model from disk."""
-    ok = nlp_service.reload_intent_model()
+    """Trigger the running process to reload the intent model from disk.
+
+    Model mới được tải và warm-up ở background rồi mới thay thế model đang chạy;
+    theo dõi tiến trình qua /api/nlp/stats (model.reload_in_progress, model.version).
+    """
+    ok = nlp_service.reload_intent_model(background=True)
     if not ok:
-        raise HTTPException(status_code=500, detail='Failed to reload model')
-    return {'ok': True, 'message': 'model reloaded in memory'}
+        raise HTTPException(status_code=409, detail='A model reload is already in progress')
+    return {'ok': True, 'message': 'model reload started in background'}
 
 
 @router.post('/rl-reward', status_code=status.HTTP_200_OK)
@@ -103,9 +139,9 @@ async def submit_rl_reward(feedback: RewardFeedback):
         }
         
         try:
-            supabase.table('rl_feedback').insert(log_data).execute()
+            await get_db().insert('rl_feedback', log_data, returning=False)
         except Exception as db_err:
-            print(f"[Feedback] Failed to log to DB: {db_err}")
+            logger.warning(f"Failed to log RL feedback to DB: {db_err}")
         
         return {
             'ok': True,
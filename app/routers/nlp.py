@@ -0,0 +1,55 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Dict, Any
+
+from app.dependencies import get_current_user_id
+from app.models import NlpBatchRequest, NlpBatchResponse
+from app.services import nlp_service
+from app.services.streaming_nlp import get_streaming_stats
+from app.utils.logger import get_logging_stats
+
+router = APIRouter()
+
+NLP_BATCH_API_MAX_TEXTS = int(os.getenv("NLP_BATCH_API_MAX_TEXTS", "256"))
+
+
+@router.get("/stats")
+async def get_nlp_stats() -> Dict[str, Any]:
+    """
+    Thống kê inference engine: cấu hình micro-batching,
+    histogram batch size và thời gian chờ trong hàng đợi
+    """
+    try:
+        stats = nlp_service.get_inference_stats()
+        stats["streaming"] = get_streaming_stats()
+        stats["logging"] = get_logging_stats()
+        return stats
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting NLP stats: {str(e)}")
+
+
+@router.post("/rules/reload")
+async def reload_intent_rules(current_user_id: str = Depends(get_current_user_id)) -> Dict[str, Any]:
+    """Nạp lại bảng luật fallback intent (data/intent_rules.csv) không cần restart"""
+    try:
+        return nlp_service.reload_intent_rules()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error reloading intent rules: {str(e)}")
+
+
+@router.post("/batch", response_model=NlpBatchResponse)
+async def analyze_batch(
+    payload: NlpBatchRequest,
+    current_user_id: str = Depends(get_current_user_id)
+):
+    """
+    Intent + sentiment + entity cho nhiều utterance trong một request.
+    Không ghi conversation_logs và không cập nhật RL tuner (dùng để chấm lại dữ liệu).
+    """
+    if len(payload.texts) > NLP_BATCH_API_MAX_TEXTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many texts: {len(payload.texts)} > {NLP_BATCH_API_MAX_TEXTS}"
+        )
+    results = await nlp_service.analyze_texts_async(payload.texts)
+    return NlpBatchResponse(model=nlp_service.get_scoring_model(), count=len(results), results=results)
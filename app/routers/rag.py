@@ -14,16 +14,6 @@ class IngestPayload(BaseModel):
     source: Optional[str] = None
 
 
-@router.on_event("startup")
-async def _build_index_on_startup():
-    # Build index lazily on first request as well, but try early here
-    try:
-        rag_service.build_index()
-    except Exception:
-        # Avoid blocking startup if corpus is empty or missing
-        pass
-
-
 @router.get("/search", summary="RAG search", tags=["RAG"])
 async def rag_search(q: str = Query(..., description="User query"), k: int = 3):
     """
@@ -1,17 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from app.database import supabase
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from app.db import InvalidCursor, get_db, paginate
+from app.db.pagination import API_PAGE_SIZE_DEFAULT, API_PAGE_SIZE_MAX
 from app.models import (
     Workflow, WorkflowCreate, WorkflowWithCurrentVersion, 
-    WorkflowVersionCreate, WorkflowVersion, WorkflowRollback
+    WorkflowVersionCreate, WorkflowVersion, WorkflowRollback,
+    WorkflowPage, WorkflowVersionPage
 )
 from app.dependencies import get_current_user_id
+from app.services import workflow_cache
+from app.services.reports import get_report, report_aggregator
+from app.services.workflow_cache import WorkflowVersionError
 import uuid
 import logging
-from typing import List
+from typing import Optional
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Cột trả về trong danh sách (không kéo workflow_json)
+WORKFLOW_LIST_COLUMNS = "id, user_id, name, description, current_version_id, created_at"
+VERSION_LIST_COLUMNS = "id, workflow_id, user_id, change_description, created_at"
+
 @router.post("/", response_model=Workflow, status_code=status.HTTP_201_CREATED)
 async def create_workflow(
     workflow: WorkflowCreate,
@@ -20,38 +29,59 @@ async def create_workflow(
     workflow_dict = workflow.dict()
     workflow_dict['user_id'] = current_user_id
     try:
-        response = supabase.table("workflows").insert(workflow_dict).execute()
-        return response.data[0]
+        rows = await get_db().insert("workflows", workflow_dict)
+        return rows[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi tạo workflow: {str(e)}")
 
-@router.get("/", response_model=List[Workflow])
+@router.get("/", response_model=WorkflowPage)
 async def get_user_workflows(
+    limit: int = Query(API_PAGE_SIZE_DEFAULT, ge=1, le=API_PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
     current_user_id: str = Depends(get_current_user_id)
 ):
+    """Workflow của user, mới nhất trước; trang sau: ?cursor=<next_cursor>"""
     try:
-        response = supabase.table("workflows").select("*").eq("user_id", current_user_id).execute()
-        return response.data
+        return await paginate(
+            get_db(), "workflows", WORKFLOW_LIST_COLUMNS,
+            where={"user_id": current_user_id}, limit=limit, cursor=cursor,
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi lấy workflows: {str(e)}")
 
+@router.get("/cache/stats")
+async def get_workflow_cache_stats():
+    """Cache workflow version (byte đang giữ, hit rate) và con trỏ current_version_id"""
+    return workflow_cache.stats()
+
+@router.get("/reports/stats")
+async def get_report_job_stats():
+    """Job cập nhật reports: lần chạy gần nhất, watermark, số cuộc gọi đã cộng"""
+    return report_aggregator.stats()
+
 @router.get("/{workflow_id}", response_model=WorkflowWithCurrentVersion)
 async def get_workflow_with_current_version(
     workflow_id: uuid.UUID,
     current_user_id: str = Depends(get_current_user_id)
 ):
     try:
-        wf_res = supabase.table("workflows").select("*").eq("id", workflow_id).eq("user_id", current_user_id).single().execute()
-        if not wf_res.data:
+        workflow_data = await get_db().select_one(
+            "workflows", where={"id": str(workflow_id), "user_id": current_user_id}
+        )
+        if not workflow_data:
             raise HTTPException(status_code=404, detail="Workflow not found")
         
-        workflow_data = wf_res.data
-        
         if workflow_data.get("current_version_id"):
-            ver_res = supabase.table("workflow_versions").select("*").eq("id", workflow_data["current_version_id"]).single().execute()
-            if ver_res.data:
-                workflow_data["workflow_json"] = ver_res.data.get("workflow_json")
-                workflow_data["current_version"] = ver_res.data
+            # Version bất biến -> thường đã có sẵn trong cache, không cần query thứ hai
+            try:
+                version = await workflow_cache.get_version(workflow_data["current_version_id"])
+            except WorkflowVersionError:
+                version = None
+            if version:
+                workflow_data["workflow_json"] = version.get("workflow_json")
+                workflow_data["current_version"] = version
                 
         return workflow_data
     except HTTPException:
@@ -76,23 +106,26 @@ async def create_new_workflow_version(
             "change_description": version_data.change_description
         }
         logger.debug(f"Creating new workflow version for workflow_id={workflow_id}")
-        ver_res = supabase.table("workflow_versions").insert(new_version_dict).execute()
-        logger.debug(f"Supabase version insert response received")
+        db = get_db()
+        inserted = await db.insert("workflow_versions", new_version_dict)
+        logger.debug(f"Version insert response received")
         
-        if not ver_res.data:
+        if not inserted:
             raise HTTPException(status_code=500, detail="Không thể tạo version")
             
-        new_version = ver_res.data[0]
+        new_version = inserted[0]
         new_version_id = new_version["id"]
         
-        update_res = supabase.table("workflows").update({
-            "current_version_id": new_version_id
-        }).eq("id", workflow_id).execute()
+        updated = await db.update(
+            "workflows", {"current_version_id": new_version_id}, {"id": str(workflow_id)}
+        )
         
-        if not update_res.data:
-            supabase.table("workflow_versions").delete().eq("id", new_version_id).execute()
+        if not updated:
+            await db.delete("workflow_versions", {"id": new_version_id})
             raise HTTPException(status_code=500, detail="Không thể cập nhật workflow pointer")
 
+        workflow_cache.put_version(new_version)
+        workflow_cache.set_current_version(workflow_id, new_version_id)
         return new_version
     except HTTPException:
         raise
@@ -100,18 +133,21 @@ async def create_new_workflow_version(
         logger.exception(f"Error creating workflow version: {type(e).__name__}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Lỗi tạo version: {str(e)}")
 
-@router.get("/{workflow_id}/versions", response_model=List[WorkflowVersion])
+@router.get("/{workflow_id}/versions", response_model=WorkflowVersionPage)
 async def get_workflow_version_history(
     workflow_id: uuid.UUID,
+    limit: int = Query(API_PAGE_SIZE_DEFAULT, ge=1, le=API_PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
     current_user_id: str = Depends(get_current_user_id)
 ):
+    """Lịch sử phiên bản, mới nhất trước (không kèm workflow_json)"""
     try:
-        response = supabase.table("workflow_versions") \
-            .select("id, workflow_id, user_id, change_description, created_at") \
-            .eq("workflow_id", workflow_id) \
-            .order("created_at", desc=True) \
-            .execute()
-        return response.data
+        return await paginate(
+            get_db(), "workflow_versions", VERSION_LIST_COLUMNS,
+            where={"workflow_id": str(workflow_id)}, limit=limit, cursor=cursor,
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi lấy versions: {str(e)}")
 
@@ -124,19 +160,69 @@ async def rollback_to_version(
     try:
         version_id_to_rollback = str(rollback_data.version_id)
         
-        ver_res = supabase.table("workflow_versions").select("id").eq("id", version_id_to_rollback).eq("workflow_id", workflow_id).single().execute()
-        if not ver_res.data:
+        db = get_db()
+        version = await db.select_one(
+            "workflow_versions", "id", where={"id": version_id_to_rollback, "workflow_id": str(workflow_id)}
+        )
+        if not version:
             raise HTTPException(status_code=404, detail="Version not found or does not belong to this workflow")
 
-        update_res = supabase.table("workflows").update({
-            "current_version_id": version_id_to_rollback
-        }).eq("id", workflow_id).eq("user_id", current_user_id).execute()
+        updated = await db.update(
+            "workflows",
+            {"current_version_id": version_id_to_rollback},
+            {"id": str(workflow_id), "user_id": current_user_id},
+        )
         
-        if not update_res.data:
+        if not updated:
             raise HTTPException(status_code=500, detail="Không thể rollback")
             
-        return update_res.data[0]
+        workflow_cache.set_current_version(workflow_id, version_id_to_rollback)
+        return updated[0]
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi rollback: {str(e)}")
+
+
+async def _require_owned_workflow(workflow_id: uuid.UUID, current_user_id: str):
+    workflow = await get_db().select_one(
+        "workflows", "id", where={"id": str(workflow_id), "user_id": current_user_id}
+    )
+    if not workflow:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+
+
+@router.get("/{workflow_id}/report")
+async def get_workflow_report(
+    workflow_id: uuid.UUID,
+    days: int = Query(0, ge=0, le=366),
+    current_user_id: str = Depends(get_current_user_id)
+):
+    """
+    KPI đã tổng hợp sẵn của workflow (total_calls, success_rate, avg_duration,
+    positive_intent_rate); days > 0 thêm từng ngày gần nhất
+    """
+    try:
+        await _require_owned_workflow(workflow_id, current_user_id)
+        return await get_report(str(workflow_id), days)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi lấy báo cáo: {str(e)}")
+
+@router.post("/{workflow_id}/report/rebuild")
+async def rebuild_workflow_report(
+    workflow_id: uuid.UUID,
+    current_user_id: str = Depends(get_current_user_id)
+):
+    """Tính lại báo cáo của workflow từ bảng calls (sửa sai lệch của tổng cộng dồn)"""
+    try:
+        await _require_owned_workflow(workflow_id, current_user_id)
+        result = await report_aggregator.rebuild(str(workflow_id))
+        if result.get("skipped"):
+            raise HTTPException(status_code=409, detail="Job reports đang chạy ở process khác, thử lại sau")
+        return {"workflow_id": str(workflow_id), **result}
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Lỗi rollback: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Lỗi tính lại báo cáo: {str(e)}")
@@ -4,7 +4,6 @@ from typing import Optional
 import logging
 
 # Cấu hình logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Cấu hình Asterisk AMI từ environment variables
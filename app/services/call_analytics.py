@@ -0,0 +1,339 @@
+"""
+Tổng hợp call_intents / call_entities theo cuộc gọi.
+Trong lúc gọi, mỗi lượt user chỉ cộng dồn intent (số lần + tổng confidence) và
+entity (giá trị khác nhau) vào bộ nhớ. Khi cuộc gọi kết thúc (hangup), không có
+lượt mới sau CALL_ANALYTICS_IDLE_SECONDS, hoặc worker khác đã ghi kết thúc vào
+bảng calls, phần tổng hợp được đưa vào write-behind buffer riêng.
+
+Mỗi lần ghi là một delta: call_intents upsert theo (call_id, intent_name) và cộng
+dồn count / accuracy vào dòng đã có, call_entities upsert theo
+(call_id, entity_name, value). Cuộc gọi bị flush vì idle rồi có lượt mới (hoặc
+các lượt rơi vào nhiều worker) vì vậy không sinh dòng trùng.
+"""
+
+import asyncio
+import os
+import threading
+import time
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app import db
+from app.services.write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+CALL_ANALYTICS_ENABLED = os.getenv("CALL_ANALYTICS_ENABLED", "true").lower() == "true"
+CALL_ANALYTICS_IDLE_SECONDS = float(os.getenv("CALL_ANALYTICS_IDLE_SECONDS", "900"))
+CALL_ANALYTICS_SWEEP_SECONDS = 30.0
+
+INTENT_CONFLICT = "call_id,intent_name"
+ENTITY_CONFLICT = "call_id,entity_name,value"
+# Trạng thái calls còn đang gọi (giống điều kiện của _finish_call)
+_OPEN_CALL_STATUSES = ("pending", "in_progress")
+# Số call_id mỗi truy vấn "in" (giữ URL PostgREST ngắn)
+_ID_CHUNK_SIZE = 200
+
+# format_entities: tên entity -> khóa giá trị trong từng phần tử *_details
+_ENTITY_VALUE_KEYS = {"time": "formatted", "date": "date", "phone": "value", "email": "value"}
+
+
+def entity_pairs(entities: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+    """(entity_name, value) từ output của format_entities, gồm mọi giá trị chi tiết"""
+    for name, value_key in _ENTITY_VALUE_KEYS.items():
+        details = entities.get(f"{name}_details")
+        if details:
+            for detail in details:
+                value = detail.get(value_key)
+                if value is not None:
+                    yield name, str(value)
+        elif entities.get(name) is not None:
+            yield name, str(entities[name])
+
+
+class CallAggregate:
+    """Intent và entity đã thấy trong một cuộc gọi"""
+
+    __slots__ = ("intents", "entities", "last_intent", "last_seen")
+
+    def __init__(self):
+        self.intents: Dict[str, List[float]] = {}  # intent -> [count, tổng confidence]
+        self.entities: Dict[Tuple[str, str], None] = {}  # giữ thứ tự, bỏ trùng
+        self.last_intent: Optional[str] = None
+        self.last_seen = time.monotonic()
+
+    def add(self, intent: Optional[str], confidence: Optional[float], entities: Optional[Dict[str, Any]]):
+        if intent:
+            counts = self.intents.setdefault(intent, [0, 0.0])
+            counts[0] += 1
+            counts[1] += float(confidence or 0.0)
+            self.last_intent = intent
+        if entities:
+            for pair in entity_pairs(entities):
+                self.entities.setdefault(pair, None)
+        self.last_seen = time.monotonic()
+
+    def intent_rows(self, call_id: str) -> List[Dict[str, Any]]:
+        # accuracy = confidence trung bình của intent trong cuộc gọi
+        return [
+            {
+                "call_id": call_id,
+                "intent_name": intent,
+                "count": int(count),
+                "accuracy": round(total / count, 4) if count else None,
+            }
+            for intent, (count, total) in self.intents.items()
+        ]
+
+    def entity_rows(self, call_id: str) -> List[Dict[str, Any]]:
+        return [
+            {"call_id": call_id, "entity_name": name, "value": value}
+            for name, value in self.entities
+        ]
+
+
+def _intent_key(row: Dict[str, Any]) -> Tuple[str, str]:
+    return str(row["call_id"]), row["intent_name"]
+
+
+def merge_intent_rows(
+    existing: Iterable[Dict[str, Any]], delta: Iterable[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Cộng delta vào các dòng call_intents đã có; accuracy là trung bình có trọng số theo count.
+
+    Trả về các dòng cần upsert (mỗi (call_id, intent_name) một dòng, chỉ các khóa có trong delta).
+    """
+    totals: Dict[Tuple[str, str], List[float]] = {}  # khóa -> [count, tổng confidence]
+    for row in delta:
+        count = int(row.get("count") or 0)
+        counts = totals.setdefault(_intent_key(row), [0, 0.0])
+        counts[0] += count
+        counts[1] += float(row.get("accuracy") or 0.0) * count
+    for row in existing:
+        counts = totals.get(_intent_key(row))
+        if counts is not None:
+            count = int(row.get("count") or 0)
+            counts[0] += count
+            counts[1] += float(row.get("accuracy") or 0.0) * count
+    return [
+        {
+            "call_id": call_id,
+            "intent_name": intent,
+            "count": int(count),
+            "accuracy": round(total / count, 4) if count else None,
+        }
+        for (call_id, intent), (count, total) in totals.items()
+    ]
+
+
+def _entity_key(row: Dict[str, Any]) -> Tuple[str, str, str]:
+    # NULL và '' là cùng một giá trị: unique index không coi hai NULL là trùng
+    value = row.get("value")
+    return str(row["call_id"]), row["entity_name"], "" if value is None else str(value)
+
+
+def _chunks(items: List[Any], size: int = _ID_CHUNK_SIZE) -> Iterator[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def merge_call_rows(database: "db.AsyncDatabase", table: str, rows: List[Dict[str, Any]]):
+    """Ghi một batch delta: call_intents cộng dồn vào dòng cũ, call_entities bỏ trùng"""
+    if table == "call_intents":
+        call_ids = list(dict.fromkeys(str(row["call_id"]) for row in rows))
+        existing: List[Dict[str, Any]] = []
+        for chunk in _chunks(call_ids):
+            existing.extend(await database.select(
+                "call_intents", "call_id, intent_name, count, accuracy", where=[("call_id", "in", chunk)]
+            ))
+        await database.upsert("call_intents", merge_intent_rows(existing, rows), on_conflict=INTENT_CONFLICT)
+    elif table == "call_entities":
+        unique = {}
+        for row in rows:
+            key = _entity_key(row)
+            unique[key] = {**row, "value": key[2]}
+        await database.upsert("call_entities", list(unique.values()), on_conflict=ENTITY_CONFLICT)
+    else:
+        raise ValueError(f"Bảng call analytics không hỗ trợ: {table}")
+
+
+def write_call_rows(table: str, rows: List[Dict[str, Any]]):
+    """insert_fn của call_rows_writer: đọc-cộng-upsert qua lớp app.db, raise nếu lỗi.
+
+    Đọc rồi upsert không nguyên tử: hai worker cùng flush một cuộc gọi đúng cùng lúc
+    có thể mất một delta, nhưng không bao giờ sinh dòng trùng.
+    """
+    if db.is_bound():
+        db.run_sync(
+            lambda database: merge_call_rows(database, table, rows),
+            timeout=2 * db.DB_QUERY_TIMEOUT_SECONDS + 1,
+        )
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        # Ngay trên thread của loop (writer tắt / đã stop): chạy như task, lỗi được log
+        task = loop.create_task(merge_call_rows(db.get_db(), table, rows))
+        task.add_done_callback(_on_merge_done)
+        _merge_tasks.add(task)
+        return
+    if db.DB_BACKEND == "postgrest":
+        # AsyncClient gắn với loop của app, không dùng lại được trong loop tạm
+        raise db.DatabaseError("Không có event loop của app để ghi call analytics")
+    asyncio.run(merge_call_rows(db.get_db(), table, rows))
+
+
+_merge_tasks: set = set()
+
+
+def _on_merge_done(task: "asyncio.Task"):
+    _merge_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Lỗi khi ghi call analytics: {task.exception()}")
+
+
+# Buffer riêng: log_writer chỉ insert, còn call analytics cần upsert cộng dồn
+call_rows_writer = WriteBehindBuffer(insert_fn=write_call_rows, name="call_analytics_writer")
+
+
+class CallAnalyticsAggregator:
+    def __init__(
+        self,
+        enabled: bool = CALL_ANALYTICS_ENABLED,
+        idle_seconds: float = CALL_ANALYTICS_IDLE_SECONDS,
+        sweep_seconds: float = CALL_ANALYTICS_SWEEP_SECONDS,
+    ):
+        self.enabled = enabled
+        self.idle_seconds = idle_seconds
+        self.sweep_seconds = sweep_seconds
+        self._calls: Dict[str, CallAggregate] = {}
+        self._lock = threading.Lock()
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._counters = {
+            "turns": 0, "flushed_calls": 0, "idle_flushes": 0, "ended_flushes": 0,
+            "intent_rows": 0, "entity_rows": 0,
+        }
+
+    def _ensure_sweeper(self):
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        with self._lock:
+            if self._sweeper is None or not self._sweeper.is_alive():
+                self._stop_event.clear()
+                self._sweeper = threading.Thread(target=self._sweep_loop, name="call-analytics-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def record_turn(
+        self,
+        call_id: str,
+        intent: Optional[str],
+        confidence: Optional[float],
+        entities: Optional[Dict[str, Any]],
+    ):
+        """Cộng dồn một lượt user (gọi từ pipeline NLP, không chạm database)"""
+        if not self.enabled or not call_id:
+            return
+        self._ensure_sweeper()
+        with self._lock:
+            aggregate = self._calls.get(call_id)
+            if aggregate is None:
+                aggregate = self._calls[call_id] = CallAggregate()
+            aggregate.add(intent, confidence, entities)
+            self._counters["turns"] += 1
+
+    def last_intent(self, call_id: str) -> Optional[str]:
+        """Intent của lượt user gần nhất (None nếu cuộc gọi không còn trong bộ nhớ)"""
+        with self._lock:
+            aggregate = self._calls.get(call_id)
+            return aggregate.last_intent if aggregate is not None else None
+
+    def end_call(self, call_id: str) -> bool:
+        """Cuộc gọi kết thúc: ghi tổng hợp của nó; False nếu không có gì để ghi"""
+        with self._lock:
+            aggregate = self._calls.pop(call_id, None)
+        if aggregate is None:
+            return False
+        self._write(call_id, aggregate)
+        return True
+
+    def _write(self, call_id: str, aggregate: CallAggregate):
+        intent_rows = aggregate.intent_rows(call_id)
+        entity_rows = aggregate.entity_rows(call_id)
+        for row in intent_rows:
+            call_rows_writer.submit("call_intents", row)
+        for row in entity_rows:
+            call_rows_writer.submit("call_entities", row)
+        with self._lock:
+            self._counters["flushed_calls"] += 1
+            self._counters["intent_rows"] += len(intent_rows)
+            self._counters["entity_rows"] += len(entity_rows)
+
+    def flush_idle(self) -> int:
+        """Ghi các cuộc gọi không có lượt mới quá idle_seconds (không nhận được hangup)"""
+        deadline = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [call_id for call_id, agg in self._calls.items() if agg.last_seen <= deadline]
+            expired = [(call_id, self._calls.pop(call_id)) for call_id in idle]
+            self._counters["idle_flushes"] += len(expired)
+        for call_id, aggregate in expired:
+            self._write(call_id, aggregate)
+        return len(expired)
+
+    def flush_ended(self) -> int:
+        """Ghi các cuộc gọi đã kết thúc trong bảng calls (hangup / DELETE session do worker khác xử lý).
+
+        Chạy từ thread sweeper; bỏ qua nếu chưa có event loop của app để truy vấn.
+        """
+        with self._lock:
+            active = list(self._calls)
+        if not active or not db.is_bound():
+            return 0
+        ended = []
+        for chunk in _chunks(active):
+            rows = db.run_sync(
+                lambda database, ids=chunk: database.select("calls", "id, status", where=[("id", "in", ids)]),
+                timeout=db.DB_QUERY_TIMEOUT_SECONDS + 1,
+            )
+            ended.extend(str(row["id"]) for row in rows if row.get("status") not in _OPEN_CALL_STATUSES)
+        with self._lock:
+            expired = [(call_id, self._calls.pop(call_id)) for call_id in ended if call_id in self._calls]
+            self._counters["ended_flushes"] += len(expired)
+        for call_id, aggregate in expired:
+            self._write(call_id, aggregate)
+        return len(expired)
+
+    def _sweep_loop(self):
+        while not self._stop_event.wait(self.sweep_seconds):
+            try:
+                self.flush_idle()
+                self.flush_ended()
+            except Exception as e:
+                logger.error(f"Lỗi khi ghi call analytics: {e}")
+
+    def stop(self):
+        """Dừng sweeper, ghi mọi cuộc gọi còn dở rồi xả call_rows_writer (chặn tới khi ghi xong)"""
+        self._stop_event.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=5)
+        with self._lock:
+            remaining = list(self._calls.items())
+            self._calls.clear()
+        for call_id, aggregate in remaining:
+            self._write(call_id, aggregate)
+        call_rows_writer.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "active_calls": len(self._calls),
+                "idle_seconds": self.idle_seconds,
+                **self._counters,
+                "writer": call_rows_writer.stats(),
+            }
+
+
+call_analytics = CallAnalyticsAggregator()
@@ -0,0 +1,50 @@
+"""
+Context theo cuộc gọi (phiên bản workflow đang chạy) giữ trong bộ nhớ tiến trình.
+Workflow của một cuộc gọi không đổi giữa chừng nên chỉ lượt đầu (hoặc prefetch
+từ start_call) cần truy vấn calls -> workflows -> workflow_versions; các lượt
+sau đọc từ cache. Entry bị xóa khi cuộc gọi kết thúc (hangup) hoặc hết TTL.
+"""
+
+import json
+import os
+from typing import Any, Dict, Optional
+
+from app.utils.cache import TTLCache
+from app.utils.metrics import gauge
+
+CALL_SESSION_CACHE_ENABLED = os.getenv("CALL_SESSION_CACHE_ENABLED", "true").lower() == "true"
+CALL_SESSION_MAX_ENTRIES = int(os.getenv("CALL_SESSION_MAX_ENTRIES", "10000"))
+CALL_SESSION_TTL_SECONDS = float(os.getenv("CALL_SESSION_TTL_SECONDS", "1800"))
+
+
+def _approx_size(version: Dict[str, Any]) -> int:
+    """Số byte JSON của version (ước lượng bộ nhớ, đủ để so sánh và theo dõi)"""
+    return len(json.dumps(version, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+_sessions = TTLCache(
+    max_entries=CALL_SESSION_MAX_ENTRIES if CALL_SESSION_CACHE_ENABLED else 0,
+    ttl_seconds=CALL_SESSION_TTL_SECONDS,
+    sizeof=_approx_size,
+)
+
+gauge("call_session_cache_entries", lambda: len(_sessions), "Số cuộc gọi đang có context trong cache")
+gauge("call_session_cache_bytes", lambda: _sessions.stats()["bytes"], "Ước lượng byte JSON đang giữ trong cache")
+gauge("call_session_cache_hit_rate", lambda: _sessions.stats()["hit_rate"], "Tỉ lệ lượt đọc context từ cache")
+
+
+def get(call_id: str) -> Optional[Dict[str, Any]]:
+    return _sessions.get(call_id)
+
+
+def put(call_id: str, active_version: Dict[str, Any]):
+    _sessions.set(call_id, active_version)
+
+
+def evict(call_id: str) -> bool:
+    """Bỏ context của cuộc gọi (gọi khi cuộc gọi kết thúc); True nếu có entry bị xóa"""
+    return _sessions.pop(call_id) is not None
+
+
+def stats() -> Dict[str, Any]:
+    return {"enabled": CALL_SESSION_CACHE_ENABLED, **_sessions.stats()}
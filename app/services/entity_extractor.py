@@ -4,191 +4,168 @@ Trích xuất các entities như thời gian, ngày tháng, số điện thoại
 """
 
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# Một regex duy nhất cho mọi loại entity, quét text (đã lowercase) đúng một lần.
+# Thứ tự nhánh quyết định ưu tiên tại cùng vị trí: email > phone > ngày > giờ,
+# nên dãy số điện thoại không bị đọc nhầm thành giờ/ngày.
+_ENTITY_SCANNER = re.compile(
+    r"""
+    (?P<email>[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,})
+    | (?P<phone>(?:0|\+84)\s*(?:\d{9,10}|\d{2,3}\s*\d{3}\s*\d{4}))
+    | ngày\s*(?P<dm_day>\d{1,2})\s*tháng\s*(?P<dm_month>\d{1,2})                 # ngày 15 tháng 10
+    | (?P<dmy_day>\d{1,2})/(?P<dmy_month>\d{1,2})(?:/(?P<dmy_year>\d{4}))?         # 15/10/2025
+    | (?<!\w)(?P<relative>hôm\s+nay|ngày\s+mai|ngày\s+kia|mai)(?!\w)             # relative dates
+    | (?P<tp_period>sáng|chiều|tối|trưa)\s*(?P<tp_hour>\d{1,2})\s*giờ              # sáng 9 giờ
+    | (?P<tg_hour>\d{1,2})\s*giờ(?:\s*(?P<tg_minute>\d{1,2}))?(?:\s*phút)?         # 9 giờ 30 phút
+    | (?P<th_hour>\d{1,2})h(?P<th_minute>\d{2})?                                  # 9h30
+    | (?P<tc_hour>\d{1,2})\s*:\s*(?P<tc_minute>\d{2})                             # 9:30
+    """,
+    re.VERBOSE,
+)
+
+# Không có chữ số, '@' hay từ khóa ngày tương đối -> chắc chắn không có entity
+_ENTITY_PRECHECK = re.compile(r"[\d@]|hôm\s+nay|mai|ngày\s+kia")
+_PM_PERIOD = re.compile(r"chiều|tối")
+_WHITESPACE = re.compile(r"\s+")
+
+_RELATIVE_DATES = {
+    'hôm nay': ('today', 0, 'hôm nay'),
+    'ngày mai': ('tomorrow', 1, 'ngày mai'),
+    'mai': ('tomorrow', 1, 'ngày mai'),
+    'ngày kia': ('day_after_tomorrow', 2, 'ngày kia'),
+}
+
+
+def _empty_entities() -> Dict[str, List[Dict[str, Any]]]:
+    return {'times': [], 'dates': [], 'phones': [], 'emails': []}
+
+
 class EntityExtractor:
-    """Class để trích xuất entities từ text tiếng Việt"""
+    """Class để trích xuất entities từ text tiếng Việt (một lần quét cho mọi loại)"""
     
     def __init__(self):
-        # Patterns cho thời gian
-        self.time_patterns = [
-            r'(\d{1,2})\s*giờ\s*(\d{1,2})?\s*(phút)?',  # 9 giờ 30 phút
-            r'(\d{1,2})[hH](\d{2})?',  # 9h30
-            r'(\d{1,2})\s*:\s*(\d{2})',  # 9:30
-            r'(sáng|chiều|tối|trưa)\s*(\d{1,2})\s*giờ',  # sáng 9 giờ
-        ]
-        
-        # Patterns cho ngày tháng
-        self.date_patterns = [
-            r'ngày\s*(\d{1,2})\s*tháng\s*(\d{1,2})',  # ngày 15 tháng 10
-            r'(\d{1,2})/(\d{1,2})/(\d{4})?',  # 15/10/2025
-            r'(hôm nay|ngày mai|ngày kia)',  # relative dates
-            r'(thứ\s*(hai|ba|tư|năm|sáu|bảy)|chủ nhật)\s*tuần\s*(này|sau)',
-        ]
-        
-        # Patterns cho số điện thoại Việt Nam
-        self.phone_patterns = [
-            r'(0|\+84)\s*\d{9,10}',  # 0909123456 hoặc +84909123456
-            r'(0|\+84)\s*\d{2,3}\s*\d{3}\s*\d{4}',  # 090 912 3456
-        ]
-        
-        # Patterns cho email
-        self.email_patterns = [
-            r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}',
-        ]
-        
         # Từ điển chuyển đổi
         self.weekday_map = {
             'hai': 'Monday', 'ba': 'Tuesday', 'tư': 'Wednesday',
             'năm': 'Thursday', 'sáu': 'Friday', 'bảy': 'Saturday',
             'chủ nhật': 'Sunday'
         }
-        
+    
+    def _time(self, hour: str, minute: Optional[str], original: str, pm: bool) -> Dict[str, Any]:
+        hour = int(hour)
+        minute = int(minute) if minute else 0
+        # Điều chỉnh cho chiều/tối
+        if pm and hour < 12:
+            hour += 12
+        return {
+            'type': 'time',
+            'hour': hour,
+            'minute': minute,
+            'formatted': f"{hour:02d}:{minute:02d}",
+            'original': original
+        }
+    
+    def _date(self, day: str, month: str, year: Optional[str], original: str) -> Optional[Dict[str, Any]]:
+        day, month = int(day), int(month)
+        year = int(year) if year else datetime.now().year
+        try:
+            date_obj = datetime(year, month, day)
+        except ValueError:
+            logger.warning(f"Invalid date: {day}/{month}/{year}")
+            return None
+        return {
+            'type': 'date',
+            'date': date_obj.strftime('%Y-%m-%d'),
+            'day': day,
+            'month': month,
+            'year': year,
+            'original': original
+        }
+    
+    def scan(self, text: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Quét text một lần, trả về times, dates, phones, emails"""
+        entities = _empty_entities()
+        text_lower = text.lower()
+        if not _ENTITY_PRECHECK.search(text_lower):
+            return entities
+        
+        pm = _PM_PERIOD.search(text_lower) is not None
+        relative_dates = []
+        seen_relative = set()
+        
+        for match in _ENTITY_SCANNER.finditer(text_lower):
+            original = match.group(0)
+            groups = match.groupdict()
+            if groups['email']:
+                entities['emails'].append({'type': 'email', 'value': original, 'original': original})
+            elif groups['phone']:
+                entities['phones'].append({
+                    'type': 'phone',
+                    'value': _WHITESPACE.sub('', original),  # Loại bỏ khoảng trắng
+                    'original': original
+                })
+            elif groups['dm_day']:
+                date = self._date(groups['dm_day'], groups['dm_month'], None, original)
+                if date:
+                    entities['dates'].append(date)
+            elif groups['dmy_day']:
+                date = self._date(groups['dmy_day'], groups['dmy_month'], groups['dmy_year'], original)
+                if date:
+                    entities['dates'].append(date)
+            elif groups['relative']:
+                relative, days, label = _RELATIVE_DATES[_WHITESPACE.sub(' ', groups['relative'])]
+                if relative not in seen_relative:
+                    seen_relative.add(relative)
+                    relative_dates.append({
+                        'type': 'date',
+                        'date': (datetime.now() + timedelta(days=days)).strftime('%Y-%m-%d'),
+                        'relative': relative,
+                        'original': label
+                    })
+            elif groups['tp_hour']:
+                period_pm = groups['tp_period'] in ('chiều', 'tối')
+                entities['times'].append(self._time(groups['tp_hour'], None, original, pm or period_pm))
+            else:
+                for prefix in ('tg', 'th', 'tc'):
+                    if groups[f'{prefix}_hour']:
+                        entities['times'].append(
+                            self._time(groups[f'{prefix}_hour'], groups[f'{prefix}_minute'], original, pm)
+                        )
+                        break
+        
+        # Ngày tương đối đứng trước ngày cụ thể (giữ thứ tự output cũ)
+        entities['dates'] = relative_dates + entities['dates']
+        return entities
+    
     def extract_time(self, text: str) -> List[Dict[str, Any]]:
         """Trích xuất thông tin thời gian"""
-        times = []
-        text_lower = text.lower()
-        
-        for pattern in self.time_patterns:
-            matches = re.finditer(pattern, text_lower)
-            for match in matches:
-                groups = match.groups()
-                
-                # Parse giờ và phút
-                if len(groups) >= 1:
-                    hour = int(groups[0]) if groups[0] else None
-                    minute = int(groups[1]) if len(groups) > 1 and groups[1] else 0
-                    
-                    if hour is not None:
-                        # Điều chỉnh cho sáng/chiều/tối
-                        if 'chiều' in text_lower and hour < 12:
-                            hour += 12
-                        elif 'tối' in text_lower and hour < 12:
-                            hour += 12
-                        
-                        times.append({
-                            'type': 'time',
-                            'hour': hour,
-                            'minute': minute,
-                            'formatted': f"{hour:02d}:{minute:02d}",
-                            'original': match.group(0)
-                        })
-        
-        return times
+        return self.scan(text)['times']
     
     def extract_date(self, text: str) -> List[Dict[str, Any]]:
         """Trích xuất thông tin ngày tháng"""
-        dates = []
-        text_lower = text.lower()
-        
-        # Xử lý relative dates
-        if 'hôm nay' in text_lower:
-            today = datetime.now()
-            dates.append({
-                'type': 'date',
-                'date': today.strftime('%Y-%m-%d'),
-                'relative': 'today',
-                'original': 'hôm nay'
-            })
-        
-        if 'ngày mai' in text_lower or 'mai' in text_lower:
-            tomorrow = datetime.now() + timedelta(days=1)
-            dates.append({
-                'type': 'date',
-                'date': tomorrow.strftime('%Y-%m-%d'),
-                'relative': 'tomorrow',
-                'original': 'ngày mai'
-            })
-        
-        if 'ngày kia' in text_lower:
-            day_after = datetime.now() + timedelta(days=2)
-            dates.append({
-                'type': 'date',
-                'date': day_after.strftime('%Y-%m-%d'),
-                'relative': 'day_after_tomorrow',
-                'original': 'ngày kia'
-            })
-        
-        # Xử lý ngày tháng cụ thể
-        for pattern in self.date_patterns:
-            if pattern == r'(hôm nay|ngày mai|ngày kia)':
-                continue  # Đã xử lý ở trên
-            
-            matches = re.finditer(pattern, text_lower)
-            for match in matches:
-                groups = match.groups()
-                
-                if len(groups) >= 2 and groups[0].isdigit():
-                    day = int(groups[0])
-                    month = int(groups[1])
-                    year = int(groups[2]) if len(groups) > 2 and groups[2] else datetime.now().year
-                    
-                    try:
-                        date_obj = datetime(year, month, day)
-                        dates.append({
-                            'type': 'date',
-                            'date': date_obj.strftime('%Y-%m-%d'),
-                            'day': day,
-                            'month': month,
-                            'year': year,
-                            'original': match.group(0)
-                        })
-                    except ValueError:
-                        logger.warning(f"Invalid date: {day}/{month}/{year}")
-        
-        return dates
+        return self.scan(text)['dates']
     
     def extract_phone(self, text: str) -> List[Dict[str, Any]]:
         """Trích xuất số điện thoại"""
-        phones = []
-        
-        for pattern in self.phone_patterns:
-            matches = re.finditer(pattern, text)
-            for match in matches:
-                phone = re.sub(r'\s+', '', match.group(0))  # Loại bỏ khoảng trắng
-                phones.append({
-                    'type': 'phone',
-                    'value': phone,
-                    'original': match.group(0)
-                })
-        
-        return phones
+        return self.scan(text)['phones']
     
     def extract_email(self, text: str) -> List[Dict[str, Any]]:
         """Trích xuất email"""
-        emails = []
-        
-        for pattern in self.email_patterns:
-            matches = re.finditer(pattern, text.lower())
-            for match in matches:
-                emails.append({
-                    'type': 'email',
-                    'value': match.group(0),
-                    'original': match.group(0)
-                })
-        
-        return emails
+        return self.scan(text)['emails']
     
     def extract_all(self, text: str) -> Dict[str, List[Dict[str, Any]]]:
         """Trích xuất tất cả entities"""
-        entities = {
-            'times': self.extract_time(text),
-            'dates': self.extract_date(text),
-            'phones': self.extract_phone(text),
-            'emails': self.extract_email(text)
-        }
+        entities = self.scan(text)
         
-        # Log kết quả
-        logger.info(f"[Entity Extractor] Extracted from '{text}':")
-        for entity_type, values in entities.items():
-            if values:
-                logger.info(f"  {entity_type}: {values}")
+        if logger.isEnabledFor(logging.DEBUG):
+            found = {entity_type: values for entity_type, values in entities.items() if values}
+            logger.debug(f"[Entity Extractor] Extracted from '{text}': {found}")
         
         return entities
 
@@ -207,3 +184,26 @@ def extract_entities(text: str) -> Dict[str, Any]:
         Dictionary chứa các entities đã trích xuất
     """
     return _extractor.extract_all(text)
+
+
+def format_entities(entities: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten entities cho dễ sử dụng (giá trị đầu tiên + danh sách chi tiết)"""
+    formatted_entities = {}
+    
+    if entities.get('times'):
+        formatted_entities['time'] = entities['times'][0]['formatted']
+        formatted_entities['time_details'] = entities['times']
+    
+    if entities.get('dates'):
+        formatted_entities['date'] = entities['dates'][0]['date']
+        formatted_entities['date_details'] = entities['dates']
+    
+    if entities.get('phones'):
+        formatted_entities['phone'] = entities['phones'][0]['value']
+        formatted_entities['phone_details'] = entities['phones']
+    
+    if entities.get('emails'):
+        formatted_entities['email'] = entities['emails'][0]['value']
+        formatted_entities['email_details'] = entities['emails']
+    
+    return formatted_entities
@@ -0,0 +1,411 @@
+"""
+Journal feedback chỉ-ghi-thêm, chia segment.
+Handler chỉ put_nowait bản ghi vào hàng đợi; một thread ghi duy nhất của process
+nối từng dòng JSON vào segment đang mở và fsync theo lô (FEEDBACK_JOURNAL_FSYNC_*).
+Segment đầy (FEEDBACK_JOURNAL_SEGMENT_BYTES) hoặc quá tuổi thì được niêm phong:
+đổi tên theo thời điểm niêm phong, từ đó bất biến. Segment niêm phong cũ hơn
+FEEDBACK_JOURNAL_COMPACT_AFTER_SECONDS được nén sang Parquet (cần pyarrow).
+
+Mỗi process (worker uvicorn) có segment đang mở riêng và giữ khóa độc quyền trên
+nó (app.utils.file_lock) suốt lúc ghi, nên không bao giờ có hai tiến trình cùng
+ghi một file. Segment ".open" không còn ai giữ khóa là của process đã chết (hệ điều
+hành tự nhả khóa) và được process khác niêm phong. Reader chỉ đọc segment đã niêm phong, theo thứ tự
+tên; tên theo thời điểm niêm phong nên segment niêm phong sau luôn đứng sau, và
+cursor "<segment>:<số bản ghi đã đọc>" vẫn đúng khi segment đã được nén sang Parquet.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+from app.utils.file_lock import exclusive_lock, try_lock, unlock
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_JOURNAL_DIR = Path(os.getenv("FEEDBACK_JOURNAL_DIR", "data/feedback_journal"))
+FEEDBACK_JOURNAL_SEGMENT_BYTES = int(os.getenv("FEEDBACK_JOURNAL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+FEEDBACK_JOURNAL_SEGMENT_MAX_AGE_SECONDS = float(os.getenv("FEEDBACK_JOURNAL_SEGMENT_MAX_AGE_SECONDS", "3600"))
+FEEDBACK_JOURNAL_FSYNC_INTERVAL_MS = float(os.getenv("FEEDBACK_JOURNAL_FSYNC_INTERVAL_MS", "200"))
+FEEDBACK_JOURNAL_FSYNC_MAX_RECORDS = int(os.getenv("FEEDBACK_JOURNAL_FSYNC_MAX_RECORDS", "256"))
+FEEDBACK_JOURNAL_COMPACT_AFTER_SECONDS = float(os.getenv("FEEDBACK_JOURNAL_COMPACT_AFTER_SECONDS", "86400"))
+FEEDBACK_JOURNAL_QUEUE_SIZE = int(os.getenv("FEEDBACK_JOURNAL_QUEUE_SIZE", "10000"))
+
+ACTIVE_SUFFIX = ".jsonl.open"
+SEGMENT_SUFFIX = ".jsonl"
+COMPACTED_SUFFIX = ".parquet"
+COMPACT_LOCK = ".compact.lock"
+COMPACT_CHECK_SECONDS = 300.0
+# Segment rỗng mới tạo có thể chưa kịp bị writer khóa; chỉ dọn khi cũ hơn ngưỡng này
+RECOVER_GRACE_SECONDS = 60.0
+# Writer chờ tối đa chừng này để khóa segment mới (recovery có thể đang giữ chốc lát)
+LOCK_SEGMENT_TIMEOUT_SECONDS = 1.0
+
+_STOP = object()
+
+
+class InvalidJournalCursor(ValueError):
+    """Cursor không đúng dạng <segment>:<offset>"""
+
+
+def _segment_stem(path: Path) -> str:
+    return path.name.split(".", 1)[0]
+
+
+def _sealed_name(pid: int, seq: int) -> str:
+    # Thời điểm niêm phong (ms, 13 chữ số) đứng đầu -> sắp theo tên = thứ tự niêm phong;
+    # pid + seq của process niêm phong giữ tên không trùng
+    return f"{int(time.time() * 1000):013d}-{pid}-{seq:06d}{SEGMENT_SUFFIX}"
+
+
+def parse_cursor(cursor: Optional[str]) -> Tuple[Optional[str], int]:
+    """"<segment>:<offset>" -> (segment, offset); "<segment>" = từ đầu segment đó"""
+    if not cursor:
+        return None, 0
+    segment, _, offset = cursor.partition(":")
+    try:
+        return segment, int(offset) if offset else 0
+    except ValueError as e:
+        raise InvalidJournalCursor(f"Cursor không hợp lệ: {cursor}") from e
+
+
+def list_segments(directory: Path = FEEDBACK_JOURNAL_DIR) -> List[Path]:
+    """Segment đã niêm phong theo thứ tự; segment đã nén thì trả bản Parquet"""
+    if not directory.exists():
+        return []
+    by_stem: Dict[str, Path] = {}
+    for path in directory.iterdir():
+        if path.name.endswith(COMPACTED_SUFFIX) or (
+            path.name.endswith(SEGMENT_SUFFIX) and not path.name.endswith(ACTIVE_SUFFIX)
+        ):
+            stem = _segment_stem(path)
+            if stem not in by_stem or path.name.endswith(COMPACTED_SUFFIX):
+                by_stem[stem] = path
+    return [by_stem[stem] for stem in sorted(by_stem)]
+
+
+def _iter_segment(path: Path, skip: int) -> Iterator[Dict[str, Any]]:
+    if path.name.endswith(COMPACTED_SUFFIX):
+        import pyarrow.parquet as pq
+        index = 0
+        for batch in pq.ParquetFile(path).iter_batches():
+            if index + batch.num_rows <= skip:
+                index += batch.num_rows
+                continue
+            for record in batch.to_pylist():
+                if index >= skip:
+                    yield record
+                index += 1
+        return
+    try:
+        handle = path.open("r", encoding="utf-8")
+    except FileNotFoundError:
+        # Vừa được nén xong giữa lúc liệt kê và lúc mở
+        yield from _iter_segment(path.with_name(_segment_stem(path) + COMPACTED_SUFFIX), skip)
+        return
+    with handle:
+        for index, line in enumerate(handle):
+            if index >= skip and line.strip():
+                yield json.loads(line)
+
+
+def read_since(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    directory: Path = FEEDBACK_JOURNAL_DIR,
+) -> Iterator[Tuple[Dict[str, Any], str]]:
+    """Stream (bản ghi, cursor sau bản ghi) kể từ cursor, không nạp cả lịch sử.
+    Lưu cursor cuối cùng để lần sau đọc tiếp đúng chỗ."""
+    start_segment, offset = parse_cursor(cursor)
+    emitted = 0
+    for path in list_segments(directory):
+        stem = _segment_stem(path)
+        if start_segment is not None and stem < start_segment:
+            continue
+        skip = offset if stem == start_segment else 0
+        position = skip
+        for record in _iter_segment(path, skip):
+            if limit is not None and emitted >= limit:
+                return
+            position += 1
+            emitted += 1
+            yield record, f"{stem}:{position}"
+
+
+class FeedbackJournal:
+    def __init__(
+        self,
+        directory: Path = FEEDBACK_JOURNAL_DIR,
+        segment_bytes: int = FEEDBACK_JOURNAL_SEGMENT_BYTES,
+        segment_max_age_seconds: float = FEEDBACK_JOURNAL_SEGMENT_MAX_AGE_SECONDS,
+        fsync_interval_ms: float = FEEDBACK_JOURNAL_FSYNC_INTERVAL_MS,
+        fsync_max_records: int = FEEDBACK_JOURNAL_FSYNC_MAX_RECORDS,
+        compact_after_seconds: float = FEEDBACK_JOURNAL_COMPACT_AFTER_SECONDS,
+        queue_size: int = FEEDBACK_JOURNAL_QUEUE_SIZE,
+    ):
+        self.directory = Path(directory)
+        self.segment_bytes = segment_bytes
+        self.segment_max_age_seconds = segment_max_age_seconds
+        self.fsync_interval_ms = fsync_interval_ms
+        self.fsync_max_records = fsync_max_records
+        self.compact_after_seconds = compact_after_seconds
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stopped = False
+        self._pid = os.getpid()
+        self._seq = 0
+        self._handle = None
+        self._active_path: Optional[Path] = None
+        self._active_bytes = 0
+        self._active_opened = 0.0
+        self._last_compact_check = 0.0
+        self._compact_unavailable_logged = False
+        self._counters_lock = threading.Lock()
+        self._counters = {
+            "appended": 0,
+            "written": 0,
+            "dropped": 0,
+            "fsyncs": 0,
+            "segments_sealed": 0,
+            "segments_compacted": 0,
+            "recovered": 0,
+            "errors": 0,
+        }
+
+    def _count(self, key: str, n: int = 1):
+        with self._counters_lock:
+            self._counters[key] += n
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self._recover()
+                self._thread = threading.Thread(target=self._run, name="feedback-journal", daemon=True)
+                self._thread.start()
+
+    def append(self, record: Dict[str, Any]) -> bool:
+        """Đưa một bản ghi vào hàng đợi của thread ghi; False nếu hàng đợi đầy hoặc đã dừng"""
+        if self._stopped:
+            return False
+        self._ensure_started()
+        record = {**record, "ts": datetime.now(timezone.utc).isoformat()}
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._count("dropped")
+            logger.warning("Hàng đợi feedback journal đầy, bỏ bản ghi")
+            return False
+        self._count("appended")
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        """Ghi nốt hàng đợi, fsync và niêm phong segment đang mở"""
+        self._stopped = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout=timeout)
+
+    # --- Thread ghi ---
+
+    def _recover(self):
+        """Niêm phong segment đang mở mà không process nào còn giữ khóa (crash, restart worker)"""
+        for path in self.directory.glob(f"*{ACTIVE_SUFFIX}"):
+            if path == self._active_path:
+                continue
+            try:
+                handle = path.open("rb")
+            except FileNotFoundError:
+                continue  # writer hoặc process khác vừa niêm phong
+            if not try_lock(handle):
+                handle.close()  # writer còn sống
+                continue
+            stat = os.fstat(handle.fileno())
+            if stat.st_size == 0 and time.time() - stat.st_mtime < RECOVER_GRACE_SECONDS:
+                # Có thể là segment vừa tạo mà writer chưa kịp khóa
+                unlock(handle)
+                handle.close()
+                continue
+            if self._seal_locked(path, handle):
+                self._count("recovered")
+
+    def _open_segment(self):
+        self._seq += 1
+        opened_ms = int(time.time() * 1000)
+        path = self.directory / f"active-{self._pid}-{opened_ms:013d}-{self._seq:06d}{ACTIVE_SUFFIX}"
+        handle = path.open("ab")
+        deadline = time.monotonic() + LOCK_SEGMENT_TIMEOUT_SECONDS
+        while not try_lock(handle):
+            if time.monotonic() >= deadline:
+                handle.close()
+                raise OSError(f"Không khóa được segment {path.name}")
+            time.sleep(0.01)
+        self._active_path = path
+        self._handle = handle
+        self._active_bytes = 0
+        self._active_opened = time.monotonic()
+
+    def _fsync(self):
+        if self._handle is not None:
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+            self._count("fsyncs")
+
+    def _seal_path(self, path: Path) -> bool:
+        """Đổi tên segment sang tên niêm phong (xóa nếu rỗng); False nếu process khác đã làm trước"""
+        try:
+            if path.stat().st_size == 0:
+                path.unlink()
+                return True
+            self._seq += 1
+            path.rename(self.directory / _sealed_name(self._pid, self._seq))
+        except FileNotFoundError:
+            return False
+        self._count("segments_sealed")
+        return True
+
+    def _seal_locked(self, path: Path, handle: IO) -> bool:
+        """Niêm phong segment mà handle đang giữ khóa, rồi đóng handle"""
+        try:
+            try:
+                # POSIX: đổi tên khi còn giữ khóa, không process nào chen vào được
+                return self._seal_path(path)
+            except PermissionError:
+                # Windows không đổi tên / xóa được file đang mở: nhả khóa, đóng rồi làm lại
+                unlock(handle)
+                handle.close()
+                return self._seal_path(path)
+        finally:
+            handle.close()
+
+    def _seal_active(self):
+        if self._handle is None:
+            return
+        self._fsync()
+        handle, path = self._handle, self._active_path
+        self._handle = None
+        self._active_path = None
+        self._seal_locked(path, handle)
+
+    def _write(self, record: Dict[str, Any]):
+        if self._handle is None:
+            self._open_segment()
+        line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        self._handle.write(line)
+        self._active_bytes += len(line)
+        self._count("written")
+
+    def _run(self):
+        interval = self.fsync_interval_ms / 1000.0
+        dirty = 0
+        first_dirty: Optional[float] = None
+        stopping = False
+        while not stopping:
+            timeout = interval if first_dirty is None else max(0.0, first_dirty + interval - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            try:
+                if item is _STOP:
+                    stopping = True
+                elif item is not None:
+                    self._write(item)
+                    dirty += 1
+                    if first_dirty is None:
+                        first_dirty = time.monotonic()
+
+                due = first_dirty is not None and time.monotonic() - first_dirty >= interval
+                if dirty and (stopping or due or dirty >= self.fsync_max_records):
+                    self._fsync()
+                    dirty = 0
+                    first_dirty = None
+
+                if self._handle is not None and (
+                    stopping
+                    or self._active_bytes >= self.segment_bytes
+                    or time.monotonic() - self._active_opened >= self.segment_max_age_seconds
+                ):
+                    self._seal_active()
+                    dirty = 0
+                    first_dirty = None
+
+                if not stopping and time.monotonic() - self._last_compact_check >= COMPACT_CHECK_SECONDS:
+                    self._last_compact_check = time.monotonic()
+                    # Segment của worker chết giữa chừng được niêm phong mà không cần restart
+                    self._recover()
+                    self.compact()
+            except Exception as e:
+                self._count("errors")
+                logger.error(f"Lỗi khi ghi feedback journal: {e}")
+
+    # --- Nén segment cũ ---
+
+    def compact(self, older_than_seconds: Optional[float] = None) -> int:
+        """Nén segment JSONL đã niêm phong lâu hơn ngưỡng sang Parquet (cùng tên segment).
+        Chỉ một process nén tại một thời điểm (khóa file); trả số segment đã nén."""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            if not self._compact_unavailable_logged:
+                self._compact_unavailable_logged = True
+                logger.warning(f"Không nén được feedback journal sang Parquet (cần pyarrow): {e}")
+            return 0
+
+        threshold = self.compact_after_seconds if older_than_seconds is None else older_than_seconds
+        cutoff_ms = int((time.time() - threshold) * 1000)
+        compacted = 0
+        with exclusive_lock(str(self.directory / COMPACT_LOCK), timeout=0) as acquired:
+            if not acquired:
+                return 0  # process khác đang nén
+            for path in list_segments(self.directory):
+                if not path.name.endswith(SEGMENT_SUFFIX) or int(path.name[:13]) > cutoff_ms:
+                    continue
+                target = path.with_name(_segment_stem(path) + COMPACTED_SUFFIX)
+                tmp = target.with_name(f"{target.name}.{self._pid}.tmp")
+                try:
+                    with path.open("r", encoding="utf-8") as f:
+                        records = [json.loads(line) for line in f if line.strip()]
+                    pq.write_table(pa.Table.from_pylist(records), tmp)
+                    os.replace(tmp, target)
+                    path.unlink()
+                except Exception as e:
+                    # Windows: reader đang mở segment (OSError) -> để lần kiểm tra sau;
+                    # segment hỏng (JSON / pyarrow) không được chặn các segment sau
+                    logger.warning(f"Chưa nén được segment {path.name}: {e}")
+                    try:
+                        tmp.unlink()
+                    except FileNotFoundError:
+                        pass
+                    continue
+                compacted += 1
+        if compacted:
+            self._count("segments_compacted", compacted)
+            logger.info(f"Đã nén {compacted} segment feedback journal sang Parquet")
+        return compacted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counters_lock:
+            counters = dict(self._counters)
+        segments = list_segments(self.directory)
+        return {
+            "directory": str(self.directory),
+            "running": self._thread is not None and self._thread.is_alive(),
+            "queue_depth": self._queue.qsize(),
+            "active_segment_bytes": self._active_bytes if self._handle is not None else 0,
+            "sealed_segments": len(segments),
+            "compacted_segments": sum(1 for p in segments if p.name.endswith(COMPACTED_SUFFIX)),
+            **counters,
+        }
+
+
+feedback_journal = FeedbackJournal()
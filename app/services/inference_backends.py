@@ -0,0 +1,331 @@
+"""
+Inference backends cho intent model.
+- TorchBackend: PyTorch eager (CUDA nếu có)
+- OnnxBackend: ONNX Runtime CPU, export từ cùng checkpoint và cache cạnh checkpoint
+"""
+
+import json
+import os
+import time
+import uuid
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+import torch
+from transformers import AutoConfig, AutoModelForSequenceClassification
+
+from app.utils.file_lock import exclusive_lock
+from app.utils.metrics import histogram
+
+logger = logging.getLogger(__name__)
+
+ONNX_SUBDIR = "onnx"
+ONNX_FILENAME = "model.onnx"
+ONNX_META_FILENAME = "export_meta.json"
+ONNX_LOCK_FILENAME = ".export.lock"
+ONNX_OPSET = 14
+ONNX_INPUT_NAMES = ["input_ids", "attention_mask"]
+
+FIRST_REQUEST_MS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000, 2500)
+
+# Artifact int8 do quantize_intent_model.py tạo ra
+QUANTIZED_WEIGHTS_FILENAME = "quantized_model.pt"
+QUANTIZATION_CONFIG_FILENAME = "quantization_config.json"
+
+
+def is_quantized_checkpoint(model_path: str) -> bool:
+    return os.path.exists(os.path.join(model_path, QUANTIZED_WEIGHTS_FILENAME))
+
+
+def quantize_dynamic_int8(model: torch.nn.Module) -> torch.nn.Module:
+    """Dynamic quantization: trọng số các lớp Linear sang int8, activation quantize lúc chạy"""
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_quantized_model(model_path: str) -> torch.nn.Module:
+    """Dựng lại kiến trúc từ config, quantize rồi nạp state_dict int8"""
+    config = AutoConfig.from_pretrained(model_path)
+    model = AutoModelForSequenceClassification.from_config(config)
+    model.eval()
+    model = quantize_dynamic_int8(model)
+    state_dict = torch.load(os.path.join(model_path, QUANTIZED_WEIGHTS_FILENAME), map_location="cpu")
+    model.load_state_dict(state_dict)
+    return model
+
+
+class InferenceBackend:
+    """Interface chung: nhận input đã tokenize, trả về logits numpy (batch, num_labels)"""
+
+    name = "base"
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+        self.config = AutoConfig.from_pretrained(model_path)
+        # Latency của request thật đầu tiên sau warm-up (ms)
+        self.first_request_ms: Optional[float] = None
+        self._awaiting_first_request = False
+
+    @property
+    def id2label(self) -> Dict[int, str]:
+        return self.config.id2label
+
+    def mark_ready(self):
+        """Gọi sau warm-up: request kế tiếp được đo làm first-request latency"""
+        self.first_request_ms = None
+        self._awaiting_first_request = True
+
+    def predict_logits(self, inputs: Dict[str, Any]) -> np.ndarray:
+        if not self._awaiting_first_request:
+            return self._predict(inputs)
+        self._awaiting_first_request = False
+        started = time.perf_counter()
+        logits = self._predict(inputs)
+        self.first_request_ms = (time.perf_counter() - started) * 1000
+        histogram(
+            "model_first_request_ms", FIRST_REQUEST_MS_BUCKETS,
+            "Latency request đầu tiên sau warm-up (ms)", labels={"backend": self.name},
+        ).observe(self.first_request_ms)
+        return logits
+
+    def _predict(self, inputs: Dict[str, Any]) -> np.ndarray:
+        raise NotImplementedError
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "model_path": self.model_path,
+            "first_request_ms": self.first_request_ms,
+        }
+
+
+class TorchBackend(InferenceBackend):
+    name = "torch"
+
+    def __init__(self, model_path: str, model: Optional[torch.nn.Module] = None):
+        super().__init__(model_path)
+        self.quantized = is_quantized_checkpoint(model_path)
+        if model is not None:
+            self.model = model
+        elif self.quantized:
+            # Kernel int8 dynamic chỉ chạy trên CPU
+            self.model = load_quantized_model(model_path)
+        else:
+            self.model = AutoModelForSequenceClassification.from_pretrained(model_path)
+        # Chuyển mô hình sang GPU nếu có
+        if torch.cuda.is_available() and not self.quantized:
+            self.model = self.model.cuda()
+        self.model.eval()
+        self.device = next(self.model.parameters()).device
+        self.compile_mode = "none"
+        # TorchScript graph theo từng shape (batch, seq_len) đã trace lúc warm-up
+        self._traced: Dict[Tuple[int, ...], Any] = {}
+        self._tracing = False
+
+    def compile(self, mode: str):
+        """
+        mode="trace": trace TorchScript cho các shape gặp trong warm-up (gọi trước warm-up,
+        kết thúc bằng finish_tracing()). mode="compile": torch.compile(dynamic=True).
+        """
+        if mode == "trace":
+            self._tracing = True
+        elif mode == "compile":
+            if not hasattr(torch, "compile"):
+                logger.warning("torch.compile không khả dụng (cần torch>=2.0), dùng eager")
+                return
+            self.model = torch.compile(self.model, dynamic=True)
+        elif mode != "none":
+            raise ValueError(f"Compile mode không hợp lệ: {mode}")
+        self.compile_mode = mode
+
+    def finish_tracing(self):
+        self._tracing = False
+
+    def _traced_forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor):
+        shape = tuple(input_ids.shape)
+        traced = self._traced.get(shape)
+        if traced is None and self._tracing:
+            wrapper = _LogitsOnly(self.model).eval()
+            traced = torch.jit.freeze(torch.jit.trace(wrapper, (input_ids, attention_mask)))
+            self._traced[shape] = traced
+        return traced(input_ids, attention_mask) if traced is not None else None
+
+    def _predict(self, inputs: Dict[str, Any]) -> np.ndarray:
+        inputs = {
+            k: (v if isinstance(v, torch.Tensor) else torch.as_tensor(v)).to(self.device)
+            for k, v in inputs.items()
+        }
+        with torch.no_grad():
+            logits = None
+            if self.compile_mode == "trace" and "input_ids" in inputs and "attention_mask" in inputs:
+                logits = self._traced_forward(inputs["input_ids"], inputs["attention_mask"])
+            if logits is None:
+                logits = self.model(**inputs).logits
+        return logits.float().cpu().numpy()
+
+    def status(self) -> Dict[str, Any]:
+        data = super().status()
+        data["device"] = str(self.device)
+        data["quantized"] = self.quantized
+        data["compile_mode"] = self.compile_mode
+        if self.compile_mode == "trace":
+            data["traced_shapes"] = sorted(self._traced)
+        return data
+
+
+class _LogitsOnly(torch.nn.Module):
+    """Bọc model HF để trace: (input_ids, attention_mask) -> logits"""
+
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, return_dict=False)[0]
+
+
+def _checkpoint_fingerprint(model_path: str) -> Dict[str, Any]:
+    """Dấu vết checkpoint (mtime + size của file trọng số) để biết bản export còn hợp lệ"""
+    fingerprint = {}
+    for fname in ("pytorch_model.bin", "model.safetensors", "config.json"):
+        fpath = os.path.join(model_path, fname)
+        if os.path.exists(fpath):
+            st = os.stat(fpath)
+            fingerprint[fname] = {"mtime": int(st.st_mtime), "size": st.st_size}
+    return fingerprint
+
+
+def _export_is_current(onnx_path: str, meta_path: str, fingerprint: str) -> bool:
+    if not (os.path.exists(onnx_path) and os.path.exists(meta_path)):
+        return False
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except Exception as e:
+        logger.warning(f"Không đọc được metadata ONNX, export lại: {e}")
+        return False
+    if meta.get("fingerprint") == fingerprint and meta.get("opset") == ONNX_OPSET:
+        return True
+    logger.info("Checkpoint đã thay đổi, export lại ONNX")
+    return False
+
+
+def export_onnx(model_path: str, force: bool = False) -> str:
+    """
+    Export checkpoint sang ONNX tại <model_path>/onnx/model.onnx.
+    Dùng lại bản export có sẵn nếu checkpoint không đổi (qua các lần restart).
+    Process chính và các inference worker có thể cùng gọi: export chạy dưới khóa
+    file, process đến sau dùng lại kết quả; file tạm có tên riêng theo process.
+    """
+    export_dir = os.path.join(model_path, ONNX_SUBDIR)
+    onnx_path = os.path.join(export_dir, ONNX_FILENAME)
+    meta_path = os.path.join(export_dir, ONNX_META_FILENAME)
+    fingerprint = _checkpoint_fingerprint(model_path)
+
+    if not force and _export_is_current(onnx_path, meta_path, fingerprint):
+        return onnx_path
+
+    os.makedirs(export_dir, exist_ok=True)
+    with exclusive_lock(os.path.join(export_dir, ONNX_LOCK_FILENAME)):
+        # Process khác có thể vừa export xong trong lúc chờ khóa
+        if not force and _export_is_current(onnx_path, meta_path, fingerprint):
+            return onnx_path
+        model = AutoModelForSequenceClassification.from_pretrained(model_path)
+        model.eval()
+        dummy_ids = torch.ones((1, 8), dtype=torch.long)
+        dummy_mask = torch.ones((1, 8), dtype=torch.long)
+        suffix = f".{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        tmp_path = onnx_path + suffix
+        try:
+            with torch.no_grad():
+                torch.onnx.export(
+                    model,
+                    (dummy_ids, dummy_mask),
+                    tmp_path,
+                    input_names=ONNX_INPUT_NAMES,
+                    output_names=["logits"],
+                    dynamic_axes={
+                        "input_ids": {0: "batch", 1: "sequence"},
+                        "attention_mask": {0: "batch", 1: "sequence"},
+                        "logits": {0: "batch"},
+                    },
+                    opset_version=ONNX_OPSET,
+                )
+            os.replace(tmp_path, onnx_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        meta_tmp = meta_path + suffix
+        with open(meta_tmp, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "opset": ONNX_OPSET}, f, indent=2)
+        os.replace(meta_tmp, meta_path)
+    logger.info(f"Đã export ONNX tại {onnx_path}")
+    return onnx_path
+
+
+class OnnxBackend(InferenceBackend):
+    name = "onnx"
+
+    def __init__(self, model_path: str):
+        import onnxruntime as ort  # optional dependency
+
+        super().__init__(model_path)
+        self.onnx_path = export_onnx(model_path)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        intra_threads = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+        if intra_threads > 0:
+            options.intra_op_num_threads = intra_threads
+        self.session = ort.InferenceSession(
+            self.onnx_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _predict(self, inputs: Dict[str, Any]) -> np.ndarray:
+        feed = {}
+        for k, v in inputs.items():
+            if k not in self._input_names:
+                continue
+            if isinstance(v, torch.Tensor):
+                v = v.cpu().numpy()
+            feed[k] = np.asarray(v, dtype=np.int64)
+        return self.session.run(["logits"], feed)[0]
+
+    def status(self) -> Dict[str, Any]:
+        data = super().status()
+        data["device"] = "cpu"
+        data["onnx_path"] = self.onnx_path
+        return data
+
+
+BACKENDS = {
+    TorchBackend.name: TorchBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+
+def create_backend(name: str, model_path: str) -> InferenceBackend:
+    """Tạo backend theo tên; nếu không tạo được ONNX thì quay về PyTorch"""
+    backend_cls = BACKENDS.get(name)
+    if backend_cls is None:
+        raise ValueError(f"Backend không hợp lệ: {name} (hỗ trợ: {', '.join(BACKENDS)})")
+    if backend_cls is TorchBackend:
+        return TorchBackend(model_path)
+    if is_quantized_checkpoint(model_path):
+        logger.warning(f"{model_path} là artifact int8 PyTorch, không export ONNX được. Dùng torch.")
+        return TorchBackend(model_path)
+    try:
+        return backend_cls(model_path)
+    except Exception as e:
+        logger.error(f"Không khởi tạo được backend {name}: {e}. Chuyển sang torch.")
+        return TorchBackend(model_path)
+
+
+def softmax_argmax(logits: np.ndarray):
+    """Trả về (label_ids, scores) từ logits"""
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    probs = np.exp(shifted)
+    probs /= probs.sum(axis=-1, keepdims=True)
+    label_ids = probs.argmax(axis=-1)
+    scores = probs[np.arange(len(label_ids)), label_ids]
+    return label_ids.tolist(), scores.tolist()
@@ -0,0 +1,294 @@
+"""
+Pool tiến trình inference riêng cho intent/sentiment.
+Mỗi worker giữ một bản model, được pin vào một nhóm core và đặt số intra-op
+thread tương ứng, nên inference không tranh GIL với event loop của FastAPI.
+Request/response đi qua multiprocessing Pipe (tuple nhỏ, pickle nhanh).
+"""
+
+import os
+import time
+import threading
+import logging
+import multiprocessing as mp
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_READY = "__ready__"
+_STOP = "__stop__"
+_BUSY = "__busy__"
+
+
+def _split_cores(num_workers: int) -> List[List[int]]:
+    """Chia đều các core mà tiến trình hiện tại được phép dùng cho từng worker"""
+    try:
+        cores = sorted(os.sched_getaffinity(0))
+    except AttributeError:  # Windows / macOS
+        cores = list(range(os.cpu_count() or 1))
+    groups = [cores[i::num_workers] for i in range(num_workers)]
+    return [g if g else cores for g in groups]
+
+
+def _worker_main(conn, worker_id: int, cores: List[int], num_threads: int, max_batch_size: int):
+    """Vòng lặp của tiến trình worker: nhận (request_id, text), trả (request_id, result, error)"""
+    # Tiến trình spawn không kế thừa cấu hình logging của process chính
+    from app.utils.logger import configure_logging
+    configure_logging()
+
+    if cores and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError as e:
+            logger.warning(f"Inference worker {worker_id} không pin được core {cores}: {e}")
+
+    import torch
+    torch.set_num_threads(max(1, num_threads))
+
+    # Import trong worker để mỗi tiến trình tự tải model của riêng nó
+    from app.services import nlp_service
+    nlp_service.load_models()
+
+    conn.send((_READY, worker_id, None))
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message == _STOP:
+            break
+
+        # Gom thêm các request đang chờ sẵn trong pipe thành một batch
+        batch = [message]
+        stop_after = False
+        while len(batch) < max_batch_size and conn.poll(0):
+            nxt = conn.recv()
+            if nxt == _STOP:
+                stop_after = True
+                break
+            batch.append(nxt)
+
+        started = time.perf_counter()
+        try:
+            results = nlp_service.classify_texts([text for _, text in batch])
+            for (request_id, _), result in zip(batch, results):
+                conn.send((request_id, result, None))
+        except Exception as e:
+            for request_id, _ in batch:
+                conn.send((request_id, None, str(e)))
+        conn.send((_BUSY, time.perf_counter() - started, len(batch)))
+
+        if stop_after:
+            break
+    conn.close()
+
+
+class _WorkerHandle:
+    def __init__(self, worker_id: int, process, conn, cores: List[int]):
+        self.worker_id = worker_id
+        self.process = process
+        self.conn = conn
+        self.cores = cores
+        self.send_lock = threading.Lock()
+        # pending / bộ đếm được event loop ghi và reader thread đọc-xóa
+        self.lock = threading.Lock()
+        self.pending: Dict[int, Future] = {}
+        self.ready = False
+        self.alive = True
+        self.busy_seconds = 0.0
+        self.requests = 0
+        self.batches = 0
+
+    def inflight(self) -> int:
+        with self.lock:
+            return len(self.pending)
+
+
+class InferencePool:
+    """Pool N tiến trình inference, gửi request tới worker đang ít việc nhất"""
+
+    def __init__(
+        self,
+        num_workers: int,
+        threads_per_worker: int = 0,
+        pin_cores: bool = True,
+        max_batch_size: int = 16,
+        max_inflight_per_worker: int = 32,
+    ):
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self.pin_cores = pin_cores
+        self.max_batch_size = max_batch_size
+        self.max_inflight_per_worker = max_inflight_per_worker
+        self._workers: List[_WorkerHandle] = []
+        self._next_id = 0
+        self._id_lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        # Kiểm tra _accepting + đăng ký pending của submit nguyên tử với drain()
+        self._accept_lock = threading.Lock()
+        self._accepting = True
+        self._started_at: Optional[float] = None
+        self.saturated_requests = 0
+        self.total_requests = 0
+
+    def start(self):
+        ctx = mp.get_context("spawn")
+        core_groups = _split_cores(self.num_workers)
+        self._started_at = time.monotonic()
+        for worker_id in range(self.num_workers):
+            cores = core_groups[worker_id] if self.pin_cores else []
+            threads = self.threads_per_worker or len(core_groups[worker_id])
+            parent_conn, child_conn = ctx.Pipe(duplex=True)
+            process = ctx.Process(
+                target=_worker_main,
+                args=(child_conn, worker_id, cores, threads, self.max_batch_size),
+                name=f"inference-worker-{worker_id}",
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            handle = _WorkerHandle(worker_id, process, parent_conn, cores)
+            self._workers.append(handle)
+            threading.Thread(
+                target=self._reader, args=(handle,), name=f"inference-reader-{worker_id}", daemon=True
+            ).start()
+        logger.info(f"Đã khởi động {self.num_workers} inference worker")
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Chờ mọi worker tải xong model (gửi READY); False nếu hết thời gian hoặc worker chết"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if all(w.ready for w in self._workers):
+                return True
+            if not any(w.alive for w in self._workers):
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+
+    def _reader(self, handle: _WorkerHandle):
+        while True:
+            try:
+                request_id, payload, error = handle.conn.recv()
+            except (EOFError, OSError):
+                break
+            if request_id == _READY:
+                handle.ready = True
+                logger.info(f"Inference worker {handle.worker_id} sẵn sàng (cores={handle.cores})")
+                continue
+            if request_id == _BUSY:
+                with handle.lock:
+                    handle.busy_seconds += payload
+                    handle.batches += 1
+                continue
+            with handle.lock:
+                future = handle.pending.pop(request_id, None)
+            if future is None:
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(f"Inference worker {handle.worker_id}: {error}"))
+            else:
+                future.set_result(payload)
+
+        handle.alive = False
+        with handle.lock:
+            leftover = list(handle.pending.values())
+            handle.pending.clear()
+        for future in leftover:
+            if not future.done():
+                future.set_exception(RuntimeError(f"Inference worker {handle.worker_id} đã dừng"))
+
+    def _pick_worker(self) -> _WorkerHandle:
+        candidates = [w for w in self._workers if w.alive]
+        if not candidates:
+            raise RuntimeError("Không còn inference worker nào hoạt động")
+        ready = [w for w in candidates if w.ready]
+        if not ready:
+            # Không xếp hàng chờ worker đang tải model: caller chạy inference tại chỗ
+            raise RuntimeError("Chưa có inference worker nào sẵn sàng")
+        loads = [(w.inflight(), w) for w in ready]
+        inflight, worker = min(loads, key=lambda item: item[0])
+        if inflight >= self.max_inflight_per_worker:
+            with self._counters_lock:
+                self.saturated_requests += 1
+        return worker
+
+    def submit(self, text: str) -> Future:
+        with self._id_lock:
+            request_id = self._next_id
+            self._next_id += 1
+        future: Future = Future()
+        # RUNNING: caller hết thời gian chờ (wait_for) không hủy được future,
+        # reader vẫn set kết quả bình thường khi worker trả về
+        future.set_running_or_notify_cancel()
+        with self._accept_lock:
+            if not self._accepting:
+                raise RuntimeError("Inference pool đang dừng")
+            worker = self._pick_worker()
+            with worker.lock:
+                worker.pending[request_id] = future
+                worker.requests += 1
+        with self._counters_lock:
+            self.total_requests += 1
+        try:
+            with worker.send_lock:
+                worker.conn.send((request_id, text))
+        except Exception as e:
+            with worker.lock:
+                worker.pending.pop(request_id, None)
+            future.set_exception(e)
+        return future
+
+    def drain(self, timeout: float) -> bool:
+        """Ngừng nhận request mới rồi chờ các request đang chạy xong; False nếu hết thời gian"""
+        with self._accept_lock:
+            self._accepting = False
+        deadline = time.monotonic() + timeout
+        while any(w.alive and w.inflight() for w in self._workers):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        for worker in self._workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(_STOP)
+            except Exception:
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._workers = []
+
+    def stats(self) -> Dict[str, Any]:
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        workers = []
+        for w in self._workers:
+            with w.lock:
+                inflight, requests, batches, busy = len(w.pending), w.requests, w.batches, w.busy_seconds
+            workers.append({
+                "worker_id": w.worker_id,
+                "pid": w.process.pid,
+                "cores": w.cores,
+                "ready": w.ready,
+                "alive": w.alive and w.process.is_alive(),
+                "inflight": inflight,
+                "requests": requests,
+                "batches": batches,
+                "utilization": busy / uptime if uptime else 0.0,
+            })
+        total_inflight = sum(w["inflight"] for w in workers)
+        capacity = self.max_inflight_per_worker * max(1, len([w for w in self._workers if w.alive]))
+        with self._counters_lock:
+            saturated, total = self.saturated_requests, self.total_requests
+        return {
+            "num_workers": self.num_workers,
+            "inflight": total_inflight,
+            "saturation": total_inflight / capacity,
+            "saturated_requests": saturated,
+            "total_requests": total,
+            "workers": workers,
+        }
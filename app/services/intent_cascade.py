@@ -0,0 +1,163 @@
+"""
+Cascade intent: stage 1 là TF-IDF (char n-gram) + logistic regression train
+trên cùng CSV với PhoBERT. Dự đoán đủ tự tin (thường là lượt ngắn như
+"vâng", "cảm ơn") trả về ngay; còn lại chuyển cho PhoBERT (stage 2).
+"""
+
+import os
+import time
+import threading
+import unicodedata
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.utils.metrics import histogram
+
+logger = logging.getLogger(__name__)
+
+INTENT_CASCADE_ENABLED = os.getenv("INTENT_CASCADE_ENABLED", "false").lower() == "true"
+INTENT_CASCADE_THRESHOLD = float(os.getenv("INTENT_CASCADE_THRESHOLD", "0.9"))
+INTENT_CASCADE_MAX_WORDS = int(os.getenv("INTENT_CASCADE_MAX_WORDS", "8"))  # 0 = không giới hạn
+INTENT_CASCADE_DATASETS = [
+    path.strip()
+    for path in os.getenv("INTENT_CASCADE_DATASETS", "data/extended_dataset_v2.csv").split(",")
+    if path.strip()
+]
+
+# Stage 1 không bao giờ tự kết luận các nhãn này, luôn để PhoBERT quyết định
+_ALWAYS_ESCALATE = {"unknown"}
+
+CONFIDENCE_BUCKETS = (0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.99)
+
+
+def _preprocess(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).casefold().split())
+
+
+def load_dataset(paths: List[str]) -> Tuple[List[str], List[str]]:
+    import pandas as pd
+    frames = [pd.read_csv(path) for path in paths if os.path.exists(path)]
+    if not frames:
+        raise FileNotFoundError(f"Không tìm thấy dataset cho cascade: {paths}")
+    df = pd.concat(frames, ignore_index=True).dropna(subset=["text", "label"])
+    return df["text"].astype(str).tolist(), df["label"].astype(str).tolist()
+
+
+def build_pipeline():
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    return Pipeline([
+        ("tfidf", TfidfVectorizer(
+            preprocessor=_preprocess, analyzer="char_wb", ngram_range=(2, 4), sublinear_tf=True
+        )),
+        ("clf", LogisticRegression(max_iter=2000, C=10.0, class_weight="balanced")),
+    ])
+
+
+class IntentCascade:
+    """Stage 1 của cascade + bộ đếm số lần bỏ qua được PhoBERT"""
+
+    def __init__(
+        self,
+        enabled: bool = INTENT_CASCADE_ENABLED,
+        threshold: float = INTENT_CASCADE_THRESHOLD,
+        max_words: int = INTENT_CASCADE_MAX_WORDS,
+        dataset_paths: Optional[List[str]] = None,
+    ):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_words = max_words
+        self.dataset_paths = dataset_paths or INTENT_CASCADE_DATASETS
+        self.version = 0
+        self._pipeline = None
+        self._trained_samples = 0
+        self._train_seconds = 0.0
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0,
+            "accepted": 0,
+            "escalated_low_confidence": 0,
+            "escalated_long": 0,
+            "escalated_label": 0,
+        }
+        self._confidence = histogram(
+            "cascade_stage1_confidence", CONFIDENCE_BUCKETS, "Stage-1 top-class probability"
+        )
+
+    def is_ready(self) -> bool:
+        return self.enabled and self._pipeline is not None
+
+    def fit(self, texts: List[str], labels: List[str]):
+        started = time.perf_counter()
+        pipeline = build_pipeline()
+        pipeline.fit(texts, labels)
+        with self._lock:
+            # Swap nguyên pipeline; version mới vô hiệu cache kết quả cũ
+            self._pipeline = pipeline
+            self._trained_samples = len(texts)
+            self._train_seconds = time.perf_counter() - started
+            self.version += 1
+        logger.info(
+            f"Cascade stage 1 train xong: {len(texts)} mẫu trong {self._train_seconds * 1000:.0f}ms"
+        )
+
+    def load(self):
+        """Train stage 1 từ dataset (vài trăm mẫu -> vài chục ms); bỏ qua nếu tắt"""
+        if not self.enabled:
+            return
+        texts, labels = load_dataset(self.dataset_paths)
+        self.fit(texts, labels)
+
+    def predict_batch(self, texts: List[str]) -> Tuple[List[str], List[float]]:
+        """Nhãn + xác suất top-1 cho cả batch, không cập nhật bộ đếm (dùng để đánh giá)"""
+        pipeline = self._pipeline
+        probs = pipeline.predict_proba(texts)
+        classes = pipeline.classes_
+        best = probs.argmax(axis=1)
+        return [str(classes[i]) for i in best], [float(probs[row, i]) for row, i in enumerate(best)]
+
+    def predict(self, text: str) -> Optional[Dict[str, Any]]:
+        """Kết quả stage 1 nếu đủ tự tin, None nếu phải chuyển cho PhoBERT"""
+        if not self.is_ready():
+            return None
+        self._count("requests")
+        if self.max_words and len(text.split()) > self.max_words:
+            self._count("escalated_long")
+            return None
+
+        labels, scores = self.predict_batch([text])
+        label, score = labels[0], scores[0]
+        self._confidence.observe(score)
+        if label in _ALWAYS_ESCALATE:
+            self._count("escalated_label")
+            return None
+        if score < self.threshold:
+            self._count("escalated_low_confidence")
+            return None
+        self._count("accepted")
+        return {"label": label, "score": score, "stage": "cascade"}
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        requests = counters["requests"]
+        return {
+            "enabled": self.enabled,
+            "ready": self.is_ready(),
+            "threshold": self.threshold,
+            "max_words": self.max_words,
+            "version": self.version,
+            "trained_samples": self._trained_samples,
+            "train_seconds": self._train_seconds,
+            **counters,
+            "model_skip_rate": counters["accepted"] / requests if requests else 0.0,
+            "stage1_confidence": self._confidence.snapshot(),
+        }
+
+
+intent_cascade = IntentCascade()
@@ -0,0 +1,156 @@
+"""
+Bảng luật keyword cho fallback intent (data/intent_rules.csv: intent, phrase, priority).
+Các phrase được biên dịch một lần thành automaton Aho-Corasick nên mỗi lượt chỉ
+quét text một lần, bất kể số lượng phrase. Khi nhiều phrase cùng khớp, luật có
+priority nhỏ nhất thắng (hòa thì theo thứ tự dòng trong file).
+"""
+
+import csv
+import os
+import time
+import threading
+import unicodedata
+import logging
+from collections import deque
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTENT_RULES_PATH = os.getenv("INTENT_RULES_PATH", "data/intent_rules.csv")
+
+
+class RuleMatch(NamedTuple):
+    intent: str
+    phrase: str
+    priority: int
+
+
+def normalize_rule_text(text: str) -> str:
+    """NFC + casefold + gộp khoảng trắng (giữ dấu câu để xác định ranh giới từ)"""
+    return " ".join(unicodedata.normalize("NFC", text).casefold().split())
+
+
+class _Automaton:
+    """Aho-Corasick trên ký tự; mỗi trạng thái kết thúc lưu đúng một luật"""
+
+    def __init__(self, rules: List[Tuple[str, Tuple[int, int], RuleMatch]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.terminal: List[Optional[Tuple[Tuple[int, int], int, RuleMatch]]] = [None]
+        self.dict_link: List[int] = [0]  # trạng thái terminal gần nhất theo chuỗi fail
+
+        for phrase, rank, rule in rules:
+            state = 0
+            for ch in phrase:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.terminal.append(None)
+                    self.dict_link.append(0)
+                state = nxt
+            current = self.terminal[state]
+            if current is None or rank < current[0]:
+                self.terminal[state] = (rank, len(phrase), rule)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                fail_state = self.fail[nxt]
+                self.dict_link[nxt] = fail_state if self.terminal[fail_state] is not None else self.dict_link[fail_state]
+
+    def best_match(self, text: str) -> Optional[RuleMatch]:
+        best = None
+        state = 0
+        for end, ch in enumerate(text):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            candidate = state if self.terminal[state] is not None else self.dict_link[state]
+            while candidate:
+                rank, length, rule = self.terminal[candidate]
+                if best is None or rank < best[0]:
+                    start = end - length + 1
+                    # Chỉ khớp nguyên từ/cụm từ: "tệ" không khớp trong "tệp"
+                    if (start == 0 or not text[start - 1].isalnum()) and \
+                            (end + 1 == len(text) or not text[end + 1].isalnum()):
+                        best = (rank, rule)
+                candidate = self.dict_link[candidate]
+        return best[1] if best is not None else None
+
+
+class IntentRuleMatcher:
+    """Automaton luật fallback, nạp lại được lúc chạy (swap nguyên automaton)"""
+
+    def __init__(self, path: str = INTENT_RULES_PATH):
+        self.path = path
+        self.version = 0
+        self.loaded_at: Optional[float] = None
+        self.rule_count = 0
+        self.intents: List[str] = []
+        self.last_error: Optional[str] = None
+        self._automaton = _Automaton([])
+        self._lock = threading.Lock()
+        try:
+            self.reload()
+        except Exception as e:
+            logger.error(f"Không nạp được bảng luật intent {path}: {e}")
+
+    def _read_rules(self) -> List[Tuple[str, Tuple[int, int], RuleMatch]]:
+        rules = []
+        with open(self.path, "r", encoding="utf-8", newline="") as f:
+            for row_idx, row in enumerate(csv.DictReader(f)):
+                phrase = normalize_rule_text(row.get("phrase") or "")
+                intent = (row.get("intent") or "").strip()
+                if not phrase or not intent:
+                    continue
+                priority = int(row.get("priority") or 0)
+                rules.append((phrase, (priority, row_idx), RuleMatch(intent, phrase, priority)))
+        return rules
+
+    def reload(self, path: Optional[str] = None) -> Dict[str, Any]:
+        """Đọc lại bảng luật và biên dịch automaton mới; lỗi thì giữ automaton cũ"""
+        with self._lock:
+            if path:
+                self.path = path
+            try:
+                rules = self._read_rules()
+                automaton = _Automaton(rules)
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            self._automaton = automaton
+            self.rule_count = len(rules)
+            self.intents = sorted({rule.intent for _, _, rule in rules})
+            self.version += 1
+            self.loaded_at = time.time()
+            self.last_error = None
+        logger.info(f"Đã nạp {self.rule_count} luật intent từ {self.path} (version {self.version})")
+        return self.stats()
+
+    def match(self, text: str) -> Optional[RuleMatch]:
+        """Luật có priority cao nhất khớp với text, None nếu không luật nào khớp"""
+        return self._automaton.best_match(normalize_rule_text(text))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "version": self.version,
+            "rules": self.rule_count,
+            "intents": self.intents,
+            "states": len(self._automaton.goto),
+            "loaded_at": self.loaded_at,
+            "last_error": self.last_error,
+        }
+
+
+intent_rules = IntentRuleMatcher()
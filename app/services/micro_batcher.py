@@ -0,0 +1,155 @@
+"""
+Micro-batching cho inference.
+Gom các request đơn lẻ (từ nhiều thread) thành batch nhỏ trong một cửa sổ
+thời gian ngắn, chạy một lần forward có padding rồi trả kết quả về đúng caller.
+"""
+
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Dict, Tuple
+
+from app.utils.metrics import histogram
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+QUEUE_WAIT_MS_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class _Request:
+    __slots__ = ("item", "future", "enqueued_at")
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class MicroBatcher:
+    """
+    Gom request thành batch theo max_batch_size hoặc max_wait_ms (tính từ
+    request đầu tiên của batch), cái nào tới trước.
+
+    batch_fn nhận list item và phải trả về list kết quả cùng độ dài, cùng thứ tự.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        name: str = "intent",
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size phải >= 1")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.name = name
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # Kiểm tra _stopped + put của submit và việc đặt _STOP của stop phải nguyên tử,
+        # nếu không request lọt vào sau _STOP sẽ không bao giờ được xử lý
+        self._submit_lock = threading.Lock()
+        self._stopped = False
+        self.batch_size_hist = histogram(
+            f"{name}_batch_size", BATCH_SIZE_BUCKETS, "Số request trong mỗi forward pass"
+        )
+        self.queue_wait_hist = histogram(
+            f"{name}_queue_wait_ms", QUEUE_WAIT_MS_BUCKETS, "Thời gian chờ trong hàng đợi (ms)"
+        )
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = threading.Thread(
+                    target=self._run, name=f"{self.name}-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """Đưa một item vào hàng đợi, trả về Future chứa kết quả riêng của item đó"""
+        with self._submit_lock:
+            if self._stopped:
+                raise RuntimeError(f"MicroBatcher '{self.name}' đã dừng")
+            self._ensure_started()
+            request = _Request(item)
+            self._queue.put(request)
+        return request.future
+
+    def __call__(self, item: Any, timeout: Optional[float] = None) -> Any:
+        return self.submit(item).result(timeout=timeout)
+
+    def stop(self, timeout: float = 5.0):
+        """Dừng worker thread sau khi xử lý hết các request đang chờ"""
+        with self._submit_lock:
+            self._stopped = True
+            running = self._thread is not None and self._thread.is_alive()
+            if running:
+                self._queue.put(_STOP)
+        if running:
+            self._thread.join(timeout=timeout)
+
+    def _collect(self, first: _Request) -> Tuple[List[_Request], bool]:
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait_ms / 1000.0
+        stop_requested = False
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                nxt = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is _STOP:
+                stop_requested = True
+                break
+            batch.append(nxt)
+        return batch, stop_requested
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch, stop_requested = self._collect(first)
+
+            started = time.monotonic()
+            for request in batch:
+                self.queue_wait_hist.observe((started - request.enqueued_at) * 1000.0)
+            self.batch_size_hist.observe(len(batch))
+
+            try:
+                results = self.batch_fn([request.item for request in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"batch_fn trả về {len(results)} kết quả cho {len(batch)} request"
+                    )
+            except Exception as e:
+                logger.error(f"[MicroBatcher:{self.name}] Lỗi khi chạy batch: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+            else:
+                for request, result in zip(batch, results):
+                    request.future.set_result(result)
+
+            if stop_requested:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_depth": self._queue.qsize(),
+            "running": self._thread is not None and self._thread.is_alive(),
+            "batch_size": self.batch_size_hist.snapshot(),
+            "queue_wait_ms": self.queue_wait_hist.snapshot(),
+        }
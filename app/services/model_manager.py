@@ -1,12 +1,78 @@
 import threading
 import os
+import csv
+import time
 import logging
+import weakref
 import torch
+from dataclasses import dataclass
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Dict, Any, Callable, List
+from app.services.inference_backends import InferenceBackend, create_backend
+from app.services.tokenization import encode_batch, bucket_length, NLP_LENGTH_BUCKETS, NLP_MAX_TOKENS
+from app.utils.metrics import histogram
 
 logger = logging.getLogger(__name__)
 
+# Backend inference cho intent model: "torch" (eager) hoặc "onnx" (ONNX Runtime CPU)
+INTENT_BACKEND = os.getenv("INTENT_BACKEND", "torch").lower()
+# Ưu tiên biến thể int8 (tạo bởi quantize_intent_model.py) nếu có cạnh checkpoint gốc
+INTENT_PREFER_INT8 = os.getenv("INTENT_PREFER_INT8", "false").lower() == "true"
+
+# Warm-up sau mỗi lần load: vài câu mỗi intent từ dataset train ở các độ dài điển hình
+MODEL_WARMUP_ENABLED = os.getenv("MODEL_WARMUP_ENABLED", "true").lower() == "true"
+MODEL_WARMUP_DATASET = os.getenv("MODEL_WARMUP_DATASET", "data/extended_dataset_v2.csv")
+MODEL_WARMUP_PER_INTENT = int(os.getenv("MODEL_WARMUP_PER_INTENT", "3"))
+MODEL_WARMUP_BATCH_SIZES = [int(x) for x in os.getenv("MODEL_WARMUP_BATCH_SIZES", "1,16").split(",") if x.strip()]
+# Tối ưu graph cho backend torch: none | trace (TorchScript theo shape warm-up) | compile (torch.compile)
+MODEL_COMPILE = os.getenv("MODEL_COMPILE", "none").lower()
+
+WARMUP_SECONDS_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+_warmup_texts_cache: Optional[List[str]] = None
+
+def load_warmup_texts() -> List[str]:
+    """Chọn MODEL_WARMUP_PER_INTENT câu mỗi intent, trải đều theo phân vị độ dài"""
+    global _warmup_texts_cache
+    if _warmup_texts_cache is not None:
+        return _warmup_texts_cache
+    by_label: Dict[str, List[str]] = {}
+    try:
+        with open(MODEL_WARMUP_DATASET, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if row.get('text') and row.get('label'):
+                    by_label.setdefault(row['label'], []).append(row['text'])
+    except Exception as e:
+        logger.warning(f"Không đọc được dataset warm-up {MODEL_WARMUP_DATASET}: {str(e)}")
+    texts = []
+    n = max(1, MODEL_WARMUP_PER_INTENT)
+    for label_texts in by_label.values():
+        label_texts = sorted(label_texts, key=len)
+        picks = {int((i + 0.5) * len(label_texts) / n) for i in range(n)}
+        texts.extend(label_texts[i] for i in sorted(picks) if i < len(label_texts))
+    _warmup_texts_cache = texts or ["xin chào"]
+    return _warmup_texts_cache
+
+def int8_variant_path(path: str) -> str:
+    """models/phobert-intent-v3/final -> models/phobert-intent-v3-int8/final"""
+    path = os.path.normpath(path)
+    return os.path.join(os.path.dirname(path) + '-int8', os.path.basename(path))
+
+@dataclass(frozen=True)
+class ModelSnapshot:
+    """
+    Bộ (model, tokenizer, backend, version) bất biến.
+    Reader chỉ đọc tham chiếu hiện tại (phép gán thuộc tính là atomic), không cần lock;
+    request đang chạy giữ tham chiếu tới snapshot cũ nên vẫn hoàn tất trên model cũ.
+    """
+    model: Optional[AutoModelForSequenceClassification]
+    tokenizer: AutoTokenizer
+    backend: InferenceBackend
+    version: int
+    path: str
+    loaded_at: float
+    warmup_seconds: float = 0.0
+
 class ModelManager:
     _instance = None
     _lock = threading.Lock()
@@ -21,106 +87,217 @@ class ModelManager:
     
     def __init__(self):
         if not self._initialized:
-            self._model = None
-            self._tokenizer = None
+            self._snapshot: Optional[ModelSnapshot] = None
+            self._backend_name = INTENT_BACKEND
             # Ưu tiên retrained model → v3 → classifier cũ (production waterfall)
             retrained_path = os.path.abspath('./models/phobert-intent-v3-retrain-20251023_232548/final')
             v3_path = os.path.abspath('./models/phobert-intent-v3/final')
             old_path = os.path.abspath('./models/phobert-intent-classifier')
             
-            if os.path.exists(retrained_path):
-                self._model_path = retrained_path
-            elif os.path.exists(v3_path):
-                self._model_path = v3_path
-            else:
-                self._model_path = old_path
+            candidates = []
+            for path in (retrained_path, v3_path):
+                if INTENT_PREFER_INT8:
+                    candidates.append(int8_variant_path(path))
+                candidates.append(path)
+            
+            self._model_path = next((c for c in candidates if os.path.exists(c)), old_path)
             
-            self._model_lock = threading.Lock()
+            # Chỉ serialize các lần load với nhau, không bao giờ chặn reader
+            self._load_lock = threading.Lock()
             self._version = 0
-            # Lưu trữ phiên bản trước để rollback
-            self._previous_model = None
-            self._previous_tokenizer = None
-            self._previous_path = None
+            self._reload_thread: Optional[threading.Thread] = None
+            self._last_reload_error: Optional[str] = None
+            # Snapshot đã bị thay thế nhưng còn request đang dùng (weakref, tự mất khi drain xong)
+            self._retired: List[weakref.ref] = []
+            self._listeners: List[Callable[[ModelSnapshot], None]] = []
             self._initialized = True
-            self.load_model()
+            # Không tải model khi import: app startup gọi ensure_loaded() ở background
+    
+    def _build_snapshot(self, path: str) -> ModelSnapshot:
+        """Tải tokenizer + backend và warm-up, chưa publish"""
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Không tìm thấy mô hình tại {path}")
+        # Tải tokenizer và backend (torch: model eager, onnx: session export từ checkpoint)
+        tokenizer = AutoTokenizer.from_pretrained(path)
+        backend = create_backend(self._backend_name, path)
+        if MODEL_COMPILE != "none" and hasattr(backend, "compile"):
+            backend.compile(MODEL_COMPILE)
+        warmup_seconds = self._warm_up(backend, tokenizer)
+        return ModelSnapshot(
+            model=getattr(backend, "model", None),
+            tokenizer=tokenizer,
+            backend=backend,
+            version=self._version + 1,
+            path=path,
+            loaded_at=time.time(),
+            warmup_seconds=warmup_seconds
+        )
+    
+    def _warm_up(self, backend: InferenceBackend, tokenizer: AutoTokenizer) -> float:
+        """
+        Chạy bộ warm-up (từng câu và theo batch) để khởi tạo lazy state của
+        transformers/torch và trace các shape thường gặp, trước khi publish
+        """
+        started = time.perf_counter()
+        texts = load_warmup_texts() if MODEL_WARMUP_ENABLED else ["xin chào"]
+        batch_sizes = MODEL_WARMUP_BATCH_SIZES if MODEL_WARMUP_ENABLED else [1]
+        # Cùng tokenization với lúc phục vụ; pad lên từng bucket để mọi shape đều được warm-up/trace.
+        # NLP_MAX_TOKENS luôn có: câu dài hơn bucket lớn nhất được pad tới đó (bucket_length)
+        buckets = sorted(
+            {bucket_length(1), NLP_MAX_TOKENS} | {b for b in NLP_LENGTH_BUCKETS if b <= NLP_MAX_TOKENS}
+        )
+        for batch_size in batch_sizes:
+            for i in range(0, len(texts), max(1, batch_size)):
+                batch = texts[i:i + batch_size]
+                for bucket in buckets:
+                    backend.predict_logits(encode_batch(tokenizer, batch, pad_to=bucket))
+        if hasattr(backend, "finish_tracing"):
+            backend.finish_tracing()
+        backend.mark_ready()
+        elapsed = time.perf_counter() - started
+        histogram(
+            "model_warmup_seconds", WARMUP_SECONDS_BUCKETS,
+            "Thời gian warm-up model trước khi publish (s)", labels={"backend": backend.name},
+        ).observe(elapsed)
+        logger.info(f"Warm-up {len(texts)} câu x batch {batch_sizes} trong {elapsed:.2f}s")
+        return elapsed
+    
+    def _publish(self, snapshot: ModelSnapshot):
+        old = self._snapshot
+        self._snapshot = snapshot  # atomic swap
+        self._version = snapshot.version
+        self._model_path = snapshot.path
+        if old is not None:
+            weakref.finalize(old, logger.info, f"Đã giải phóng snapshot version {old.version}")
+            self._retired.append(weakref.ref(old))
+            del old
+        self._retired = [r for r in self._retired if r() is not None]
+    
+    def _notify(self, snapshot: ModelSnapshot):
+        """Chạy reload listener; gọi sau khi đã nhả _load_lock để listener
+        (vd. dựng lại inference pool) không chặn các lần load khác"""
+        for listener in list(self._listeners):
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"Lỗi trong reload listener: {str(e)}")
     
     def load_model(self, path: Optional[str] = None) -> Tuple[AutoModelForSequenceClassification, AutoTokenizer]:
         """
-        Tải mô hình và tokenizer một cách an toàn với thread
+        Tải mô hình mới, warm-up rồi publish snapshot (đồng bộ)
         """
         try:
-            p = path or self._model_path
-            if not os.path.exists(p):
-                raise FileNotFoundError(f"Không tìm thấy mô hình tại {p}")
-            
-            with self._model_lock:
-                # Tải tokenizer và mô hình
-                tokenizer = AutoTokenizer.from_pretrained(p)
-                model = AutoModelForSequenceClassification.from_pretrained(p)
-                
-                # Chuyển mô hình sang GPU nếu có
-                if torch.cuda.is_available():
-                    model = model.cuda()
-                model.eval()
-                
-                # Cập nhật state
-                self._tokenizer = tokenizer
-                self._model = model
-                self._model_path = p
-                self._version += 1
-                
-                logger.info(f"Đã tải mô hình thành công (version {self._version})")
-                return model, tokenizer
-                
+            with self._load_lock:
+                snapshot = self._build_snapshot(path or self._model_path)
+                self._publish(snapshot)
+            self._notify(snapshot)
+            logger.info(f"Đã tải mô hình thành công (version {snapshot.version}, backend {snapshot.backend.name})")
+            return snapshot.model, snapshot.tokenizer
         except Exception as e:
             logger.error(f"Lỗi khi tải mô hình: {str(e)}")
             raise
     
+    def ensure_loaded(self) -> ModelSnapshot:
+        """
+        Tải model nếu chưa có snapshot. Nếu một thread khác đang tải thì chờ nó
+        thay vì tải lần thứ hai.
+        """
+        published = None
+        with self._load_lock:
+            if self._snapshot is None:
+                published = self._build_snapshot(self._model_path)
+                self._publish(published)
+                logger.info(f"Đã tải mô hình thành công (version {published.version}, backend {published.backend.name})")
+            snapshot = self._snapshot
+        if published is not None:
+            self._notify(published)
+        return snapshot
+    
+    def get_snapshot(self) -> Optional[ModelSnapshot]:
+        """
+        Snapshot hiện tại, không lock. Caller nên giữ tham chiếu này suốt một request.
+        Trả về None khi model chưa sẵn sàng (đang tải ở background hoặc tải lỗi).
+        """
+        return self._snapshot
+    
     def get_model(self) -> Tuple[Optional[AutoModelForSequenceClassification], Optional[AutoTokenizer]]:
         """
-        Lấy mô hình và tokenizer hiện tại một cách an toàn với thread
+        Lấy mô hình và tokenizer hiện tại.
+        Với backend onnx, model PyTorch là None — dùng get_backend() để inference.
+        """
+        snapshot = self.get_snapshot()
+        if snapshot is None:
+            return None, None
+        return snapshot.model, snapshot.tokenizer
+    
+    def get_backend(self) -> Tuple[Optional[InferenceBackend], Optional[AutoTokenizer]]:
         """
-        with self._model_lock:
-            if self._model is None or self._tokenizer is None:
-                try:
-                    return self.load_model()
-                except Exception as e:
-                    logger.error(f"Lỗi khi tải mô hình: {str(e)}")
-                    return None, None
-            return self._model, self._tokenizer
+        Lấy backend inference và tokenizer hiện tại
+        """
+        snapshot = self.get_snapshot()
+        if snapshot is None:
+            return None, None
+        return snapshot.backend, snapshot.tokenizer
+    
+    def add_reload_listener(self, listener: Callable[[ModelSnapshot], None]):
+        """Đăng ký callback chạy sau mỗi lần publish snapshot mới"""
+        self._listeners.append(listener)
     
-    def reload_model(self, path: Optional[str] = None) -> bool:
+    def get_status(self) -> Dict[str, Any]:
         """
-        Tải lại mô hình một cách an toàn với thread và khả năng rollback
+        Trạng thái mô hình hiện tại (backend, đường dẫn, version) cho monitoring
         """
+        snapshot = self._snapshot
+        status = {
+            "loaded": snapshot is not None,
+            "configured_backend": self._backend_name,
+            "model_path": self._model_path,
+            "version": self._version,
+            "reload_in_progress": self.is_reloading(),
+            "last_reload_error": self._last_reload_error,
+            "retired_snapshots_in_use": len([r for r in self._retired if r() is not None]),
+        }
+        status["ready"] = snapshot is not None
+        if snapshot is not None:
+            status["loaded_at"] = snapshot.loaded_at
+            status["warmup_seconds"] = snapshot.warmup_seconds
+            status.update(snapshot.backend.status())
+        return status
+    
+    def is_ready(self) -> bool:
+        """Model chỉ được coi là sẵn sàng khi đã warm-up xong và publish"""
+        return self._snapshot is not None
+    
+    def is_reloading(self) -> bool:
+        return self._reload_thread is not None and self._reload_thread.is_alive()
+    
+    def _reload(self, path: Optional[str]) -> bool:
         try:
-            with self._model_lock:
-                # Lưu trạng thái hiện tại để rollback
-                self._previous_model = self._model
-                self._previous_tokenizer = self._tokenizer
-                self._previous_path = self._model_path
-                
-                # Thử tải mô hình mới
-                self.load_model(path)
-                return True
-                
+            self.load_model(path)
+            self._last_reload_error = None
+            return True
         except Exception as e:
-            logger.error(f"Lỗi khi tải lại mô hình: {str(e)}")
-            # Thử rollback về phiên bản trước
-            if self._previous_model is not None:
-                logger.info("Đang rollback về phiên bản trước...")
-                try:
-                    with self._model_lock:
-                        self._model = self._previous_model
-                        self._tokenizer = self._previous_tokenizer
-                        self._model_path = self._previous_path
-                        self._version -= 1
-                    logger.info("Rollback thành công")
-                    return True
-                except Exception as rollback_error:
-                    logger.error(f"Lỗi khi rollback: {str(rollback_error)}")
+            # Snapshot cũ vẫn đang phục vụ, không cần rollback
+            self._last_reload_error = str(e)
+            logger.error(f"Lỗi khi tải lại mô hình, giữ version {self._version}: {str(e)}")
             return False
     
+    def reload_model(self, path: Optional[str] = None, background: bool = False) -> bool:
+        """
+        Tải lại mô hình. Model mới được tải và warm-up hoàn toàn trước khi publish;
+        nếu lỗi, snapshot hiện tại giữ nguyên.
+        background=True: chạy trong thread riêng, trả về False nếu đang có reload khác.
+        """
+        if not background:
+            return self._reload(path)
+        if self.is_reloading():
+            return False
+        self._reload_thread = threading.Thread(
+            target=self._reload, args=(path,), name="model-reload", daemon=True
+        )
+        self._reload_thread.start()
+        return True
+    
     def get_version(self) -> int:
         """
         Lấy version hiện tại của mô hình
@@ -137,5 +314,26 @@ def load_model(path: Optional[str] = None):
 def get_model():
     return _manager.get_model()
 
-def reload_model(path: Optional[str] = None):
-    return _manager.reload_model(path)
+def reload_model(path: Optional[str] = None, background: bool = False):
+    return _manager.reload_model(path, background=background)
+
+def get_version() -> int:
+    return _manager.get_version()
+
+def get_snapshot():
+    return _manager.get_snapshot()
+
+def ensure_loaded():
+    return _manager.ensure_loaded()
+
+def get_backend():
+    return _manager.get_backend()
+
+def get_model_status():
+    return _manager.get_status()
+
+def is_model_ready() -> bool:
+    return _manager.is_ready()
+
+def add_reload_listener(listener):
+    _manager.add_reload_listener(listener)
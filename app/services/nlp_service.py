@@ -1,11 +1,31 @@
+import torch
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
 import os
 import json
-from app.services.model_manager import get_model, reload_model
+import logging
+import contextvars
+import threading
+from app.services.model_manager import (
+    get_model, get_backend, get_snapshot, reload_model, get_model_status, add_reload_listener,
+    ensure_loaded as ensure_model_loaded,
+    get_version as get_model_version
+)
+from app.services.inference_backends import softmax_argmax
+from app.services.intent_cascade import intent_cascade
+from app.services.intent_rules import intent_rules
+from app.services.entity_extractor import extract_entities, format_entities
+from app.services.micro_batcher import MicroBatcher
+from app.services.tokenization import canonical_text, encode_batch, get_tokenization_stats
+from app.utils.cache import TTLCache
+from app.utils.timing import span
+from app.utils.logger import debug_sampled
 from app.services.rl_threshold_tuner import get_tuner
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 # We'll import `pipeline` lazily because importing it at module import time
 # can pull optional heavy dependencies (torch/torchvision) that may not be
 # available or compatible in the runtime where the FastAPI app starts.
@@ -13,9 +33,9 @@ try:
     from transformers import pipeline as hf_pipeline
 except Exception as e:
     hf_pipeline = None
-    print(f"Warning: transformers.pipeline not available at import time: {e}")
+    logger.warning(f"transformers.pipeline not available at import time: {e}")
 
-print("Initializing NLP service and trying to load intent model from model_manager...")
+logger.info("Initializing NLP service (models are loaded in the background by load_models)")
 
 # Load per-intent confidence thresholds
 CONFIDENCE_THRESHOLDS = {}
@@ -25,7 +45,7 @@ try:
         with open(config_path, 'r', encoding='utf-8') as f:
             config = json.load(f)
             CONFIDENCE_THRESHOLDS = config.get('confidence_thresholds', {})
-        print(f"Loaded confidence thresholds: {CONFIDENCE_THRESHOLDS}")
+        logger.info(f"Loaded confidence thresholds: {CONFIDENCE_THRESHOLDS}")
     else:
         # Fallback thresholds if config not found
         CONFIDENCE_THRESHOLDS = {
@@ -41,9 +61,9 @@ try:
               'khieu_nai': 0.85,
               'yeu_cau_ho_tro': 0.85
         }
-        print(f"Using default confidence thresholds")
+        logger.info("Using default confidence thresholds")
 except Exception as e:
-    print(f"Error loading confidence thresholds: {e}")
+    logger.error(f"Error loading confidence thresholds: {e}")
     CONFIDENCE_THRESHOLDS = {
         'dat_lich': 0.70,
         'hoi_thong_tin': 0.65,
@@ -52,50 +72,212 @@ except Exception as e:
         'tam_biet': 0.75
     }
 
-# helper to get a callable classifier (pipeline) from the live model
+# --- Micro-batching cho intent inference ---
+# Gom các utterance đến gần như đồng thời thành một forward pass có padding.
+NLP_BATCHING_ENABLED = os.getenv("NLP_BATCHING_ENABLED", "true").lower() == "true"
+NLP_BATCH_MAX_SIZE = int(os.getenv("NLP_BATCH_MAX_SIZE", "16"))
+NLP_BATCH_WAIT_MS = float(os.getenv("NLP_BATCH_WAIT_MS", "5"))
+
+NLP_FUSED_INFERENCE = os.getenv("NLP_FUSED_INFERENCE", "false").lower() == "true"
+SENTIMENT_MODEL_NAME = "vinai/phobert-base-vietnamese-sentiment"
+
+# Thread riêng cho forward pass sentiment, chạy song song với forward pass intent
+# (torch nhả GIL trong các op nặng nên hai encoder thực sự chạy đồng thời).
+_sentiment_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sentiment") if NLP_FUSED_INFERENCE else None
+_shared_tokenizer_cache: Dict[str, Any] = {"version": None, "shared": False}
+
+def _forward(model, inputs) -> Tuple[List[int], List[float]]:
+    device = next(model.parameters()).device
+    inputs = {k: v.to(device) for k, v in inputs.items()}
+    with torch.no_grad():
+        logits = model(**inputs).logits
+    scores, label_ids = torch.softmax(logits, dim=-1).max(dim=-1)
+    return label_ids.tolist(), scores.tolist()
+
+def _tokenizer_is_shared(intent_tokenizer, version: int) -> bool:
+    """Intent model và sentiment model cùng gốc PhoBERT -> chỉ tokenize một lần nếu vocab trùng"""
+    if _shared_tokenizer_cache["version"] != version:
+        shared = False
+        try:
+            shared = sentiment_tokenizer is not None and intent_tokenizer.get_vocab() == sentiment_tokenizer.get_vocab()
+        except Exception as e:
+            logger.warning(f"Khong so sanh duoc vocab tokenizer: {e}")
+        _shared_tokenizer_cache.update(version=version, shared=shared)
+        logger.info(f"Fused inference: shared tokenizer = {shared}")
+    return _shared_tokenizer_cache["shared"]
+
+def _classify_sentiment_batch(texts: List[str], inputs=None) -> List[str]:
+    if inputs is None:
+        inputs = encode_batch(sentiment_tokenizer, texts, cache_namespace=("sentiment", SENTIMENT_MODEL_NAME))
+    with span("sentiment_forward"):
+        label_ids, _ = _forward(sentiment_model, inputs)
+    id2label = sentiment_model.config.id2label
+    return [id2label[int(label_id)] for label_id in label_ids]
+
+def _classify_intent_batch(texts: List[str]) -> List[Dict[str, Any]]:
+    """Chạy một forward pass (padding theo bucket độ dài) cho cả batch.
+
+    Ở chế độ fused, tokenize một lần và chạy encoder sentiment song song,
+    mỗi kết quả có thêm khóa 'sentiment'.
+    """
+    snapshot = get_snapshot()
+    if snapshot is None:
+        raise RuntimeError("Intent model chưa được tải")
+    backend, tokenizer = snapshot.backend, snapshot.tokenizer
+    with span("tokenize"):
+        inputs = encode_batch(tokenizer, texts, cache_namespace=("intent", snapshot.version))
+
+    sentiment_future = None
+    if _sentiment_executor is not None and sentiment_model is not None:
+        shared_inputs = inputs if _tokenizer_is_shared(tokenizer, snapshot.version) else None
+        sentiment_future = _sentiment_executor.submit(_classify_sentiment_batch, texts, shared_inputs)
+
+    with span("intent_forward"):
+        label_ids, scores = softmax_argmax(backend.predict_logits(inputs))
+    id2label = backend.id2label
+    results = [
+        {"label": id2label[int(label_id)], "score": float(score)}
+        for label_id, score in zip(label_ids, scores)
+    ]
+
+    if sentiment_future is not None:
+        try:
+            for result, sentiment_label in zip(results, sentiment_future.result()):
+                result["sentiment"] = sentiment_label
+        except Exception as e:
+            # Intent vẫn dùng được, sentiment sẽ được tính lại riêng
+            logger.warning(f"Loi khi chay sentiment fused: {e}")
+    return results
+
+def _classify_intent_single(text: str) -> Dict[str, Any]:
+    return _classify_intent_batch([text])[0]
+
+intent_batcher = MicroBatcher(
+    _classify_intent_batch,
+    max_batch_size=NLP_BATCH_MAX_SIZE,
+    max_wait_ms=NLP_BATCH_WAIT_MS,
+    name="intent"
+) if NLP_BATCHING_ENABLED else None
+
+# helper to get a callable classifier from the live model
 def _get_intent_classifier():
-    model, tokenizer = get_model()
-    if model is None or tokenizer is None:
+    backend, tokenizer = get_backend()
+    if backend is None or tokenizer is None:
         return None
-    if hf_pipeline is None:
-        return None
-    return hf_pipeline("text-classification", model=model, tokenizer=tokenizer)
+    return intent_batcher if intent_batcher is not None else _classify_intent_single
+
+# Được gán bởi _on_model_published khi ModelManager publish snapshot đầu tiên
+intent_classifier = None
 
-intent_classifier = _get_intent_classifier()
+def reload_intent_model(path: str = None, background: bool = False) -> bool:
+    """Reload model from disk (or given path).
 
-def reload_intent_model(path: str = None):
-    """Reload model from disk (or given path) and refresh pipeline."""
+    Model mới được tải + warm-up trước khi publish; request đang chạy hoàn tất trên
+    snapshot cũ. background=True trả về ngay (False nếu đang có reload khác).
+    """
     try:
-        reload_model(path)
-        global intent_classifier
-        intent_classifier = _get_intent_classifier()
-        return True
+        return reload_model(path, background=background)
     except Exception as e:
-        print(f"Failed to reload model: {e}")
+        logger.error(f"Failed to reload model: {e}")
         return False
 
+def _on_model_published(snapshot):
+    """Sau khi có snapshot mới: làm mới classifier và thay inference worker"""
+    global intent_classifier
+    intent_classifier = _get_intent_classifier()
+    # Worker giữ bản model riêng -> dựng pool mới, chờ sẵn sàng rồi mới xả và dừng pool cũ.
+    # Pool vừa khởi động cho đúng version này (snapshot đầu tiên) thì giữ nguyên.
+    if inference_pool is not None and snapshot.version != _pool_model_version:
+        restart_inference_pool(snapshot.version)
+
+add_reload_listener(_on_model_published)
+
+def get_inference_stats() -> Dict[str, Any]:
+    """Thống kê micro-batching (batch size, queue wait) và result cache cho monitoring"""
+    return {
+        "model": get_model_status(),
+        "batching_enabled": intent_batcher is not None,
+        "fused_inference": NLP_FUSED_INFERENCE and sentiment_model is not None,
+        "model_loaded": intent_classifier is not None,
+        "intent_batcher": intent_batcher.stats() if intent_batcher is not None else None,
+        "result_cache": _result_cache.stats(),
+        "cascade": intent_cascade.stats(),
+        "fallback_rules": intent_rules.stats(),
+        "tokenization": get_tokenization_stats(),
+        "inference_pool": inference_pool.stats() if inference_pool is not None else None,
+        "log_writer": log_writer.stats(),
+        "call_analytics": call_analytics.stats(),
+    }
+
 
 # --- 2. Tải Model Sentiment (Từ HuggingFace) ---
-print("Dang tai model Vietnamese Sentiment...")
-try:
-    if hf_pipeline is None:
-        raise RuntimeError("transformers.pipeline is not available")
-    sentiment_classifier = hf_pipeline(
-        "text-classification",
-        model="vinai/phobert-base-vietnamese-sentiment"
-    )
-    print("Tai model Sentiment thanh cong!")
-except Exception as e:
-    print(f"LOI KHI TAI MODEL SENTIMENT: {e}. Chuyen sang fallback.")
-    sentiment_classifier = None
+# Chế độ fused giữ model + tokenizer trực tiếp (không qua pipeline) để dùng chung
+# bước tokenize với intent model; chế độ thường giữ HF pipeline như trước.
+sentiment_classifier = None
+sentiment_model = None
+sentiment_tokenizer = None
+
+def _fused_sentiment_classifier(text: str) -> List[Dict[str, Any]]:
+    return [{"label": _classify_sentiment_batch([text])[0]}]
+
+def load_sentiment_model():
+    """Tải model sentiment; lỗi thì giữ fallback 'neutral' và raise lại cho readiness"""
+    global sentiment_classifier, sentiment_model, sentiment_tokenizer
+    logger.info("Dang tai model Vietnamese Sentiment...")
+    try:
+        if NLP_FUSED_INFERENCE:
+            tokenizer = AutoTokenizer.from_pretrained(SENTIMENT_MODEL_NAME)
+            model = AutoModelForSequenceClassification.from_pretrained(SENTIMENT_MODEL_NAME)
+            if torch.cuda.is_available():
+                model = model.cuda()
+            model.eval()
+            sentiment_tokenizer, sentiment_model = tokenizer, model
+            sentiment_classifier = _fused_sentiment_classifier
+        else:
+            if hf_pipeline is None:
+                raise RuntimeError("transformers.pipeline is not available")
+            sentiment_classifier = hf_pipeline(
+                "text-classification",
+                model=SENTIMENT_MODEL_NAME
+            )
+        logger.info("Tai model Sentiment thanh cong!")
+    except Exception as e:
+        logger.error(f"LOI KHI TAI MODEL SENTIMENT: {e}. Chuyen sang fallback.")
+        sentiment_classifier = None
+        sentiment_model = None
+        raise
+
+def load_intent_model():
+    """Tải + warm-up intent model (publish snapshot sẽ gán intent_classifier)"""
+    ensure_model_loaded()
+
+def load_intent_cascade():
+    """Train stage 1 của cascade (không làm gì nếu INTENT_CASCADE_ENABLED=false)"""
+    intent_cascade.load()
+
+def load_models():
+    """Tải đồng bộ mọi model (dùng trong inference worker và script)"""
+    try:
+        load_intent_model()
+    except Exception as e:
+        logger.error(f"Khong tai duoc intent model: {e}. Su dung fallback.")
+    try:
+        load_sentiment_model()
+    except Exception:
+        pass
 
 
 import asyncio
-from datetime import datetime
-from app.database import supabase
+from datetime import datetime, timezone
+from app.services.write_behind import log_writer
+from app.services.call_analytics import call_analytics
 
 def save_conversation_log(call_id: str, speaker: str, text: str, intent: str = None, confidence: float = None):
-    """Lưu log cuộc hội thoại theo cấu trúc database"""
+    """Lưu log cuộc hội thoại theo cấu trúc database.
+
+    Dòng được đưa vào write-behind buffer (không chờ database); bulk insert chạy ở
+    thread nền. Trả về False nếu thiếu trường bắt buộc hoặc dòng không được nhận.
+    """
     try:
         # Kiểm tra và định dạng dữ liệu theo cấu trúc DB
         log_data = {
@@ -104,7 +286,8 @@ def save_conversation_log(call_id: str, speaker: str, text: str, intent: str = N
             'text': text,
             'intent': intent,
             'confidence': confidence,
-            'created_at': datetime.now().isoformat()
+            # UTC có offset như app.db: keyset pagination so sánh (created_at, id)
+            'created_at': datetime.now(timezone.utc).isoformat()
         }
         
         # Validate required fields theo schema
@@ -113,53 +296,204 @@ def save_conversation_log(call_id: str, speaker: str, text: str, intent: str = N
             if not log_data.get(field):
                 raise ValueError(f"Thiếu trường bắt buộc: {field}")
         
-        # Insert với error handling
-        try:
-            response = supabase.table('conversation_logs').insert(log_data).execute()
-            if hasattr(response, 'error') and response.error:
-                raise Exception(f"Supabase error: {response.error}")
-            print(f"[NLP Service] Đã lưu log hội thoại: {text}")
-        except Exception as db_error:
-            print(f"[NLP Service] Lỗi database: {str(db_error)}")
+        if not log_writer.submit('conversation_logs', log_data):
             return False
         
         # Lưu feedback cho trường hợp confidence thấp
         if confidence and confidence < 0.7:
-            try:
-                feedback_data = {
-                    'call_id': call_id,
-                    'text': text,
-                    'intent': intent,
-                    'confidence': confidence,
-                    'created_at': datetime.now().isoformat(),
-                    'reviewed': False
-                }
-                feedback_response = supabase.table('feedback').insert(feedback_data).execute()
-                if hasattr(feedback_response, 'error') and feedback_response.error:
-                    raise Exception(f"Supabase error: {feedback_response.error}")
-                print(f"[NLP Service] Đã lưu feedback cho text có độ tin cậy thấp")
-            except Exception as fb_error:
-                print(f"[NLP Service] Lỗi khi lưu feedback: {str(fb_error)}")
-                # Không return False ở đây vì log chính đã được lưu thành công
+            log_writer.submit('feedback', {
+                'call_id': call_id,
+                'text': text,
+                'intent': intent,
+                'confidence': confidence,
+                'created_at': log_data['created_at'],
+                'reviewed': False
+            })
         
         return True
         
     except Exception as e:
-        print(f"[NLP Service] Lỗi khi lưu dữ liệu: {str(e)}")
+        logger.error(f"Lỗi khi lưu dữ liệu: {e}", extra={"call_id": call_id})
         return False
 
-def process_nlp_tasks(text: str, call_id: Optional[str] = None, use_rl_threshold: bool = True) -> Dict[str, Any]:
-    print(f"[NLP Service] Dang xu ly text: '{text}' (call_id={call_id})")
+# --- Cache kết quả classifier theo utterance đã chuẩn hóa ---
+# Chỉ cache output của model (intent thô + sentiment). Chọn threshold RL và
+# ghi log hội thoại vẫn chạy trên mọi request. Entity không cache vì ngày
+# tương đối ("hôm nay") đổi theo ngày.
+NLP_CACHE_MAX_ENTRIES = int(os.getenv("NLP_CACHE_MAX_ENTRIES", "10000"))
+NLP_CACHE_TTL_SECONDS = float(os.getenv("NLP_CACHE_TTL_SECONDS", "600"))
+NLP_CACHE_MAX_TEXT_LENGTH = int(os.getenv("NLP_CACHE_MAX_TEXT_LENGTH", "200"))
+
+_result_cache = TTLCache(max_entries=NLP_CACHE_MAX_ENTRIES, ttl_seconds=NLP_CACHE_TTL_SECONDS)
+
+def _cache_key(text: str) -> Optional[Tuple[int, int, str]]:
+    # Cùng dạng canonical với token cache (NFC + gộp khoảng trắng): model phân biệt
+    # hoa/thường và dấu câu, nên "Có." và "có" là hai input khác nhau
+    canonical = canonical_text(text)
+    if 0 < len(canonical) <= NLP_CACHE_MAX_TEXT_LENGTH:
+        return (get_model_version(), intent_cascade.version, canonical)
+    return None
+
+def _fill_sentiment(texts: List[str], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Bổ sung sentiment cho các kết quả chưa có (chế độ không fused)"""
+    if not sentiment_classifier:
+        return results
+    for text, result in zip(texts, results):
+        if result.get('sentiment') is None:
+            try:
+                result['sentiment'] = sentiment_classifier(text)[0]['label']
+            except Exception as e:
+                logger.warning(f"Loi khi nhan dien sentiment: {e}")
+    return results
+
+def classify_texts(texts: List[str]) -> List[Dict[str, Any]]:
+    """Intent + sentiment cho một batch, không cache và không side effect (dùng bởi inference worker)"""
+    return _fill_sentiment(texts, _classify_intent_batch(texts))
+
+def _classify_cached(text: str) -> Dict[str, Any]:
+    """Chạy intent (+ sentiment) classifier, dùng cache nếu utterance đã gặp.
+
+    Stage 1 của cascade chạy trước; chỉ khi nó không đủ tự tin mới gọi PhoBERT.
+    Khóa cache gồm version của ModelManager và cascade nên reload tự vô hiệu cache cũ.
+    Lỗi từ intent classifier được raise lại để caller dùng fallback (không cache).
+    """
+    key = _cache_key(text)
+    if key is not None:
+        cached = _result_cache.get(key)
+        if cached is not None:
+            return cached
+
+    result = intent_cascade.predict(text)
+    if result is None:
+        if intent_classifier is None:
+            raise RuntimeError("Intent model chưa được tải")
+        result = dict(intent_classifier(text))
+    result = _fill_sentiment([text], [result])[0]
+
+    if key is not None:
+        _result_cache.set(key, result)
+    return result
+
+
+def classify_partial(text: str) -> Optional[Dict[str, Any]]:
+    """Intent thô cho partial ASR hypothesis (cache -> cascade -> model).
+
+    Không tính sentiment, không ghi cache/log; None nếu chưa có classifier nào.
+    """
+    key = _cache_key(text)
+    if key is not None:
+        cached = _result_cache.get(key)
+        if cached is not None:
+            return cached
+    result = intent_cascade.predict(text)
+    if result is None:
+        if intent_classifier is None:
+            return None
+        result = dict(intent_classifier(text))
+    return result
+
+
+def _fallback_intent(text: str) -> Tuple[str, float]:
+    """Intent theo bảng luật keyword (data/intent_rules.csv) khi không dùng được model"""
+    match = intent_rules.match(text)
+    if match is None:
+        return "unknown", 0.5
+    return match.intent, 0.6
+
+def reload_intent_rules() -> Dict[str, Any]:
+    """Nạp lại bảng luật fallback mà không cần restart"""
+    return intent_rules.reload()
+
+def get_scoring_model() -> Optional[str]:
+    """Checkpoint intent đang phục vụ (ghi kèm kết quả batch/backfill)"""
+    snapshot = get_snapshot()
+    return snapshot.path if snapshot is not None else None
+
+def _sentiment_batch(texts: List[str]) -> List[Optional[str]]:
+    if sentiment_model is not None:
+        return _classify_sentiment_batch(texts)
+    if sentiment_classifier is not None:
+        return [r['label'] for r in sentiment_classifier(texts)]
+    return [None] * len(texts)
+
+def analyze_texts(texts: List[str], batch_size: int = 32) -> List[Dict[str, Any]]:
+    """Intent + sentiment + entity cho nhiều utterance, không side effect.
+
+    Dùng cho API batch và backfill: không ghi conversation_logs, không đi qua
+    RL tuner hay result cache (threshold tĩnh từ CONFIDENCE_THRESHOLDS), mỗi
+    chunk batch_size utterance là một forward pass.
+    """
+    results = []
+    for start in range(0, len(texts), batch_size):
+        chunk = texts[start:start + batch_size]
+        raw_results: List[Optional[Dict[str, Any]]] = [None] * len(chunk)
+        if get_snapshot() is not None:
+            try:
+                raw_results = _classify_intent_batch(chunk)
+            except Exception as e:
+                logger.warning(f"Loi khi chay intent batch: {e}. Su dung fallback.")
+        sentiments = [r.get('sentiment') if r else None for r in raw_results]
+        missing = [i for i, label in enumerate(sentiments) if label is None]
+        if missing:
+            try:
+                for i, label in zip(missing, _sentiment_batch([chunk[i] for i in missing])):
+                    sentiments[i] = label
+            except Exception as e:
+                logger.warning(f"Loi khi nhan dien sentiment batch: {e}")
+
+        for text, raw, sentiment in zip(chunk, raw_results, sentiments):
+            result = {"text": text}
+            if raw is not None:
+                threshold = min(CONFIDENCE_THRESHOLDS.get(raw['label'], 0.85), 0.90)
+                accepted = raw['score'] >= threshold
+                result.update(
+                    intent=raw['label'] if accepted else "unknown",
+                    intent_confidence=raw['score'],
+                    raw_intent=raw['label'],
+                    raw_confidence=raw['score'],
+                    threshold_applied=threshold,
+                    intent_stage="model",
+                )
+            else:
+                intent, confidence = _fallback_intent(text)
+                result.update(intent=intent, intent_confidence=confidence, intent_stage="rules")
+            result["sentiment"] = sentiment.lower() if sentiment else "neutral"
+            try:
+                result["entities"] = format_entities(extract_entities(text))
+            except Exception as e:
+                logger.warning(f"Lỗi khi trích xuất entities: {e}")
+                result["entities"] = {}
+            results.append(result)
+    return results
+
+
+def process_nlp_tasks(
+    text: str,
+    call_id: Optional[str] = None,
+    use_rl_threshold: bool = True,
+    intent_result: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """intent_result: output classifier đã tính sẵn (vd. từ inference pool), bỏ qua bước inference"""
+    # Log chi tiết (text, kết quả đầy đủ) chỉ cho các cuộc gọi được lấy mẫu
+    verbose = logger.isEnabledFor(logging.DEBUG) and debug_sampled(call_id)
+    if verbose:
+        logger.debug(f"Dang xu ly text: '{text}'", extra={"call_id": call_id})
     
     # --- 3. Nhận diện Intent với Per-Intent Confidence Thresholds ---
     intent = "unknown"
     intent_confidence = 0.0
     raw_intent = None
     raw_confidence = 0.0
+    fused_sentiment = None
+    intent_stage = None
     
-    if intent_classifier:
+    if intent_result is not None or intent_classifier or intent_cascade.is_ready():
         try:
-            intent_result = intent_classifier(text)[0]
+            if intent_result is None:
+                with span("intent_classify"):
+                    intent_result = _classify_cached(text)
+            fused_sentiment = intent_result.get('sentiment')
+            intent_stage = intent_result.get('stage', 'model')
             raw_intent = intent_result['label']
             raw_confidence = intent_result['score']
             
@@ -167,18 +501,19 @@ def process_nlp_tasks(text: str, call_id: Optional[str] = None, use_rl_threshold
             # Option 1: Use RL tuner (adaptive threshold)
             # Option 2: Use static configured threshold
             if use_rl_threshold:
-                tuner = get_tuner()
-                context = {
-                    'text_length': len(text),
-                    'raw_confidence': raw_confidence,
-                    'sentiment': 'unknown'  # Will be filled later
-                }
-                threshold = tuner.get_threshold(
-                    intent=raw_intent,
-                    raw_confidence=raw_confidence,
-                    context=context,
-                    call_id=call_id
-                )
+                with span("rl_threshold"):
+                    tuner = get_tuner()
+                    context = {
+                        'text_length': len(text),
+                        'raw_confidence': raw_confidence,
+                        'sentiment': 'unknown'  # Will be filled later
+                    }
+                    threshold = tuner.get_threshold(
+                        intent=raw_intent,
+                        raw_confidence=raw_confidence,
+                        context=context,
+                        call_id=call_id
+                    )
             else:
                 # Static threshold (fallback)
                 configured = CONFIDENCE_THRESHOLDS.get(raw_intent, 0.85)
@@ -187,110 +522,42 @@ def process_nlp_tasks(text: str, call_id: Optional[str] = None, use_rl_threshold
             if raw_confidence >= threshold:
                 intent = raw_intent
                 intent_confidence = raw_confidence
-                print(f"[NLP Service] Intent = {intent} (confidence: {intent_confidence:.2f}, threshold: {threshold:.2f}) ✓")
+                if verbose:
+                    logger.debug(f"Intent = {intent} (confidence: {intent_confidence:.2f}, threshold: {threshold:.2f})", extra={"call_id": call_id})
             else:
                 # Confidence below threshold, mark as low_confidence
                 intent = "unknown"
                 intent_confidence = raw_confidence
-                print(f"[NLP Service] Intent = {raw_intent} rejected (confidence: {raw_confidence:.2f} < threshold: {threshold:.2f})")
-                print(f"[NLP Service] Falling back to 'unknown'")
+                if verbose:
+                    logger.debug(f"Intent = {raw_intent} rejected (confidence: {raw_confidence:.2f} < threshold: {threshold:.2f}), falling back to 'unknown'", extra={"call_id": call_id})
         except Exception as e:
-            print(f"[NLP Service] Loi khi nhan dien intent: {str(e)}")
-            print("[NLP Service] Chuyen sang fallback intent")
+            logger.warning(f"Loi khi nhan dien intent: {e}. Chuyen sang fallback intent", extra={"call_id": call_id})
             # Fallback khi có lỗi
-            if "đặt lịch" in text or "hẹn" in text:
-                intent = "dat_lich"
-                intent_confidence = 0.6
-            elif "hỏi" in text or "thông tin" in text:
-                intent = "hoi_thong_tin"
-                intent_confidence = 0.6
-            elif "đồng ý" in text or "OK" in text or "được" in text or "xác nhận" in text:
-                intent = "xac_nhan"
-                intent_confidence = 0.6
-            elif "không" in text or "từ chối" in text or "thôi" in text:
-                intent = "tu_choi"
-                intent_confidence = 0.6
-            elif "giờ làm việc" in text or "mở cửa" in text or "lịch làm việc" in text:
-                intent = "hoi_gio_lam_viec"
-                intent_confidence = 0.6
-            elif "địa chỉ" in text or "ở đâu" in text or "cách tìm" in text:
-                intent = "hoi_dia_chi"
-                intent_confidence = 0.6
-            elif "khiếu nại" in text or "không hài lòng" in text or "tệ" in text or "thất vọng" in text:
-                intent = "khieu_nai"
-                intent_confidence = 0.6
-            elif "hỗ trợ" in text or "giúp" in text or "trợ giúp" in text:
-                intent = "yeu_cau_ho_tro"
-                intent_confidence = 0.6
-            else:
-                intent = "unknown"
-                intent_confidence = 0.5
+            intent, intent_confidence = _fallback_intent(text)
     else:
         # Fallback (nếu chưa train model)
-        if "đặt lịch" in text or "hẹn" in text: 
-            intent = "dat_lich"
-            intent_confidence = 0.6
-        elif "hỏi" in text or "thông tin" in text: 
-            intent = "hoi_thong_tin"
-            intent_confidence = 0.6
-        elif "đồng ý" in text or "OK" in text or "được" in text or "xác nhận" in text:
-            intent = "xac_nhan"
-            intent_confidence = 0.6
-        elif "không" in text or "từ chối" in text or "thôi" in text:
-            intent = "tu_choi"
-            intent_confidence = 0.6
-        elif "giờ làm việc" in text or "mở cửa" in text or "lịch làm việc" in text:
-            intent = "hoi_gio_lam_viec"
-            intent_confidence = 0.6
-        elif "địa chỉ" in text or "ở đâu" in text or "cách tìm" in text:
-            intent = "hoi_dia_chi"
-            intent_confidence = 0.6
-        elif "khiếu nại" in text or "không hài lòng" in text or "tệ" in text or "thất vọng" in text:
-            intent = "khieu_nai"
-            intent_confidence = 0.6
-        elif "hỗ trợ" in text or "giúp" in text or "trợ giúp" in text:
-            intent = "yeu_cau_ho_tro"
-            intent_confidence = 0.6
-        else:
-            intent = "unknown"
-            intent_confidence = 0.5
-        print("[NLP Service] Su dung fallback Intent.")
+        intent, intent_confidence = _fallback_intent(text)
+        if verbose:
+            logger.debug("Su dung fallback Intent.", extra={"call_id": call_id})
 
     # --- 4. Nhận diện Sentiment ---
-    if sentiment_classifier:
-        sentiment_result = sentiment_classifier(text)[0]
+    if fused_sentiment is not None:
+        sentiment = fused_sentiment.lower()
+    elif sentiment_classifier:
+        with span("sentiment"):
+            sentiment_result = sentiment_classifier(text)[0]
         sentiment = sentiment_result['label'].lower()
     else:
         sentiment = "neutral"
-        print("[NLP Service] Su dung fallback Sentiment.")
+        if verbose:
+            logger.debug("Su dung fallback Sentiment.", extra={"call_id": call_id})
     
     # --- 5. Nhận diện Entity (Slot) ---
-    from app.services.entity_extractor import extract_entities
-    
     try:
-        entities = extract_entities(text)
-        # Flatten entities cho dễ sử dụng
-        formatted_entities = {}
-        
-        if entities.get('times'):
-            formatted_entities['time'] = entities['times'][0]['formatted']
-            formatted_entities['time_details'] = entities['times']
-        
-        if entities.get('dates'):
-            formatted_entities['date'] = entities['dates'][0]['date']
-            formatted_entities['date_details'] = entities['dates']
-        
-        if entities.get('phones'):
-            formatted_entities['phone'] = entities['phones'][0]['value']
-            formatted_entities['phone_details'] = entities['phones']
-        
-        if entities.get('emails'):
-            formatted_entities['email'] = entities['emails'][0]['value']
-            formatted_entities['email_details'] = entities['emails']
-        
-        entities = formatted_entities
+        with span("entities"):
+            entities = format_entities(extract_entities(text))
     except Exception as e:
-        print(f"[NLP Service] Lỗi khi trích xuất entities: {e}")
+        logger.warning(f"Lỗi khi trích xuất entities: {e}", extra={"call_id": call_id})
         entities = {}
 
     result = {
@@ -306,26 +573,182 @@ def process_nlp_tasks(text: str, call_id: Optional[str] = None, use_rl_threshold
         result["raw_intent"] = raw_intent
         result["raw_confidence"] = raw_confidence
         result["threshold_applied"] = CONFIDENCE_THRESHOLDS.get(raw_intent, 0.65)
+        result["intent_stage"] = intent_stage
     
-    print(f"[NLP Service] Ket qua: {result}")
+    logger.info("nlp_turn", extra={
+        "call_id": call_id,
+        "intent": intent,
+        "confidence": round(intent_confidence, 4),
+        "sentiment": sentiment,
+        "stage": intent_stage,
+    })
+    if verbose:
+        logger.debug(f"Ket qua: {result}", extra={"call_id": call_id})
     
-    # Nếu caller truyền call_id thì lưu log user
+    # Nếu caller truyền call_id thì lưu log user và cộng dồn call_intents/call_entities
     if call_id:
-        save_conversation_log(
-            call_id=call_id,
-            speaker='user',
-            text=text,
-            intent=intent,
-            confidence=intent_confidence
-        )
+        with span("save_user_log"):
+            save_conversation_log(
+                call_id=call_id,
+                speaker='user',
+                text=text,
+                intent=intent,
+                confidence=intent_confidence
+            )
+        call_analytics.record_turn(call_id, intent, intent_confidence, entities)
     
     return result
 
 
-async def process_nlp_tasks_async(text: str, call_id: Optional[str] = None) -> Dict[str, Any]:
+# --- Inference worker pool (multi-process) ---
+# NLP_WORKER_PROCESSES=0 tắt pool, inference chạy trong tiến trình API như trước.
+NLP_WORKER_PROCESSES = int(os.getenv("NLP_WORKER_PROCESSES", "0"))
+NLP_WORKER_THREADS = int(os.getenv("NLP_WORKER_THREADS", "0"))  # 0 = số core được pin
+NLP_WORKER_PIN_CORES = os.getenv("NLP_WORKER_PIN_CORES", "true").lower() == "true"
+NLP_POSTPROCESS_THREADS = int(os.getenv("NLP_POSTPROCESS_THREADS", "8"))
+NLP_WORKER_START_TIMEOUT = float(os.getenv("NLP_WORKER_START_TIMEOUT", "300"))
+# Thời gian chờ kết quả từ worker; quá hạn thì phân loại tại chỗ
+NLP_WORKER_REQUEST_TIMEOUT = float(os.getenv("NLP_WORKER_REQUEST_TIMEOUT", "5"))
+
+# Executor riêng cho inference tại chỗ + RL threshold / entity / ghi log,
+# không dùng chung default executor của event loop.
+_nlp_executor = ThreadPoolExecutor(max_workers=NLP_POSTPROCESS_THREADS, thread_name_prefix="nlp")
+inference_pool = None
+_pool_lock = threading.Lock()
+# Các lần reload liên tiếp dựng pool lần lượt, không chồng nhau
+_pool_restart_lock = threading.Lock()
+# Version snapshot mà pool hiện tại được dựng cho (None: không rõ / model lỗi)
+_pool_model_version: Optional[int] = None
+
+def _create_inference_pool():
+    from app.services.inference_pool import InferencePool
+    pool = InferencePool(
+        num_workers=NLP_WORKER_PROCESSES,
+        threads_per_worker=NLP_WORKER_THREADS,
+        pin_cores=NLP_WORKER_PIN_CORES,
+        max_batch_size=NLP_BATCH_MAX_SIZE
+    )
+    pool.start()
+    return pool
+
+def start_inference_pool():
+    """Khởi động pool tiến trình inference (gọi lúc app startup).
+
+    Chờ intent model của process chính publish xong trước (ensure_loaded chờ lần
+    tải đang chạy ở thread khác), để listener của snapshot đầu tiên không dựng
+    lại pool đang khởi động; worker cũng dùng lại file ONNX đã export.
+    """
+    global inference_pool, _pool_model_version
+    if NLP_WORKER_PROCESSES <= 0:
+        return
+    try:
+        model_version = ensure_model_loaded().version
+    except Exception as e:
+        # Worker tự tải model (hoặc chạy fallback rule) như trước
+        logger.error(f"Intent model chưa tải được, vẫn khởi động inference pool: {e}")
+        model_version = None
+    with _pool_lock:
+        if inference_pool is not None:
+            return
+        pool = _create_inference_pool()
+        inference_pool = pool
+        _pool_model_version = model_version
+    if not pool.wait_ready(timeout=NLP_WORKER_START_TIMEOUT):
+        raise RuntimeError("Inference worker chưa sẵn sàng sau thời gian chờ")
+
+def restart_inference_pool(model_version: Optional[int] = None) -> bool:
+    """Thay pool bằng pool tải model mới mà không chặn request (gọi từ reload listener).
+
+    Pool mới được dựng và chờ tải xong model ngoài _pool_lock; trong lúc đó request
+    vẫn chạy trên pool cũ. Chỉ swap khi mọi worker mới đã sẵn sàng (không được thì
+    dừng pool mới, giữ pool cũ), rồi xả hết request đang chạy của pool cũ mới dừng nó.
+    """
+    global inference_pool, _pool_model_version
+    if NLP_WORKER_PROCESSES <= 0:
+        return False
+    with _pool_restart_lock:
+        new_pool = _create_inference_pool()
+        if not new_pool.wait_ready(timeout=NLP_WORKER_START_TIMEOUT):
+            logger.error("Inference worker mới chưa sẵn sàng sau thời gian chờ, giữ pool cũ")
+            new_pool.stop()
+            return False
+        with _pool_lock:
+            old_pool = inference_pool
+            if old_pool is not None:
+                inference_pool = new_pool
+                _pool_model_version = model_version
+        if old_pool is None:
+            # stop_inference_pool() chạy trong lúc pool mới đang tải model
+            new_pool.stop()
+            return False
+        if not old_pool.drain(timeout=NLP_WORKER_REQUEST_TIMEOUT):
+            logger.warning("Pool inference cũ còn request chưa xong khi hết thời gian xả")
+        old_pool.stop()
+        return True
+
+def stop_inference_pool():
+    global inference_pool, _pool_model_version
+    with _pool_lock:
+        pool, inference_pool = inference_pool, None
+        _pool_model_version = None
+    if pool is not None:
+        pool.stop()
+
+async def _classify_via_pool(text: str) -> Dict[str, Any]:
+    key = _cache_key(text)
+    if key is not None:
+        cached = _result_cache.get(key)
+        if cached is not None:
+            return cached
+    result = intent_cascade.predict(text)
+    if result is None:
+        try:
+            result = await asyncio.wait_for(
+                asyncio.wrap_future(inference_pool.submit(text)), timeout=NLP_WORKER_REQUEST_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            # process_nlp_tasks_async bắt lỗi này và chạy inference tại chỗ
+            raise RuntimeError(f"Inference worker không trả kết quả sau {NLP_WORKER_REQUEST_TIMEOUT}s")
+    else:
+        # Stage 1 đủ tự tin -> không gửi sang worker, chỉ còn tính sentiment tại chỗ
+        loop = asyncio.get_running_loop()
+        result = (await loop.run_in_executor(_nlp_executor, _fill_sentiment, [text], [result]))[0]
+    if key is not None:
+        _result_cache.set(key, result)
+    return result
+
+
+async def process_nlp_tasks_async(
+    text: str,
+    call_id: Optional[str] = None,
+    intent_result: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
     """Async wrapper around the sync `process_nlp_tasks` to avoid blocking the event loop.
 
-    This runs the synchronous inference in a threadpool executor.
+    Khi bật inference pool, model chạy ở tiến trình worker; phần còn lại
+    (RL threshold, entity, ghi log) chạy trên executor riêng của NLP.
+    intent_result đã có (vd. từ streaming) thì bỏ qua bước inference.
     """
     loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, process_nlp_tasks, text, call_id)
\ No newline at end of file
+    if intent_result is None and inference_pool is not None:
+        try:
+            with span("intent_classify"):
+                intent_result = await _classify_via_pool(text)
+        except Exception as e:
+            logger.warning(f"Inference pool loi, chay tai cho: {e}", extra={"call_id": call_id})
+    # run_in_executor không tự mang contextvars sang thread -> copy để span ghi vào breakdown của lượt
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(
+        _nlp_executor, ctx.run, process_nlp_tasks, text, call_id, True, intent_result
+    )
+
+
+async def analyze_texts_async(texts: List[str]) -> List[Dict[str, Any]]:
+    """Chạy analyze_texts trên executor của NLP (không chặn event loop)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_nlp_executor, analyze_texts, texts)
+
+
+async def classify_partial_async(text: str) -> Optional[Dict[str, Any]]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_nlp_executor, classify_partial, text)
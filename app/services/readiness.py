@@ -0,0 +1,90 @@
+"""
+Trạng thái load của các thành phần nặng (model, index...) cho health check.
+App bind port ngay, các thành phần được tải ở background; /health/ready chỉ
+trả 200 khi mọi thành phần bắt buộc đã sẵn sàng.
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+# Thành phần bắt buộc để nhận traffic; thành phần khác lỗi thì service chạy chế độ fallback
+READINESS_REQUIRED = {
+    name.strip()
+    for name in os.getenv("READINESS_REQUIRED", "intent_model,inference_pool").split(",")
+    if name.strip()
+}
+
+
+class ComponentState:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = PENDING
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        load_seconds = None
+        if self.started_at is not None:
+            load_seconds = (self.finished_at or time.time()) - self.started_at
+        return {
+            "state": self.state,
+            "required": self.name in READINESS_REQUIRED,
+            "load_seconds": load_seconds,
+            "error": self.error,
+        }
+
+
+_components: Dict[str, ComponentState] = {}
+_lock = threading.Lock()
+
+
+def register(name: str) -> ComponentState:
+    with _lock:
+        component = _components.get(name)
+        if component is None:
+            component = ComponentState(name)
+            _components[name] = component
+        return component
+
+
+@contextmanager
+def track(name: str):
+    """Đánh dấu loading -> ready/failed quanh đoạn code tải thành phần"""
+    component = register(name)
+    component.state = LOADING
+    component.started_at = time.time()
+    component.finished_at = None
+    component.error = None
+    try:
+        yield component
+    except Exception as e:
+        component.state = FAILED
+        component.error = str(e)
+        component.finished_at = time.time()
+        raise
+    component.state = READY
+    component.finished_at = time.time()
+
+
+def is_ready() -> bool:
+    with _lock:
+        components = list(_components.values())
+    return all(c.state == READY for c in components if c.name in READINESS_REQUIRED)
+
+
+def get_status() -> Dict[str, Any]:
+    with _lock:
+        components = dict(_components)
+    return {
+        "ready": is_ready(),
+        "components": {name: c.to_dict() for name, c in components.items()},
+    }
@@ -0,0 +1,408 @@
+"""
+Bảng reports: KPI theo workflow được duy trì tăng dần.
+Mỗi workflow có một dòng bucket='all' (toàn thời gian) và một dòng cho mỗi ngày
+(bucket='YYYY-MM-DD', theo end_time UTC). Dòng giữ tổng cộng dồn (số cuộc gọi,
+thành công, intent tích cực, tổng thời lượng); success_rate / avg_duration /
+positive_intent_rate được tính lại từ các tổng mỗi lần ghi nên đọc chỉ là một
+truy vấn theo khóa (workflow_id, bucket).
+
+Job delta quét các cuộc gọi đã kết thúc có end_time trong (watermark, now - settle],
+cộng vào các dòng tương ứng rồi dời watermark (bảng report_state). Mặc định job
+chạy bằng cron qua update_reports.py; REPORTS_JOB_INTERVAL_SECONDS > 0 bật job
+trong app. rebuild() tính lại từ đầu để sửa sai lệch.
+
+Chạy ở nhiều nơi cùng lúc vẫn an toàn:
+- mỗi lần chạy phải giữ lease trên dòng report_state (update có điều kiện
+  lease_until < now), nên tại một thời điểm chỉ một process đọc-cộng-ghi reports;
+- mỗi dòng reports ghi applied_through (end_time lớn nhất đã cộng vào dòng đó), và
+  job chỉ cộng cuộc gọi có end_time > applied_through. Lần chạy dừng giữa chừng
+  (đã ghi một phần dòng, chưa dời watermark) chạy lại không cộng trùng.
+"""
+
+import asyncio
+import os
+import socket
+import time
+import uuid
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.db import get_db
+
+logger = logging.getLogger(__name__)
+
+# 0 = không chạy job trong app (dùng cron + update_reports.py)
+REPORTS_JOB_INTERVAL_SECONDS = float(os.getenv("REPORTS_JOB_INTERVAL_SECONDS", "0"))
+# Thời hạn lease của một lần chạy (được gia hạn sau mỗi trang calls)
+REPORTS_LEASE_SECONDS = float(os.getenv("REPORTS_LEASE_SECONDS", "300"))
+# Chỉ lấy cuộc gọi kết thúc trước now - settle, tránh bỏ sót dòng ghi trễ
+REPORTS_SETTLE_SECONDS = float(os.getenv("REPORTS_SETTLE_SECONDS", "30"))
+REPORTS_POSITIVE_INTENTS = frozenset(
+    i.strip() for i in os.getenv("REPORTS_POSITIVE_INTENTS", "xac_nhan,dat_lich").split(",") if i.strip()
+)
+
+ALL_TIME_BUCKET = "all"
+FINISHED_STATUSES = ("completed", "failed")
+WATERMARK_NAME = "reports"
+# PostgREST trả tối đa 1000 dòng mỗi request
+CALL_FETCH_SIZE = 1000
+UPSERT_CHUNK_SIZE = 500
+# Số khóa (workflow_id, bucket) mỗi truy vấn dòng reports hiện có (như call_analytics)
+KEY_CHUNK_SIZE = 200
+
+_CALL_COLUMNS = "id, workflow_id, status, duration, last_intent, end_time"
+
+Key = Tuple[str, str]  # (workflow_id, bucket)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def parse_time(timestamp: Optional[str]) -> Optional[datetime]:
+    """Timestamp ISO -> datetime UTC (timestamp không có múi giờ coi là UTC)"""
+    if not timestamp:
+        return None
+    try:
+        moment = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def day_bucket(timestamp: Optional[str]) -> Optional[str]:
+    """'YYYY-MM-DD' (UTC) của một timestamp ISO"""
+    moment = parse_time(timestamp)
+    return moment.date().isoformat() if moment else None
+
+
+class ReportSums:
+    """Tổng cộng dồn của một dòng reports"""
+
+    __slots__ = ("total_calls", "success_calls", "positive_calls", "duration_sum", "duration_calls")
+
+    def __init__(self, total_calls=0, success_calls=0, positive_calls=0, duration_sum=0.0, duration_calls=0):
+        self.total_calls = int(total_calls or 0)
+        self.success_calls = int(success_calls or 0)
+        self.positive_calls = int(positive_calls or 0)
+        self.duration_sum = float(duration_sum or 0.0)
+        self.duration_calls = int(duration_calls or 0)
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "ReportSums":
+        return cls(*(row.get(name) for name in cls.__slots__))
+
+    def add_call(self, call: Dict[str, Any], positive_intents: Iterable[str] = REPORTS_POSITIVE_INTENTS):
+        self.total_calls += 1
+        if call.get("status") == "completed":
+            self.success_calls += 1
+        if call.get("last_intent") in positive_intents:
+            self.positive_calls += 1
+        if call.get("duration") is not None:
+            self.duration_sum += float(call["duration"])
+            self.duration_calls += 1
+
+    def merge(self, other: "ReportSums"):
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def to_row(self, workflow_id: str, bucket: str, applied_through: Optional[str] = None) -> Dict[str, Any]:
+        total = self.total_calls
+        return {
+            "workflow_id": workflow_id,
+            "bucket": bucket,
+            "total_calls": total,
+            "success_calls": self.success_calls,
+            "positive_calls": self.positive_calls,
+            "duration_sum": round(self.duration_sum, 3),
+            "duration_calls": self.duration_calls,
+            # Tỷ lệ tính theo %, như mô tả trong DATABASE_SCHEMA.md
+            "success_rate": round(self.success_calls * 100.0 / total, 2) if total else None,
+            "avg_duration": round(self.duration_sum / self.duration_calls, 2) if self.duration_calls else None,
+            "positive_intent_rate": round(self.positive_calls * 100.0 / total, 2) if total else None,
+            "applied_through": applied_through,
+            "updated_at": _now().isoformat(),
+        }
+
+
+def call_keys(call: Dict[str, Any]) -> List[Key]:
+    """Dòng 'all' và dòng ngày (theo end_time) mà cuộc gọi được cộng vào"""
+    workflow_id = call.get("workflow_id")
+    if not workflow_id:
+        return []
+    keys = [(workflow_id, ALL_TIME_BUCKET)]
+    day = day_bucket(call.get("end_time"))
+    if day:
+        keys.append((workflow_id, day))
+    return keys
+
+
+def accumulate(
+    calls: Iterable[Dict[str, Any]],
+    into: Optional[Dict[Key, ReportSums]] = None,
+    applied: Optional[Dict[Key, datetime]] = None,
+) -> Dict[Key, ReportSums]:
+    """Cộng các cuộc gọi vào dòng 'all' và dòng ngày của workflow tương ứng.
+
+    applied: applied_through của từng dòng; cuộc gọi có end_time <= giá trị đó đã
+    nằm trong dòng nên bị bỏ qua.
+    """
+    sums = into if into is not None else {}
+    for call in calls:
+        ended = parse_time(call.get("end_time")) if applied else None
+        for key in call_keys(call):
+            done = applied.get(key) if applied else None
+            if done is not None and ended is not None and ended <= done:
+                continue
+            if key not in sums:
+                sums[key] = ReportSums()
+            sums[key].add_call(call)
+    return sums
+
+
+class ReportAggregator:
+    def __init__(
+        self,
+        interval_seconds: float = REPORTS_JOB_INTERVAL_SECONDS,
+        settle_seconds: float = REPORTS_SETTLE_SECONDS,
+        lease_seconds: float = REPORTS_LEASE_SECONDS,
+    ):
+        self.interval_seconds = interval_seconds
+        self.settle_seconds = settle_seconds
+        self.lease_seconds = lease_seconds
+        # Job delta và rebuild không được chạy chồng nhau (cùng đọc-cộng-ghi một dòng):
+        # asyncio.Lock trong process, lease trên report_state giữa các process
+        self._lock = asyncio.Lock()
+        self._owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._task: Optional[asyncio.Task] = None
+        self._last_run: Dict[str, Any] = {}
+        self._counters = {
+            "runs": 0, "rebuilds": 0, "calls": 0, "rows_written": 0, "errors": 0, "lease_skips": 0,
+        }
+
+    async def _claim_lease(self, db, renew: bool = False) -> bool:
+        """Lấy (hoặc gia hạn) lease bằng update có điều kiện; False nếu process khác đang giữ"""
+        now = time.time()
+        values = {"lease_owner": self._owner, "lease_until": now + self.lease_seconds}
+        where = [("name", "eq", WATERMARK_NAME)]
+        where.append(("lease_owner", "eq", self._owner) if renew else ("lease_until", "lt", now))
+        if await db.update("report_state", values, where):
+            return True
+        if renew or await db.select_one("report_state", "name", where={"name": WATERMARK_NAME}):
+            return False
+        # Lần chạy đầu tiên: tạo dòng trạng thái (lease_until mặc định 0) rồi tranh lease
+        await db.upsert("report_state", {"name": WATERMARK_NAME}, on_conflict="name")
+        return bool(await db.update("report_state", values, where))
+
+    async def _release_lease(self, db, watermark: Optional[str] = None):
+        """Nhả lease; kèm dời watermark nếu có (chỉ khi vẫn còn giữ lease)"""
+        values: Dict[str, Any] = {"lease_until": 0}
+        if watermark is not None:
+            values.update(watermark=watermark, updated_at=_now().isoformat())
+        released = await db.update(
+            "report_state", values, [("name", "eq", WATERMARK_NAME), ("lease_owner", "eq", self._owner)]
+        )
+        if not released and watermark is not None:
+            logger.warning(f"Reports: lease đã hết hạn trước khi ghi xong (watermark {watermark} chưa được lưu)")
+
+    def _lease_skipped(self, mode: str) -> Dict[str, Any]:
+        self._counters["lease_skips"] += 1
+        return {"mode": mode, "skipped": "lease_held", "calls": 0, "rows": 0}
+
+    async def _get_watermark(self, db) -> Optional[str]:
+        row = await db.select_one("report_state", "watermark", where={"name": WATERMARK_NAME})
+        return row.get("watermark") if row else None
+
+    async def _scan_calls(self, db, lower: Optional[str], upper: str, workflow_id: Optional[str] = None):
+        """Cuộc gọi đã kết thúc với end_time trong (lower, upper], từng trang keyset theo id"""
+        last_id = None
+        while True:
+            where = [("status", "in", list(FINISHED_STATUSES)), ("end_time", "lte", upper)]
+            if lower:
+                where.append(("end_time", "gt", lower))
+            if workflow_id:
+                where.append(("workflow_id", "eq", workflow_id))
+            if last_id:
+                where.append(("id", "gt", last_id))
+            page = await db.select("calls", _CALL_COLUMNS, where=where, order="id", limit=CALL_FETCH_SIZE)
+            if page:
+                yield page
+            if len(page) < CALL_FETCH_SIZE:
+                return
+            last_id = page[-1]["id"]
+
+    async def _existing_rows(self, db, keys: Iterable[Key]) -> Dict[Key, Dict[str, Any]]:
+        keys = set(keys)
+        existing: Dict[Key, Dict[str, Any]] = {}
+        ordered = sorted(keys)
+        # Mỗi request tối đa KEY_CHUNK_SIZE khóa, giữ filter "in" của PostgREST ngắn
+        for start in range(0, len(ordered), KEY_CHUNK_SIZE):
+            chunk = ordered[start:start + KEY_CHUNK_SIZE]
+            rows = await db.select(
+                "reports", "workflow_id, bucket, applied_through, " + ", ".join(ReportSums.__slots__),
+                where=[
+                    ("workflow_id", "in", sorted({workflow_id for workflow_id, _ in chunk})),
+                    ("bucket", "in", sorted({bucket for _, bucket in chunk})),
+                ],
+            )
+            for row in rows:
+                key = (row["workflow_id"], row["bucket"])
+                if key in keys:
+                    existing[key] = row
+        return existing
+
+    async def _write_rows(self, db, sums: Dict[Key, ReportSums], applied_through: str) -> int:
+        rows = [agg.to_row(workflow_id, bucket, applied_through) for (workflow_id, bucket), agg in sums.items()]
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            await db.upsert("reports", rows[start:start + UPSERT_CHUNK_SIZE], on_conflict="workflow_id,bucket")
+        return len(rows)
+
+    async def run_delta(self) -> Dict[str, Any]:
+        """Cộng các cuộc gọi kết thúc sau watermark vào reports rồi dời watermark"""
+        async with self._lock:
+            started = time.perf_counter()
+            db = get_db()
+            if not await self._claim_lease(db):
+                return self._lease_skipped("delta")
+            watermark = None  # chỉ dời watermark khi mọi dòng đã ghi xong
+            try:
+                lower = await self._get_watermark(db)
+                upper = (_now() - timedelta(seconds=self.settle_seconds)).isoformat()
+                if lower and parse_time(lower) >= parse_time(upper):
+                    return {"mode": "delta", "calls": 0, "rows": 0, "watermark": lower}
+
+                sums: Dict[Key, ReportSums] = {}
+                existing: Dict[Key, Dict[str, Any]] = {}
+                applied: Dict[Key, datetime] = {}
+                loaded_keys: set = set()
+                calls = 0
+                async for page in self._scan_calls(db, lower, upper):
+                    new_keys = {key for call in page for key in call_keys(call)} - loaded_keys
+                    loaded_keys |= new_keys
+                    loaded = await self._existing_rows(db, new_keys)
+                    existing.update(loaded)
+                    for key, row in loaded.items():
+                        through = parse_time(row.get("applied_through"))
+                        if through is not None:
+                            applied[key] = through
+                    accumulate(page, sums, applied)
+                    calls += len(page)
+                    if not await self._claim_lease(db, renew=True):
+                        return self._lease_skipped("delta")
+                for key, agg in sums.items():
+                    if key in existing:
+                        agg.merge(ReportSums.from_row(existing[key]))
+                rows = await self._write_rows(db, sums, upper)
+                watermark = upper
+            finally:
+                await asyncio.shield(self._release_lease(db, watermark))
+            return self._finish("delta", started, calls, rows, upper)
+
+    async def rebuild(self, workflow_id: Optional[str] = None) -> Dict[str, Any]:
+        """Tính lại reports từ bảng calls (một workflow hoặc tất cả), ghi đè tổng cũ"""
+        async with self._lock:
+            started = time.perf_counter()
+            db = get_db()
+            if not await self._claim_lease(db):
+                return self._lease_skipped("rebuild")
+            watermark = None
+            try:
+                if workflow_id:
+                    # Giữ watermark hiện tại: phần sau watermark job delta sẽ cộng tiếp
+                    upper = await self._get_watermark(db)
+                    if upper is None:
+                        return self._finish("rebuild", started, 0, 0, None)
+                else:
+                    upper = (_now() - timedelta(seconds=self.settle_seconds)).isoformat()
+
+                sums: Dict[Key, ReportSums] = {}
+                calls = 0
+                async for page in self._scan_calls(db, None, upper, workflow_id=workflow_id):
+                    accumulate(page, sums)
+                    calls += len(page)
+                    if not await self._claim_lease(db, renew=True):
+                        return self._lease_skipped("rebuild")
+                # Xóa cả bucket không còn cuộc gọi nào (vd. cuộc gọi đã bị xóa)
+                await db.delete("reports", {"workflow_id": workflow_id} if workflow_id else [("bucket", "neq", "")])
+                rows = await self._write_rows(db, sums, upper)
+                if not workflow_id:
+                    watermark = upper
+            finally:
+                await asyncio.shield(self._release_lease(db, watermark))
+            self._counters["rebuilds"] += 1
+            return self._finish("rebuild", started, calls, rows, upper)
+
+    def _finish(self, mode: str, started: float, calls: int, rows: int, watermark: Optional[str]) -> Dict[str, Any]:
+        self._counters["runs"] += 1
+        self._counters["calls"] += calls
+        self._counters["rows_written"] += rows
+        self._last_run = {
+            "mode": mode,
+            "calls": calls,
+            "rows": rows,
+            "watermark": watermark,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "finished_at": _now().isoformat(),
+        }
+        if calls:
+            logger.info(f"Reports {mode}: {calls} cuộc gọi -> {rows} dòng, watermark {watermark}")
+        return self._last_run
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_delta()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._counters["errors"] += 1
+                logger.error(f"Lỗi khi cập nhật reports: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        """Gọi trong lifespan; không làm gì nếu interval <= 0"""
+        if self.interval_seconds > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "job_running": self._task is not None and not self._task.done(),
+            "interval_seconds": self.interval_seconds,
+            "settle_seconds": self.settle_seconds,
+            "positive_intents": sorted(REPORTS_POSITIVE_INTENTS),
+            **self._counters,
+            "last_run": self._last_run,
+        }
+
+
+async def get_report(workflow_id: str, days: int = 0) -> Dict[str, Any]:
+    """Dòng toàn thời gian của workflow (+ tối đa `days` dòng ngày gần nhất)"""
+    db = get_db()
+    total = await db.select_one("reports", where={"workflow_id": workflow_id, "bucket": ALL_TIME_BUCKET})
+    report: Dict[str, Any] = {
+        "workflow_id": workflow_id,
+        "total": total or ReportSums().to_row(workflow_id, ALL_TIME_BUCKET),
+    }
+    if days > 0:
+        since = (_now() - timedelta(days=days - 1)).date().isoformat()
+        report["daily"] = await db.select(
+            "reports",
+            where=[("workflow_id", "eq", workflow_id), ("bucket", "gte", since), ("bucket", "neq", ALL_TIME_BUCKET)],
+            order="bucket", desc=True, limit=days,
+        )
+    return report
+
+
+report_aggregator = ReportAggregator()
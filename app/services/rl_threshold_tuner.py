@@ -11,6 +11,7 @@ Actions: Threshold values in range [min_threshold, max_threshold]
 """
 
 import json
+import logging
 import os
 import numpy as np
 from pathlib import Path
@@ -19,6 +20,8 @@ from dataclasses import dataclass, asdict
 from datetime import datetime
 from collections import defaultdict
 
+logger = logging.getLogger(__name__)
+
 @dataclass
 class ThresholdArm:
     """Represents a threshold value (arm) for an intent"""
@@ -99,9 +102,9 @@ class RLThresholdTuner:
         # Load or initialize
         self._load_state()
         
-        print(f"[RL Tuner] Initialized with {len(intents)} intents, {num_arms} arms per intent")
-        print(f"[RL Tuner] Threshold range: [{min_threshold:.2f}, {max_threshold:.2f}]")
-        print(f"[RL Tuner] Epsilon: {epsilon:.3f} (decay: {epsilon_decay}, min: {min_epsilon})")
+        logger.info(f"Initialized with {len(intents)} intents, {num_arms} arms per intent")
+        logger.info(f"Threshold range: [{min_threshold:.2f}, {max_threshold:.2f}]")
+        logger.info(f"Epsilon: {epsilon:.3f} (decay: {epsilon_decay}, min: {min_epsilon})")
     
     def _load_state(self):
         """Load saved state or initialize fresh"""
@@ -116,10 +119,9 @@ class RLThresholdTuner:
                     state = ThresholdState.from_dict(intent_data)
                     self.states[state.intent] = state
                 
-                print(f"[RL Tuner] Loaded state from {self.state_file}")
-                print(f"[RL Tuner] Current epsilon: {self.epsilon:.3f}")
+                logger.info(f"Loaded state from {self.state_file} (epsilon: {self.epsilon:.3f})")
             except Exception as e:
-                print(f"[RL Tuner] Failed to load state: {e}, initializing fresh")
+                logger.warning(f"Failed to load state: {e}, initializing fresh")
                 self._initialize_states()
         else:
             self._initialize_states()
@@ -133,7 +135,7 @@ class RLThresholdTuner:
                 arms=arms,
                 last_updated=datetime.now().isoformat()
             )
-        print(f"[RL Tuner] Initialized fresh state for {len(self.intents)} intents")
+        logger.info(f"Initialized fresh state for {len(self.intents)} intents")
     
     def save_state(self):
         """Persist current state to disk"""
@@ -149,9 +151,9 @@ class RLThresholdTuner:
             with open(self.state_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, indent=2, ensure_ascii=False)
             
-            print(f"[RL Tuner] State saved to {self.state_file}")
+            logger.debug(f"State saved to {self.state_file}")
         except Exception as e:
-            print(f"[RL Tuner] Failed to save state: {e}")
+            logger.error(f"Failed to save state: {e}")
     
     def get_threshold(
         self,
@@ -196,8 +198,15 @@ class RLThresholdTuner:
         if call_id:
             self.pending_experiences[call_id] = (intent, selected_threshold, context or {})
         
-        print(f"[RL Tuner] {intent}: threshold={selected_threshold:.3f} ({strategy}), "
-              f"epsilon={self.epsilon:.3f}, raw_conf={raw_confidence:.3f}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("threshold selected", extra={
+                "call_id": call_id,
+                "intent": intent,
+                "threshold": round(selected_threshold, 3),
+                "strategy": strategy,
+                "epsilon": round(self.epsilon, 3),
+                "raw_confidence": round(raw_confidence, 3),
+            })
         
         return selected_threshold
     
@@ -243,18 +252,18 @@ class RLThresholdTuner:
             final_intent: Actual intent if different from predicted
         """
         if call_id not in self.pending_experiences:
-            print(f"[RL Tuner] No pending experience for call_id={call_id}")
+            logger.info(f"No pending experience for call_id={call_id}")
             return
         
         intent, threshold, context = self.pending_experiences.pop(call_id)
         
         # Use final_intent if provided (user correction)
         if final_intent and final_intent != intent:
-            print(f"[RL Tuner] Intent corrected: {intent} -> {final_intent}")
+            logger.info(f"Intent corrected: {intent} -> {final_intent}", extra={"call_id": call_id})
             intent = final_intent
         
         if intent not in self.states:
-            print(f"[RL Tuner] Unknown intent: {intent}")
+            logger.warning(f"Unknown intent: {intent}", extra={"call_id": call_id})
             return
         
         state = self.states[intent]
@@ -267,7 +276,7 @@ class RLThresholdTuner:
                 break
         
         if arm_idx is None:
-            print(f"[RL Tuner] Could not find arm for threshold={threshold:.3f}")
+            logger.warning(f"Could not find arm for threshold={threshold:.3f}", extra={"call_id": call_id})
             return
         
         # Update arm statistics
@@ -279,9 +288,9 @@ class RLThresholdTuner:
         # Decay epsilon
         self.epsilon = max(self.min_epsilon, self.epsilon * self.epsilon_decay)
         
-        print(f"[RL Tuner] Updated {intent} arm[{arm_idx}] (threshold={threshold:.3f}): "
-              f"reward={reward:+.1f}, pulls={arm.pulls}, avg_reward={arm.average_reward:.3f}, "
-              f"new_epsilon={self.epsilon:.3f}")
+        logger.info(f"Updated {intent} arm[{arm_idx}] (threshold={threshold:.3f}): "
+                    f"reward={reward:+.1f}, pulls={arm.pulls}, avg_reward={arm.average_reward:.3f}, "
+                    f"new_epsilon={self.epsilon:.3f}")
         
         # Periodic save (every 10 updates)
         total_updates = sum(state.exploration_count + state.exploitation_count 
@@ -349,4 +358,4 @@ def shutdown_tuner():
     global _tuner_instance
     if _tuner_instance:
         _tuner_instance.save_state()
-        print("[RL Tuner] Shutdown complete")
+        logger.info("Shutdown complete")
@@ -0,0 +1,187 @@
+"""
+Dự đoán intent trên partial transcript (ASR streaming).
+Mỗi hypothesis mới: chạy lại các bước rẻ (entity), phân loại phần prefix đã
+ổn định (không đổi giữa hai hypothesis liên tiếp) và commit intent sớm khi nhãn
+giữ nguyên đủ số lần với confidence đủ cao. Transcript cuối luôn được đối chiếu
+với kết quả suy đoán trước khi trả về.
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.services import nlp_service
+from app.services.entity_extractor import extract_entities
+from app.services.tokenization import canonical_text
+from app.utils.metrics import histogram
+
+STREAM_COMMIT_STABLE_UPDATES = int(os.getenv("STREAM_COMMIT_STABLE_UPDATES", "3"))
+STREAM_COMMIT_MIN_CONFIDENCE = float(os.getenv("STREAM_COMMIT_MIN_CONFIDENCE", "0.85"))
+STREAM_MIN_PREFIX_WORDS = int(os.getenv("STREAM_MIN_PREFIX_WORDS", "1"))
+
+COMMIT_LEAD_MS_BUCKETS = (50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000)
+
+# Thời gian từ lúc commit intent tới lúc nhận transcript cuối = latency tiết kiệm được
+_commit_lead_ms = histogram(
+    "stream_commit_lead_ms", COMMIT_LEAD_MS_BUCKETS, "Time between early intent commit and final transcript"
+)
+
+_stats_lock = threading.Lock()
+_stats = {
+    "streams": 0,
+    "partials": 0,
+    "speculative_classifications": 0,
+    "commits": 0,
+    "finals": 0,
+    "reconciled_reused": 0,
+    "reconciled_confirmed": 0,
+    "reconciled_revised": 0,
+}
+
+
+def _count(key: str, n: int = 1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def _common_prefix(a: List[str], b: List[str]) -> List[str]:
+    prefix = []
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        prefix.append(x)
+    return prefix
+
+
+class PartialTranscriptSession:
+    """Trạng thái streaming của một lượt nói trong một cuộc gọi"""
+
+    def __init__(self, call_id: str):
+        self.call_id = call_id
+        self._previous_words: List[str] = []
+        self._attempted_prefix: Optional[str] = None  # prefix đã thử phân loại gần nhất
+        # (prefix, kết quả) của lần phân loại thành công gần nhất; chỉ dùng lại khi đúng prefix đó
+        self._speculation: Optional[Tuple[str, Dict[str, Any]]] = None
+        self._history: List[Tuple[str, float]] = []
+        self.committed: Optional[Dict[str, Any]] = None
+        self._committed_at: Optional[float] = None
+        _count("streams")
+
+    def _stable_prefix(self, text: str) -> str:
+        """Các từ giữ nguyên so với hypothesis trước (ASR thường chỉ sửa phần đuôi).
+
+        So sánh trên dạng canonical (giữ hoa/thường và dấu câu như lúc phân loại)
+        để prefix được phân loại đúng là văn bản sẽ được commit."""
+        words = canonical_text(text).split()
+        stable = _common_prefix(self._previous_words, words)
+        self._previous_words = words
+        return " ".join(stable)
+
+    def _should_commit(self) -> bool:
+        recent = self._history[-STREAM_COMMIT_STABLE_UPDATES:]
+        if len(recent) < STREAM_COMMIT_STABLE_UPDATES:
+            return False
+        labels = {label for label, _ in recent}
+        return (
+            len(labels) == 1
+            and "unknown" not in labels
+            and all(score >= STREAM_COMMIT_MIN_CONFIDENCE for _, score in recent)
+        )
+
+    async def update(self, text: str) -> Dict[str, Any]:
+        """Xử lý một partial hypothesis, trả về kết quả suy đoán hiện tại"""
+        _count("partials")
+        stable_prefix = self._stable_prefix(text)
+
+        if (
+            self.committed is None
+            and stable_prefix
+            and len(stable_prefix.split()) >= STREAM_MIN_PREFIX_WORDS
+            and stable_prefix != self._attempted_prefix
+        ):
+            result = await nlp_service.classify_partial_async(stable_prefix)
+            self._attempted_prefix = stable_prefix
+            if result is not None:
+                _count("speculative_classifications")
+                self._speculation = (stable_prefix, result)
+                self._history.append((result["label"], float(result["score"])))
+                if self._should_commit():
+                    self.committed = {
+                        "intent": result["label"],
+                        "confidence": float(result["score"]),
+                        "text": stable_prefix,
+                        "stage": result.get("stage", "model"),
+                    }
+                    self._committed_at = time.monotonic()
+                    _count("commits")
+
+        try:
+            entities = nlp_service.format_entities(extract_entities(text))
+        except Exception:
+            entities = {}
+
+        last = self._speculation[1] if self._speculation is not None else None
+        return {
+            "type": "partial_result",
+            "stable_prefix": stable_prefix,
+            "intent": last["label"] if last else None,
+            "confidence": float(last["score"]) if last else None,
+            "stable_updates": self._stable_count(),
+            "committed": self.committed,
+            "entities": entities,
+        }
+
+    def _stable_count(self) -> int:
+        if not self._history:
+            return 0
+        label = self._history[-1][0]
+        count = 0
+        for previous_label, _ in reversed(self._history):
+            if previous_label != label:
+                break
+            count += 1
+        return count
+
+    async def finalize(self, final_text: str) -> Dict[str, Any]:
+        """Chạy pipeline NLP đầy đủ cho transcript cuối và đối chiếu với intent đã commit.
+
+        Nếu transcript cuối (dạng canonical) trùng đúng prefix đã có kết quả phân loại
+        thì dùng lại kết quả đó thay vì inference lại; RL threshold, sentiment, entity
+        và ghi log vẫn chạy.
+        """
+        _count("finals")
+        if self._committed_at is not None:
+            _commit_lead_ms.observe((time.monotonic() - self._committed_at) * 1000)
+
+        speculation = self._speculation
+        reuse = speculation is not None and speculation[0] == canonical_text(final_text)
+        nlp_data = await nlp_service.process_nlp_tasks_async(
+            final_text, call_id=self.call_id, intent_result=speculation[1] if reuse else None
+        )
+
+        reconciliation = None
+        if self.committed is not None:
+            if reuse:
+                reconciliation = "reused"
+            elif nlp_data.get("raw_intent", nlp_data.get("intent")) == self.committed["intent"]:
+                reconciliation = "confirmed"
+            else:
+                reconciliation = "revised"
+            _count(f"reconciled_{reconciliation}")
+        return {
+            "nlp_data": nlp_data,
+            "speculative": self.committed,
+            "reconciliation": reconciliation,
+        }
+
+
+def get_streaming_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update(
+        commit_stable_updates=STREAM_COMMIT_STABLE_UPDATES,
+        commit_min_confidence=STREAM_COMMIT_MIN_CONFIDENCE,
+        commit_lead_ms=_commit_lead_ms.snapshot(),
+    )
+    return stats
@@ -0,0 +1,116 @@
+"""
+Tokenization stage cho intent/sentiment pipeline.
+- Token budget (NLP_MAX_TOKENS) cho cuộc gọi live: transcript ASR dài bị cắt
+- Padding theo bucket độ dài cố định để batch / graph đã trace dùng lại shape
+- Cache token ids cho các câu lặp lại
+- Histogram độ dài token để tinh chỉnh bucket
+"""
+
+import os
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+import torch
+
+from app.utils.cache import TTLCache
+from app.utils.metrics import histogram
+
+NLP_MAX_TOKENS = int(os.getenv("NLP_MAX_TOKENS", "64"))
+NLP_LENGTH_BUCKETS = sorted(
+    int(x) for x in os.getenv("NLP_LENGTH_BUCKETS", "16,32,64").split(",") if x.strip()
+)
+NLP_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("NLP_TOKEN_CACHE_MAX_ENTRIES", "20000"))
+
+TOKEN_LENGTH_BUCKETS = (4, 8, 12, 16, 24, 32, 48, 64, 96, 128, 256, 512)
+
+_token_cache = TTLCache(max_entries=NLP_TOKEN_CACHE_MAX_ENTRIES, ttl_seconds=None)
+token_length_hist = histogram(
+    "token_length", TOKEN_LENGTH_BUCKETS, "Số token (chưa cắt) của mỗi utterance"
+)
+padded_length_hist = histogram(
+    "padded_length", TOKEN_LENGTH_BUCKETS, "Độ dài sau khi pad theo bucket"
+)
+# Tăng từ nhiều thread NLP cùng lúc
+_truncated_count = 0
+_truncated_lock = threading.Lock()
+_SPACE_RE = re.compile(r"\s+")
+
+
+def canonical_text(text: str) -> str:
+    """NFC + gộp khoảng trắng. Không đổi hoa/thường hay dấu câu vì PhoBERT phân biệt chúng."""
+    return _SPACE_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def bucket_length(length: int, max_tokens: int = NLP_MAX_TOKENS) -> int:
+    """Bucket nhỏ nhất chứa được length; không vượt quá token budget"""
+    for bucket in NLP_LENGTH_BUCKETS:
+        if length <= bucket <= max_tokens:
+            return bucket
+    return max_tokens
+
+
+def _encode_one(tokenizer, text: str, max_tokens: int, cache_namespace: Optional[Any]) -> List[int]:
+    global _truncated_count
+    key = (cache_namespace, max_tokens, text) if cache_namespace is not None else None
+    if key is not None:
+        cached = _token_cache.get(key)
+        if cached is not None:
+            token_length_hist.observe(cached[1])
+            return cached[0]
+
+    ids = tokenizer.encode(text, add_special_tokens=False)
+    full_length = len(ids) + tokenizer.num_special_tokens_to_add(pair=False)
+    budget = max_tokens - tokenizer.num_special_tokens_to_add(pair=False)
+    if len(ids) > budget:
+        ids = ids[:budget]
+        with _truncated_lock:
+            _truncated_count += 1
+    ids = tokenizer.build_inputs_with_special_tokens(ids)
+    token_length_hist.observe(full_length)
+
+    if key is not None:
+        _token_cache.set(key, (ids, full_length))
+    return ids
+
+
+def encode_batch(
+    tokenizer,
+    texts: List[str],
+    cache_namespace: Optional[Any] = None,
+    max_tokens: int = NLP_MAX_TOKENS,
+    pad_to: Optional[int] = None,
+) -> Dict[str, torch.Tensor]:
+    """
+    Tokenize + pad batch tới bucket độ dài (hoặc pad_to nếu truyền vào).
+    cache_namespace: định danh tokenizer (vd. ("intent", model_version)); None = không cache.
+    """
+    encoded = [
+        _encode_one(tokenizer, canonical_text(text), max_tokens, cache_namespace)
+        for text in texts
+    ]
+    longest = max(len(ids) for ids in encoded)
+    target = max(pad_to or 0, bucket_length(longest, max_tokens))
+    padded_length_hist.observe(target)
+
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+    input_ids = torch.full((len(encoded), target), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(encoded), target), dtype=torch.long)
+    for row, ids in enumerate(encoded):
+        input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, :len(ids)] = 1
+    return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+
+def get_tokenization_stats() -> Dict[str, Any]:
+    with _truncated_lock:
+        truncated = _truncated_count
+    return {
+        "max_tokens": NLP_MAX_TOKENS,
+        "length_buckets": [b for b in NLP_LENGTH_BUCKETS if b <= NLP_MAX_TOKENS],
+        "truncated": truncated,
+        "token_length": token_length_hist.snapshot(),
+        "padded_length": padded_length_hist.snapshot(),
+        "token_cache": _token_cache.stats(),
+    }
@@ -0,0 +1,121 @@
+"""
+Cache workflow version theo workflow_versions.id.
+Một version không bao giờ đổi sau khi insert (PUT luôn tạo version mới, rollback
+chỉ dời workflows.current_version_id) nên version đã parse + kiểm tra được giữ
+tới khi bị đẩy ra theo LRU, giới hạn theo tổng byte JSON. Con trỏ
+current_version_id của từng workflow chỉ cache ngắn (TTL) và được cập nhật
+ngay khi PUT / rollback trong tiến trình này.
+
+Version trả về được dùng chung giữa các request: chỉ đọc, không sửa tại chỗ.
+"""
+
+import json
+import os
+from typing import Any, Dict, Optional
+
+from app.db import get_db
+from app.utils.cache import TTLCache
+from app.utils.metrics import gauge
+
+WORKFLOW_CACHE_MAX_BYTES = int(os.getenv("WORKFLOW_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+WORKFLOW_POINTER_TTL_SECONDS = float(os.getenv("WORKFLOW_POINTER_TTL_SECONDS", "5"))
+WORKFLOW_POINTER_MAX_ENTRIES = 10000
+
+
+class WorkflowVersionError(Exception):
+    """Version không tồn tại hoặc workflow_json không hợp lệ"""
+
+
+def _json_bytes(version: Dict[str, Any]) -> int:
+    return len(json.dumps(version.get("workflow_json"), ensure_ascii=False).encode("utf-8"))
+
+
+_versions = TTLCache(
+    max_entries=1_000_000,  # giới hạn thật là max_bytes
+    ttl_seconds=None,
+    sizeof=_json_bytes,
+    max_bytes=WORKFLOW_CACHE_MAX_BYTES,
+)
+_pointers = TTLCache(max_entries=WORKFLOW_POINTER_MAX_ENTRIES, ttl_seconds=WORKFLOW_POINTER_TTL_SECONDS)
+
+gauge("workflow_version_cache_bytes", lambda: _versions.stats()["bytes"], "Tổng byte workflow_json đang cache")
+gauge("workflow_version_cache_entries", lambda: len(_versions), "Số workflow version đang cache")
+
+
+def _compile(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Parse workflow_json (nếu còn là chuỗi) và kiểm tra trước khi đưa vào cache"""
+    workflow_json = row.get("workflow_json")
+    if isinstance(workflow_json, str):
+        try:
+            workflow_json = json.loads(workflow_json)
+        except ValueError as e:
+            raise WorkflowVersionError(f"workflow_json không phải JSON hợp lệ: {e}")
+    if not isinstance(workflow_json, dict) or not workflow_json:
+        raise WorkflowVersionError(f"Version {row.get('id')} không có workflow_json")
+    return {**row, "workflow_json": workflow_json}
+
+
+async def get_version(version_id: str) -> Dict[str, Any]:
+    """Version theo id; chỉ truy vấn DB lần đầu gặp id đó"""
+    version_id = str(version_id)
+    version = _versions.get(version_id)
+    if version is not None:
+        return version
+    row = await get_db().select_one("workflow_versions", where={"id": version_id})
+    if row is None:
+        raise WorkflowVersionError(f"Không tìm thấy workflow version {version_id}")
+    version = _compile(row)
+    _versions.set(version_id, version)
+    return version
+
+
+async def get_current_version_id(workflow_id: str) -> Optional[str]:
+    """current_version_id của workflow (cache TTL ngắn); None nếu workflow chưa có version"""
+    workflow_id = str(workflow_id)
+    version_id = _pointers.get(workflow_id)
+    if version_id is not None:
+        return version_id
+    db = get_db()
+    workflow = await db.select_one("workflows", "current_version_id", where={"id": workflow_id})
+    if workflow is None:
+        raise WorkflowVersionError(f"Không tìm thấy workflow {workflow_id}")
+    version_id = workflow.get("current_version_id")
+    if version_id is None:
+        # Dữ liệu cũ chưa có con trỏ: dùng version mới nhất
+        latest = await db.select(
+            "workflow_versions", "id", where={"workflow_id": workflow_id}, order="created_at", desc=True, limit=1
+        )
+        if not latest:
+            return None
+        version_id = latest[0]["id"]
+    version_id = str(version_id)
+    _pointers.set(workflow_id, version_id)
+    return version_id
+
+
+async def get_active_version(workflow_id: str) -> Dict[str, Any]:
+    version_id = await get_current_version_id(workflow_id)
+    if version_id is None:
+        raise WorkflowVersionError(f"Workflow {workflow_id} chưa có version nào")
+    return await get_version(version_id)
+
+
+def put_version(version: Dict[str, Any]):
+    """Đưa version vừa insert vào cache (tránh lần đọc lại đầu tiên)"""
+    try:
+        _versions.set(str(version["id"]), _compile(version))
+    except WorkflowVersionError:
+        pass  # version rỗng: để get_version báo lỗi khi có người dùng tới
+
+
+def set_current_version(workflow_id: str, version_id: str):
+    """Gọi sau khi PUT / rollback đã cập nhật workflows.current_version_id; tiến trình
+    khác thấy con trỏ mới sau tối đa WORKFLOW_POINTER_TTL_SECONDS"""
+    _pointers.set(str(workflow_id), str(version_id))
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "versions": _versions.stats(),
+        "pointers": _pointers.stats(),
+    }
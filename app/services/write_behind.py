@@ -0,0 +1,274 @@
+"""
+Write-behind cho các bảng chỉ-ghi trên đường nóng (conversation_logs, feedback).
+Caller chỉ put_nowait một dòng vào hàng đợi; một thread nền gom dòng theo bảng
+và ghi bằng bulk insert khi đủ max_rows hoặc dòng cũ nhất đã chờ quá
+flush_interval_ms. Insert lỗi được thử lại với backoff lũy thừa; stop() xả hết
+hàng đợi trước khi dừng.
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import time
+import logging
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from app import db
+from app.utils.metrics import gauge, histogram
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", "200"))
+WRITE_BEHIND_FLUSH_INTERVAL_MS = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL_MS", "500"))
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "50000"))
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "5"))
+WRITE_BEHIND_RETRY_BACKOFF_MS = float(os.getenv("WRITE_BEHIND_RETRY_BACKOFF_MS", "200"))
+WRITE_BEHIND_MAX_BACKOFF_MS = 5000.0
+
+FLUSH_MS_BUCKETS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+FLUSH_ROWS_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 500)
+
+_STOP = object()
+
+InsertFn = Callable[[str, List[Dict[str, Any]]], None]
+
+
+# Insert đang chạy như task trên event loop (giữ tham chiếu tới khi xong)
+_loop_inserts: Set["asyncio.Task"] = set()
+
+
+def _on_loop_insert_done(task: "asyncio.Task"):
+    _loop_inserts.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Lỗi khi ghi database: {task.exception()}")
+
+
+def bulk_insert(table: str, rows: List[Dict[str, Any]]):
+    """Một request insert cho cả batch, raise nếu lỗi.
+
+    Mọi đường ghi đi qua lớp app.db (theo DB_BACKEND):
+    - thread flush: gửi truy vấn sang event loop của app (dùng chung pool kết nối);
+    - ngay trên thread của loop (ghi đồng bộ khi write-behind tắt / đã stop): chạy
+      insert như một task để không chặn loop, lỗi được log khi task kết thúc;
+    - không có loop (script): chạy insert trong một event loop tạm. Riêng backend
+      postgrest dùng client supabase đồng bộ, vì AsyncClient gắn với loop của app.
+    """
+    if db.is_bound():
+        db.run_sync(
+            lambda database: database.insert(table, rows, returning=False),
+            timeout=db.DB_QUERY_TIMEOUT_SECONDS + 1,
+        )
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        task = loop.create_task(db.get_db().insert(table, rows, returning=False))
+        _loop_inserts.add(task)
+        task.add_done_callback(_on_loop_insert_done)
+        return
+    if db.DB_BACKEND != "postgrest":
+        asyncio.run(db.get_db().insert(table, rows, returning=False))
+        return
+    from app.database import supabase
+    response = supabase.table(table).insert(rows).execute()
+    if hasattr(response, 'error') and response.error:
+        raise Exception(f"Supabase error: {response.error}")
+
+
+class WriteBehindBuffer:
+    """
+    Bộ đệm ghi sau: submit() không chặn, thread nền flush theo kích thước hoặc tuổi.
+
+    Khi tắt (enabled=False) hoặc đã stop(), submit() ghi đồng bộ từng dòng như cũ.
+    """
+
+    def __init__(
+        self,
+        insert_fn: InsertFn = bulk_insert,
+        enabled: bool = WRITE_BEHIND_ENABLED,
+        max_rows: int = WRITE_BEHIND_MAX_ROWS,
+        flush_interval_ms: float = WRITE_BEHIND_FLUSH_INTERVAL_MS,
+        queue_size: int = WRITE_BEHIND_QUEUE_SIZE,
+        max_retries: int = WRITE_BEHIND_MAX_RETRIES,
+        retry_backoff_ms: float = WRITE_BEHIND_RETRY_BACKOFF_MS,
+        name: str = "write_behind",
+    ):
+        if max_rows < 1:
+            raise ValueError("max_rows phải >= 1")
+        self.insert_fn = insert_fn
+        self.enabled = enabled
+        self.max_rows = max_rows
+        self.flush_interval_ms = flush_interval_ms
+        self.max_retries = max_retries
+        self.retry_backoff_ms = retry_backoff_ms
+        self.name = name
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stopped = False
+        self._pending_rows = 0  # đã lấy khỏi hàng đợi nhưng chưa ghi xong
+        self._counters_lock = threading.Lock()
+        self._counters = {
+            "submitted": 0,
+            "written": 0,
+            "flushes": 0,
+            "retries": 0,
+            "failed": 0,
+            "dropped": 0,
+            "sync_writes": 0,
+        }
+        self.flush_ms_hist = histogram(
+            f"{name}_flush_ms", FLUSH_MS_BUCKETS, "Thời gian một bulk insert (ms, gồm cả retry)"
+        )
+        self.flush_rows_hist = histogram(
+            f"{name}_flush_rows", FLUSH_ROWS_BUCKETS, "Số dòng mỗi bulk insert"
+        )
+        gauge(f"{name}_queue_depth", self.depth, "Số dòng đang chờ ghi xuống database")
+
+    def _count(self, key: str, n: int = 1):
+        with self._counters_lock:
+            self._counters[key] += n
+
+    def depth(self) -> int:
+        return self._queue.qsize() + self._pending_rows
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f"{self.name}-flusher", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, table: str, row: Dict[str, Any]) -> bool:
+        """Đưa một dòng vào hàng đợi; False nếu dòng bị bỏ (hàng đợi đầy) hoặc ghi đồng bộ lỗi"""
+        self._count("submitted")
+        if not self.enabled or self._stopped:
+            return self._write_sync(table, row)
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((table, row, time.monotonic()))
+        except queue.Full:
+            self._count("dropped")
+            dropped = self._counters["dropped"]
+            if dropped == 1 or dropped % 1000 == 0:
+                logger.warning(f"[{self.name}] Hàng đợi đầy, đã bỏ {dropped} dòng", extra={"table": table})
+            return False
+        return True
+
+    def _write_sync(self, table: str, row: Dict[str, Any]) -> bool:
+        self._count("sync_writes")
+        try:
+            self.insert_fn(table, [row])
+        except Exception as e:
+            self._count("failed")
+            logger.error(f"[{self.name}] Lỗi khi ghi {table}: {e}")
+            return False
+        self._count("written")
+        return True
+
+    def stop(self, timeout: float = 30.0):
+        """Ghi nốt mọi dòng đang chờ rồi dừng thread flush"""
+        self._stopped = True
+        if self._thread is not None and self._thread.is_alive():
+            # put (có chặn) để chắc chắn marker vào được hàng đợi kể cả khi đầy
+            self._queue.put(_STOP)
+            self._thread.join(timeout=timeout)
+            if self._thread.is_alive():
+                logger.error(f"[{self.name}] Chưa xả xong sau {timeout}s, còn {self.depth()} dòng")
+
+    def _run(self):
+        interval = self.flush_interval_ms / 1000.0
+        batches: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        buffered = 0
+        oldest: Optional[float] = None
+        stopping = False
+        while not stopping:
+            timeout = interval if oldest is None else max(0.0, oldest + interval - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                stopping = True
+                # Lấy nốt những gì còn trong hàng đợi
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        batches[item[0]].append(item[1])
+                        buffered += 1
+            elif item is not None:
+                table, row, enqueued_at = item
+                batches[table].append(row)
+                buffered += 1
+                if oldest is None:
+                    oldest = enqueued_at
+            self._pending_rows = buffered
+
+            due = oldest is not None and time.monotonic() - oldest >= interval
+            if buffered and (stopping or due or buffered >= self.max_rows):
+                self._flush(batches)
+                batches = defaultdict(list)
+                buffered = 0
+                oldest = None
+                self._pending_rows = 0
+
+    def _flush(self, batches: Dict[str, List[Dict[str, Any]]]):
+        for table, rows in batches.items():
+            for start in range(0, len(rows), self.max_rows):
+                chunk = rows[start:start + self.max_rows]
+                self._insert_with_retry(table, chunk)
+                self._pending_rows = max(0, self._pending_rows - len(chunk))
+
+    def _insert_with_retry(self, table: str, rows: List[Dict[str, Any]]):
+        started = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.insert_fn(table, rows)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self._count("failed", len(rows))
+                    logger.error(
+                        f"[{self.name}] Bỏ {len(rows)} dòng {table} sau {attempt + 1} lần thử: {e}"
+                    )
+                    break
+                self._count("retries")
+                backoff_ms = min(self.retry_backoff_ms * (2 ** attempt), WRITE_BEHIND_MAX_BACKOFF_MS)
+                logger.warning(f"[{self.name}] Lỗi khi ghi {table} ({e}), thử lại sau {backoff_ms:.0f}ms")
+                time.sleep(backoff_ms / 1000.0)
+            else:
+                self._count("written", len(rows))
+                break
+        self._count("flushes")
+        self.flush_rows_hist.observe(len(rows))
+        self.flush_ms_hist.observe((time.perf_counter() - started) * 1000.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counters_lock:
+            counters = dict(self._counters)
+        return {
+            "enabled": self.enabled,
+            "max_rows": self.max_rows,
+            "flush_interval_ms": self.flush_interval_ms,
+            "queue_depth": self._queue.qsize(),
+            "pending_rows": self._pending_rows,
+            "running": self._thread is not None and self._thread.is_alive(),
+            **counters,
+            "flush_ms": self.flush_ms_hist.snapshot(),
+            "flush_rows": self.flush_rows_hist.snapshot(),
+        }
+
+
+# Dùng chung cho conversation_logs + feedback (confidence thấp)
+log_writer = WriteBehindBuffer()
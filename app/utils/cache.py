@@ -0,0 +1,118 @@
+"""
+Bounded LRU + TTL cache dùng chung cho các service
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU cache giới hạn số phần tử, mỗi phần tử hết hạn sau ttl_seconds.
+    ttl_seconds=None nghĩa là không hết hạn (chỉ bị đẩy ra theo LRU).
+    sizeof (tùy chọn) ước lượng số byte của mỗi value, tính lúc set, để báo
+    tổng bộ nhớ đang giữ trong stats(); kèm max_bytes thì cache còn bị giới hạn
+    theo tổng byte (value lớn hơn max_bytes không được cache).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: Optional[float] = 600.0,
+        sizeof: Optional[Callable[[Any], int]] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("max_bytes cần sizeof")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.sizeof = sizeof
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value, size = entry
+            if expires_at is not None and expires_at <= now:
+                del self._data[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._data.get(key)
+            if previous is not None:
+                self._bytes -= previous[2]
+                self._data.move_to_end(key)
+            self._data[key] = (expires_at, value, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= evicted[2]
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            if entry is not _MISSING:
+                self._bytes -= entry[2]
+        return default if entry is _MISSING else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._data)
+            total_bytes = self._bytes
+            hits, misses = self.hits, self.misses
+            evictions, expirations = self.evictions, self.expirations
+        lookups = hits + misses
+        stats = {
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "expirations": expirations,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+        if self.sizeof is not None:
+            stats["bytes"] = total_bytes
+        if self.max_bytes is not None:
+            stats["max_bytes"] = self.max_bytes
+        return stats
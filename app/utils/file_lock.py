@@ -0,0 +1,62 @@
+"""
+Khóa file độc quyền giữa các tiến trình (POSIX: fcntl.flock, Windows: msvcrt.locking).
+Khóa gắn với file handle đang mở: tiến trình chết thì hệ điều hành tự nhả khóa.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import IO, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_POLL_SECONDS = 0.05
+
+
+def try_lock(handle: IO) -> bool:
+    """Khóa độc quyền không chờ trên một file đang mở; False nếu tiến trình khác giữ"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def unlock(handle: IO):
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+    except OSError:
+        pass
+
+
+@contextmanager
+def exclusive_lock(path: str, timeout: Optional[float] = None) -> Iterator[bool]:
+    """Giữ khóa trên file `path` (tạo nếu chưa có) trong khối with.
+
+    timeout=None chờ tới khi lấy được; timeout=0 thử một lần. Giá trị yield là
+    True nếu đã lấy được khóa.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with open(path, "a+b") as handle:
+        acquired = try_lock(handle)
+        while not acquired and (deadline is None or time.monotonic() < deadline):
+            time.sleep(_POLL_SECONDS)
+            acquired = try_lock(handle)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                unlock(handle)
@@ -1,66 +1,218 @@
 """
 Centralized logging configuration
+
+Mọi record đi qua một QueueHandler (put_nowait, không chặn thread request) tới
+một QueueListener chạy thread nền; chỉ thread đó ghi ra stdout và file log
+(xoay vòng theo dung lượng và theo ngày). Hàng đợi đầy thì record bị bỏ và
+được đếm, thay vì làm chậm request.
 """
 
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import sys
+import threading
+import time
+import zlib
 from pathlib import Path
-from datetime import datetime
+from typing import Any, Dict, Optional
 
-# Tạo thư mục logs nếu chưa có
-LOG_DIR = Path(__file__).parent.parent.parent / "logs"
-LOG_DIR.mkdir(exist_ok=True)
+# Thư mục logs (tạo khi configure_logging chạy, không tạo lúc import)
+LOG_DIR = Path(os.getenv("LOG_DIR", Path(__file__).parent.parent.parent / "logs"))
 
 # Format cho log
 LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_JSON = os.getenv("LOG_JSON", "false").lower() == "true"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "14"))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")
+# Tỉ lệ cuộc gọi (0..1) được ghi log debug chi tiết (vd. toàn bộ kết quả NLP)
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0"))
+
+# Thuộc tính chuẩn của LogRecord; phần còn lại (extra=...) là field có cấu trúc
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def _record_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {k: v for k, v in record.__dict__.items() if k not in _RESERVED_ATTRS}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Text: message + ' key=value' cho các field extra; JSON: một object mỗi dòng"""
+
+    def __init__(self, as_json: bool = False):
+        super().__init__(LOG_FORMAT, DATE_FORMAT)
+        self.as_json = as_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = _record_fields(record)
+        if self.as_json:
+            payload = {
+                "ts": self.formatTime(record, DATE_FORMAT),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": record.getMessage(),
+                **fields,
+            }
+            if record.exc_info:
+                payload["exc"] = self.formatException(record.exc_info)
+            return json.dumps(payload, ensure_ascii=False, default=str)
+        text = super().format(record)
+        if fields:
+            text += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return text
+
+
+class SizedTimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """Xoay file theo thời gian (when) hoặc khi vượt max_bytes, cái nào tới trước"""
+
+    def __init__(self, filename, max_bytes: int = 0, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record) -> bool:
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes > 0 and self.stream is not None:
+            self.stream.seek(0, 2)
+            return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+        return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler không bao giờ chặn: hàng đợi đầy thì bỏ record và đếm"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_config_lock = threading.Lock()
+
+
+def _build_handlers(level: int):
+    formatter = StructuredFormatter(as_json=LOG_JSON)
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+
+    # Console handler
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(level)
+    console_handler.setFormatter(formatter)
+
+    # File handler - lưu tất cả logs (xoay theo ngày + dung lượng)
+    file_handler = SizedTimedRotatingFileHandler(
+        LOG_DIR / "voiceai.log", max_bytes=LOG_MAX_BYTES, when=LOG_ROTATE_WHEN,
+        backupCount=LOG_BACKUP_COUNT, encoding="utf-8", delay=True
+    )
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(formatter)
+
+    # Error file handler - chỉ lưu errors
+    error_handler = SizedTimedRotatingFileHandler(
+        LOG_DIR / "voiceai_error.log", max_bytes=LOG_MAX_BYTES, when=LOG_ROTATE_WHEN,
+        backupCount=LOG_BACKUP_COUNT, encoding="utf-8", delay=True
+    )
+    error_handler.setLevel(logging.ERROR)
+    error_handler.setFormatter(formatter)
+    return console_handler, file_handler, error_handler
+
+
+def configure_logging(level: Optional[str] = None):
+    """Gắn QueueHandler vào root logger và khởi động thread ghi log (idempotent).
+
+    App gọi trong app.main; script gọi đầu main() (hoặc gián tiếp qua setup_logger).
+    Thread ghi log được xả khi tiến trình thoát (atexit), nên script không mất log cuối.
+    """
+    global _listener, _queue_handler
+    with _config_lock:
+        if _listener is not None:
+            return
+        level_no = logging.getLevelName(level or LOG_LEVEL)
+        if not isinstance(level_no, int):
+            level_no = logging.INFO
+
+        log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _queue_handler = NonBlockingQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(
+            log_queue, *_build_handlers(level_no), respect_handler_level=True
+        )
+        _listener.start()
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(level_no)
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Dừng thread ghi log sau khi đã xả hết hàng đợi (gọi lúc app shutdown)"""
+    global _listener
+    with _config_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def get_logging_stats() -> Dict[str, Any]:
+    if _queue_handler is None:
+        return {"configured": False}
+    return {
+        "configured": True,
+        "queue_size": _queue_handler.queue.qsize(),
+        "queue_capacity": LOG_QUEUE_SIZE,
+        "dropped": _queue_handler.dropped,
+        "debug_sample_rate": LOG_DEBUG_SAMPLE_RATE,
+    }
+
+
+def debug_sampled(call_id: Optional[str]) -> bool:
+    """Cuộc gọi này có được ghi log debug chi tiết không (ổn định theo call_id)"""
+    if LOG_DEBUG_SAMPLE_RATE <= 0:
+        return False
+    if LOG_DEBUG_SAMPLE_RATE >= 1:
+        return True
+    key = call_id if call_id is not None else str(time.monotonic_ns())
+    return zlib.crc32(key.encode("utf-8")) < LOG_DEBUG_SAMPLE_RATE * 0xFFFFFFFF
+
+
 def setup_logger(name: str, level=logging.INFO) -> logging.Logger:
     """
-    Tạo logger với cấu hình đầy đủ
-    
+    Lấy logger theo tên, cấu hình logging nếu chưa có; handler nằm ở root (qua
+    hàng đợi) nên không gắn handler riêng
+
     Args:
         name: Tên của logger (thường là __name__)
         level: Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
-    
+
     Returns:
-        Configured logger instance
+        Logger instance
     """
+    configure_logging()
     logger = logging.getLogger(name)
     logger.setLevel(level)
-    
-    # Tránh duplicate handlers
-    if logger.handlers:
-        return logger
-    
-    # Console handler
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(level)
-    console_formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
-    console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
-    
-    # File handler - lưu tất cả logs
-    log_file = LOG_DIR / f"voiceai_{datetime.now().strftime('%Y%m%d')}.log"
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
-    file_handler.setLevel(logging.DEBUG)  # Log tất cả vào file
-    file_formatter = logging.Formatter(LOG_FORMAT, DATE_FORMAT)
-    file_handler.setFormatter(file_formatter)
-    logger.addHandler(file_handler)
-    
-    # Error file handler - chỉ lưu errors
-    error_file = LOG_DIR / f"voiceai_error_{datetime.now().strftime('%Y%m%d')}.log"
-    error_handler = logging.FileHandler(error_file, encoding='utf-8')
-    error_handler.setLevel(logging.ERROR)
-    error_handler.setFormatter(file_formatter)
-    logger.addHandler(error_handler)
-    
     return logger
 
 
-# Pre-configured loggers cho các services
-api_logger = setup_logger("api")
-nlp_logger = setup_logger("nlp")
-dialog_logger = setup_logger("dialog")
-asterisk_logger = setup_logger("asterisk")
-db_logger = setup_logger("database")
+# Pre-configured loggers cho các services (handler ở root, cấu hình bởi configure_logging)
+api_logger = logging.getLogger("api")
+nlp_logger = logging.getLogger("nlp")
+dialog_logger = logging.getLogger("dialog")
+asterisk_logger = logging.getLogger("asterisk")
+db_logger = logging.getLogger("database")
@@ -0,0 +1,167 @@
+"""
+Lightweight in-process metrics (histograms) cho các đường nóng
+"""
+
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, Optional, Any, Tuple
+
+
+class Histogram:
+    """Histogram với bucket cố định, thread-safe, chi phí observe O(log buckets)"""
+
+    def __init__(
+        self,
+        name: str,
+        buckets: Iterable[float],
+        description: str = "",
+        labels: Optional[Dict[str, str]] = None
+    ):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # bucket cuối là +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+            if value > self._max:
+                self._max = value
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Ước lượng percentile theo cận trên của bucket chứa nó"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            max_value = self._max
+        if total == 0:
+            return None
+        target = q * total
+        cumulative = 0
+        for idx, count in enumerate(counts):
+            cumulative += count
+            if cumulative >= target:
+                return self.buckets[idx] if idx < len(self.buckets) else max_value
+        return max_value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            total_sum = self._sum
+        labels = [str(b) for b in self.buckets] + ["+Inf"]
+        return {
+            "count": total,
+            "sum": total_sum,
+            "mean": total_sum / total if total else 0.0,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "buckets": dict(zip(labels, counts)),
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self._sum = 0.0
+            self._count = 0
+            self._max = 0.0
+
+
+_registry: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+_registry_lock = threading.Lock()
+_gauges: Dict[str, Tuple[Callable[[], float], str]] = {}
+
+METRICS_PREFIX = "voiceai_"
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+def histogram(
+    name: str,
+    buckets: Iterable[float],
+    description: str = "",
+    labels: Optional[Dict[str, str]] = None
+) -> Histogram:
+    """Lấy (hoặc tạo) histogram theo tên (+ label) trong registry toàn cục"""
+    key = (name, tuple(sorted((labels or {}).items())))
+    with _registry_lock:
+        hist = _registry.get(key)
+        if hist is None:
+            hist = Histogram(name, buckets, description, labels)
+            _registry[key] = hist
+        return hist
+
+
+def gauge(name: str, fn: Callable[[], float], description: str = ""):
+    """Đăng ký gauge đọc giá trị lúc export (vd. độ sâu hàng đợi); đăng ký lại sẽ ghi đè"""
+    with _registry_lock:
+        _gauges[name] = (fn, description)
+
+
+def get_metrics_snapshot() -> Dict[str, Dict[str, Any]]:
+    """Snapshot tất cả histogram đã đăng ký (khóa: name{label="..."})"""
+    with _registry_lock:
+        items = list(_registry.values())
+    return {hist.name + _format_labels(hist.labels): hist.snapshot() for hist in items}
+
+
+def render_prometheus() -> str:
+    """Xuất mọi histogram theo text format của Prometheus (bucket cộng dồn, _sum, _count)
+    kèm gauge <name>_quantile cho p50/p95/p99 ước lượng và các gauge đã đăng ký"""
+    with _registry_lock:
+        items = sorted(_registry.values(), key=lambda h: (h.name, sorted(h.labels.items())))
+
+    lines = []
+    previous_name = None
+    for hist in items:
+        name = METRICS_PREFIX + hist.name
+        if name != previous_name:
+            if hist.description:
+                lines.append(f"# HELP {name} {hist.description}")
+            lines.append(f"# TYPE {name} histogram")
+            previous_name = name
+        snap = hist.snapshot()
+        cumulative = 0
+        for le, count in snap["buckets"].items():
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels({**hist.labels, 'le': le})} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(hist.labels)} {snap['sum']}")
+        lines.append(f"{name}_count{_format_labels(hist.labels)} {snap['count']}")
+
+    previous_name = None
+    for hist in items:
+        name = f"{METRICS_PREFIX}{hist.name}_quantile"
+        if name != previous_name:
+            lines.append(f"# TYPE {name} gauge")
+            previous_name = name
+        for q in (0.5, 0.95, 0.99):
+            value = hist.percentile(q)
+            if value is not None:
+                lines.append(f"{name}{_format_labels({**hist.labels, 'quantile': str(q)})} {value}")
+
+    with _registry_lock:
+        gauges = sorted(_gauges.items())
+    for gauge_name, (fn, description) in gauges:
+        try:
+            value = float(fn())
+        except Exception:
+            continue
+        name = METRICS_PREFIX + gauge_name
+        if description:
+            lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -4,8 +4,9 @@ from pathlib import Path
 import logging
 from ..services.model_manager import ModelManager
 from ..services.nlp_service import NLPService
+from ..utils.logger import configure_logging
 
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Kết nối Redis
@@ -24,7 +25,8 @@ def retrain_model(feedback_data_path: str, base_model_path: str):
         logger.info(f"Bắt đầu huấn luyện lại mô hình với dữ liệu từ {feedback_data_path}")
         
         # Implementation plan:
-        # 1. Load feedback data from CSV
+        # 1. Stream feedback since the last trained cursor:
+        #    app.services.feedback_journal.read_since(cursor, directory=Path(feedback_data_path))
         # 2. Merge with existing training data
         # 3. Run fine-tuning with manual_train.py logic
         # 4. Save new model checkpoint
@@ -0,0 +1,158 @@
+"""
+Call Analytics Backfill - dựng lại call_intents / call_entities từ conversation_logs
+Duyệt bảng calls theo trang (keyset trên id). Với mỗi trang, đọc các lượt user
+của những cuộc gọi đã kết thúc (lọc call_id IN ..., dùng idx_convlogs_call_id),
+tổng hợp như aggregator lúc gọi, upsert đè theo khóa (call_id, intent_name) /
+(call_id, entity_name, value) rồi xóa các dòng không còn trong kết quả. Không có
+lúc nào bảng trống dòng của cuộc gọi, và cuộc gọi đang diễn ra (aggregator còn
+giữ trong bộ nhớ) được bỏ qua.
+Entity lấy từ conversation_logs.entities; dòng chưa có thì trích lại từ text.
+Tiến độ lưu ở checkpoint sau mỗi trang; chạy lại cùng lệnh để tiếp tục.
+Chạy: python backfill_call_analytics.py --page-size 500
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from app.utils.logger import configure_logging
+from backfill_conversation_nlp import load_checkpoint, save_checkpoint
+
+# PostgREST trả tối đa 1000 dòng mỗi request
+LOG_FETCH_SIZE = 1000
+INSERT_CHUNK_SIZE = 1000
+
+
+# Cuộc gọi còn đang diễn ra thuộc về aggregator lúc gọi
+OPEN_CALL_STATUSES = ("pending", "in_progress")
+
+
+async def fetch_calls(db, cursor, page_size):
+    where = [("id", "gt", cursor)] if cursor else None
+    return await db.select("calls", "id, status", where=where, order="id", limit=page_size)
+
+
+async def fetch_user_turns(db, call_ids):
+    """Mọi lượt user của các cuộc gọi, đọc theo keyset id trong tập call_id"""
+    rows, last_id = [], None
+    while True:
+        where = [("call_id", "in", call_ids), ("speaker", "eq", "user")]
+        if last_id:
+            where.append(("id", "gt", last_id))
+        page = await db.select(
+            "conversation_logs", "id, call_id, text, intent, confidence, entities",
+            where=where, order="id", limit=LOG_FETCH_SIZE
+        )
+        rows.extend(page)
+        if len(page) < LOG_FETCH_SIZE:
+            return rows
+        last_id = page[-1]["id"]
+
+
+def aggregate(call_ids, turns):
+    from app.services.call_analytics import CallAggregate
+    from app.services.entity_extractor import extract_entities, format_entities
+
+    aggregates = {call_id: CallAggregate() for call_id in call_ids}
+    for turn in turns:
+        entities = turn.get("entities")
+        if entities is None and turn.get("text"):
+            entities = format_entities(extract_entities(turn["text"]))
+        aggregates[turn["call_id"]].add(turn.get("intent"), turn.get("confidence"), entities)
+
+    intent_rows, entity_rows = [], []
+    for call_id, agg in aggregates.items():
+        intent_rows.extend(agg.intent_rows(call_id))
+        entity_rows.extend(agg.entity_rows(call_id))
+    return intent_rows, entity_rows
+
+
+async def replace_rows(db, table, call_ids, rows):
+    # Upsert đè rồi xóa dòng thừa: chạy lại một trang không nhân đôi dòng, và ghi
+    # cộng dồn của aggregator chạy song song vẫn đụng đúng một dòng theo khóa
+    from app.services.call_analytics import ENTITY_CONFLICT, INTENT_CONFLICT
+
+    key_columns = (INTENT_CONFLICT if table == "call_intents" else ENTITY_CONFLICT).split(",")
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        await db.upsert(table, rows[start:start + INSERT_CHUNK_SIZE], on_conflict=",".join(key_columns))
+    keep = {tuple(str(row[c]) for c in key_columns) for row in rows}
+    existing = await db.select(table, "id, " + ", ".join(key_columns), where=[("call_id", "in", call_ids)])
+    stale = [row["id"] for row in existing if tuple(str(row[c]) for c in key_columns) not in keep]
+    for start in range(0, len(stale), INSERT_CHUNK_SIZE):
+        await db.delete(table, [("id", "in", stale[start:start + INSERT_CHUNK_SIZE])])
+
+
+async def run(args):
+    from app.db import close_db, get_db
+
+    db = get_db()
+    checkpoint = None if args.reset else load_checkpoint(args.checkpoint)
+    if checkpoint is None:
+        checkpoint = {
+            'cursor': None,
+            'calls': 0,
+            'pages': 0,
+            'intent_rows': 0,
+            'entity_rows': 0,
+            'started_at': datetime.now().isoformat(),
+        }
+    elif checkpoint.get('completed_at'):
+        print(f"Backfill đã hoàn tất lúc {checkpoint['completed_at']} ({checkpoint['calls']} cuộc gọi).")
+        return
+    else:
+        print(f"Tiếp tục từ call id > {checkpoint['cursor']} ({checkpoint['calls']} cuộc gọi đã xử lý)")
+
+    run_calls = 0
+    run_started = time.perf_counter()
+    try:
+        while not args.max_calls or run_calls < args.max_calls:
+            page_started = time.perf_counter()
+            calls = await fetch_calls(db, checkpoint['cursor'], args.page_size)
+            if not calls:
+                checkpoint['completed_at'] = datetime.now().isoformat()
+                save_checkpoint(args.checkpoint, checkpoint)
+                break
+
+            call_ids = [call['id'] for call in calls if call.get('status') not in OPEN_CALL_STATUSES]
+            turns, intent_rows, entity_rows = [], [], []
+            if call_ids:
+                turns = await fetch_user_turns(db, call_ids)
+                intent_rows, entity_rows = aggregate(call_ids, turns)
+                await replace_rows(db, 'call_intents', call_ids, intent_rows)
+                await replace_rows(db, 'call_entities', call_ids, entity_rows)
+
+            checkpoint['cursor'] = calls[-1]['id']
+            checkpoint['calls'] += len(calls)
+            checkpoint['pages'] += 1
+            checkpoint['intent_rows'] += len(intent_rows)
+            checkpoint['entity_rows'] += len(entity_rows)
+            save_checkpoint(args.checkpoint, checkpoint)
+
+            run_calls += len(calls)
+            page_rate = len(calls) / (time.perf_counter() - page_started)
+            print(f"Trang {checkpoint['pages']}: {len(calls)} cuộc gọi "
+                  f"(bỏ qua {len(calls) - len(call_ids)} đang diễn ra), {len(turns)} lượt, "
+                  f"{len(intent_rows)} intent / {len(entity_rows)} entity, {page_rate:.1f} calls/s")
+    finally:
+        await close_db()
+
+    elapsed = time.perf_counter() - run_started
+    print(f"\nXong lần chạy này: {run_calls} cuộc gọi trong {elapsed:.1f}s "
+          f"({run_calls / elapsed if elapsed else 0:.1f} calls/s)")
+    if checkpoint.get('completed_at'):
+        print(f"Backfill hoàn tất: {checkpoint['calls']} cuộc gọi. Checkpoint: {args.checkpoint}")
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Dựng lại call_intents / call_entities từ conversation_logs")
+    parser.add_argument('--page-size', type=int, default=500, help="Số cuộc gọi mỗi trang")
+    parser.add_argument('--checkpoint', default='data/call_analytics_checkpoint.json')
+    parser.add_argument('--max-calls', type=int, default=0, help="Dừng sau N cuộc gọi (0 = hết dữ liệu)")
+    parser.add_argument('--reset', action='store_true', help="Bỏ checkpoint cũ, chạy lại từ đầu")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Conversation NLP Backfill - chấm lại conversation_logs bằng model hiện tại
+Đọc các dòng speaker='user' theo trang (keyset trên id), chạy intent + sentiment
++ entity theo batch (không ghi log, không cập nhật RL tuner) rồi:
+  --write-back        : upsert intent/confidence/sentiment/entities về conversation_logs
+  --output <thư mục>  : ghi mỗi trang một file part-XXXXX.parquet
+Tiến độ lưu ở checkpoint sau mỗi trang; chạy lại cùng lệnh để tiếp tục.
+Chạy: python backfill_conversation_nlp.py --output data/backfill --page-size 500
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from app.utils.logger import configure_logging
+
+
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return None
+
+
+def save_checkpoint(path, checkpoint):
+    """Ghi file tạm rồi os.replace để checkpoint không bao giờ bị ghi dở"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def fetch_page(supabase, cursor, page_size):
+    # Keyset theo id (khóa chính): trang sau không phụ thuộc offset, resume chỉ cần id cuối
+    query = supabase.table('conversation_logs') \
+        .select('id, call_id, speaker, text, created_at') \
+        .eq('speaker', 'user')
+    if cursor:
+        query = query.gt('id', cursor)
+    return query.order('id').limit(page_size).execute().data or []
+
+
+def to_record(row, result, model):
+    return {
+        'id': row['id'],
+        'call_id': row['call_id'],
+        'speaker': row['speaker'],
+        'text': row['text'],
+        'intent': result['intent'],
+        'confidence': result['intent_confidence'],
+        'sentiment': result['sentiment'],
+        'entities': result['entities'],
+        'scored_model': model,
+    }
+
+
+def write_parquet(output_dir, page_index, records, created_at):
+    import pandas as pd
+    os.makedirs(output_dir, exist_ok=True)
+    df = pd.DataFrame(records)
+    df['created_at'] = created_at
+    # entities là dict lồng nhau -> lưu JSON string cho schema Parquet ổn định
+    df['entities'] = df['entities'].map(lambda e: json.dumps(e, ensure_ascii=False))
+    path = os.path.join(output_dir, f"part-{page_index:05d}.parquet")
+    df.to_parquet(path, index=False)
+    return path
+
+
+def write_back(supabase, records):
+    # Upsert theo id: chỉ các cột được gửi bị cập nhật, created_at giữ nguyên
+    supabase.table('conversation_logs').upsert(records, on_conflict='id').execute()
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Chấm lại conversation_logs bằng model NLP hiện tại")
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=32, help="Số utterance mỗi forward pass")
+    parser.add_argument('--output', help="Thư mục ghi Parquet (mỗi trang một file)")
+    parser.add_argument('--write-back', action='store_true', help="Upsert kết quả về conversation_logs")
+    parser.add_argument('--checkpoint', default='data/backfill_checkpoint.json')
+    parser.add_argument('--max-rows', type=int, default=0, help="Dừng sau N dòng (0 = hết dữ liệu)")
+    parser.add_argument('--reset', action='store_true', help="Bỏ checkpoint cũ, chạy lại từ đầu")
+    args = parser.parse_args()
+
+    if not args.output and not args.write_back:
+        parser.error("Cần --output và/hoặc --write-back")
+
+    from app.database import supabase
+    from app.services import nlp_service
+
+    nlp_service.load_models()
+    model = nlp_service.get_scoring_model()
+    print(f"Model: {model or 'fallback rules (không tải được intent model)'}")
+
+    checkpoint = None if args.reset else load_checkpoint(args.checkpoint)
+    if checkpoint and checkpoint.get('model') != model:
+        print(f"Checkpoint được tạo với model khác ({checkpoint.get('model')}). Dùng --reset để chạy lại.")
+        sys.exit(1)
+    if checkpoint is None:
+        checkpoint = {
+            'model': model,
+            'cursor': None,
+            'rows': 0,
+            'pages': 0,
+            'started_at': datetime.now().isoformat(),
+        }
+    elif checkpoint.get('completed_at'):
+        print(f"Backfill đã hoàn tất lúc {checkpoint['completed_at']} ({checkpoint['rows']} dòng).")
+        return
+    else:
+        print(f"Tiếp tục từ id > {checkpoint['cursor']} ({checkpoint['rows']} dòng đã xử lý)")
+
+    run_rows = 0
+    run_started = time.perf_counter()
+    while not args.max_rows or run_rows < args.max_rows:
+        page_started = time.perf_counter()
+        rows = fetch_page(supabase, checkpoint['cursor'], args.page_size)
+        if not rows:
+            checkpoint['completed_at'] = datetime.now().isoformat()
+            save_checkpoint(args.checkpoint, checkpoint)
+            break
+
+        results = nlp_service.analyze_texts([row['text'] for row in rows], batch_size=args.batch_size)
+        records = [to_record(row, result, model) for row, result in zip(rows, results)]
+
+        if args.write_back:
+            write_back(supabase, records)
+        if args.output:
+            write_parquet(args.output, checkpoint['pages'], records, [row['created_at'] for row in rows])
+
+        checkpoint['cursor'] = rows[-1]['id']
+        checkpoint['rows'] += len(rows)
+        checkpoint['pages'] += 1
+        save_checkpoint(args.checkpoint, checkpoint)
+
+        run_rows += len(rows)
+        page_rate = len(rows) / (time.perf_counter() - page_started)
+        total_rate = run_rows / (time.perf_counter() - run_started)
+        print(f"Trang {checkpoint['pages']}: {len(rows)} dòng, {page_rate:.1f} rows/s "
+              f"(trung bình {total_rate:.1f} rows/s, tổng {checkpoint['rows']})")
+
+    elapsed = time.perf_counter() - run_started
+    print(f"\nXong lần chạy này: {run_rows} dòng trong {elapsed:.1f}s "
+          f"({run_rows / elapsed if elapsed else 0:.1f} rows/s)")
+    if checkpoint.get('completed_at'):
+        print(f"Backfill hoàn tất: {checkpoint['rows']} dòng. Checkpoint: {args.checkpoint}")
+
+
+if __name__ == '__main__':
+    main()
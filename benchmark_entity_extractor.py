@@ -0,0 +1,140 @@
+"""
+Entity Extractor Micro-benchmark
+So sánh chi phí mỗi utterance giữa bản cũ (mỗi pattern một lần re.finditer,
+lowercase lại trong từng extract_*) và scanner một lần quét hiện tại, trên
+các utterance trong data/*.csv.
+Chạy: python benchmark_entity_extractor.py --repeat 200
+"""
+
+import argparse
+import csv
+import glob
+import logging
+import re
+import time
+from datetime import datetime, timedelta
+
+from app.services.entity_extractor import EntityExtractor
+
+
+class LegacyEntityExtractor:
+    """Bản multi-pass trước khi gộp scanner (chỉ dùng làm baseline benchmark)"""
+
+    time_patterns = [
+        r'(\d{1,2})\s*giờ\s*(\d{1,2})?\s*(phút)?',
+        r'(\d{1,2})[hH](\d{2})?',
+        r'(\d{1,2})\s*:\s*(\d{2})',
+        r'(sáng|chiều|tối|trưa)\s*(\d{1,2})\s*giờ',
+    ]
+    date_patterns = [
+        r'ngày\s*(\d{1,2})\s*tháng\s*(\d{1,2})',
+        r'(\d{1,2})/(\d{1,2})/(\d{4})?',
+        r'(thứ\s*(hai|ba|tư|năm|sáu|bảy)|chủ nhật)\s*tuần\s*(này|sau)',
+    ]
+    phone_patterns = [
+        r'(0|\+84)\s*\d{9,10}',
+        r'(0|\+84)\s*\d{2,3}\s*\d{3}\s*\d{4}',
+    ]
+    email_patterns = [r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}']
+
+    def extract_time(self, text):
+        times = []
+        text_lower = text.lower()
+        for pattern in self.time_patterns:
+            for match in re.finditer(pattern, text_lower):
+                groups = match.groups()
+                hour = int(groups[0]) if groups[0] else None
+                minute = int(groups[1]) if len(groups) > 1 and groups[1] else 0
+                if hour is not None:
+                    if ('chiều' in text_lower or 'tối' in text_lower) and hour < 12:
+                        hour += 12
+                    times.append({'hour': hour, 'minute': minute, 'original': match.group(0)})
+        return times
+
+    def extract_date(self, text):
+        dates = []
+        text_lower = text.lower()
+        if 'hôm nay' in text_lower:
+            dates.append({'date': datetime.now().strftime('%Y-%m-%d')})
+        if 'ngày mai' in text_lower or 'mai' in text_lower:
+            dates.append({'date': (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')})
+        if 'ngày kia' in text_lower:
+            dates.append({'date': (datetime.now() + timedelta(days=2)).strftime('%Y-%m-%d')})
+        for pattern in self.date_patterns:
+            for match in re.finditer(pattern, text_lower):
+                groups = match.groups()
+                if len(groups) >= 2 and groups[0].isdigit():
+                    year = int(groups[2]) if len(groups) > 2 and groups[2] else datetime.now().year
+                    try:
+                        dates.append({'date': datetime(year, int(groups[1]), int(groups[0])).strftime('%Y-%m-%d')})
+                    except ValueError:
+                        pass
+        return dates
+
+    def extract_phone(self, text):
+        return [
+            {'value': re.sub(r'\s+', '', m.group(0))}
+            for pattern in self.phone_patterns for m in re.finditer(pattern, text)
+        ]
+
+    def extract_email(self, text):
+        return [{'value': m.group(0)} for p in self.email_patterns for m in re.finditer(p, text.lower())]
+
+    def extract_all(self, text):
+        entities = {
+            'times': self.extract_time(text),
+            'dates': self.extract_date(text),
+            'phones': self.extract_phone(text),
+            'emails': self.extract_email(text),
+        }
+        logging.getLogger("legacy_entity_extractor").info(f"[Entity Extractor] Extracted from '{text}':")
+        return entities
+
+
+def load_utterances(pattern):
+    texts = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding='utf-8', newline='') as f:
+            texts.extend(row['text'] for row in csv.DictReader(f) if row.get('text'))
+    return texts
+
+
+def bench(extract, texts, repeat):
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            try:
+                extract(text)
+            except Exception:
+                errors += 1  # bản cũ lỗi với "sáng 9 giờ" (int('sáng'))
+    elapsed = time.perf_counter() - started
+    return elapsed / (repeat * len(texts)) * 1e6, errors // repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark entity extractor trước/sau khi gộp scanner")
+    parser.add_argument('--data', default='data/*.csv')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    texts = load_utterances(args.data)
+    # Thêm vài câu có entity để cả hai nhánh (có / không có entity) đều được đo
+    texts += [
+        'Cho tôi hẹn 9 giờ 30 phút sáng mai',
+        'Gọi lại số 0909 123 4567 lúc 14:30 ngày 15 tháng 10',
+        'Email của tôi là Nguyen.Van.A@Example.com, hẹn 15/10/2025 lúc 9h30',
+    ]
+    logging.disable(logging.INFO)  # đo chi phí tính toán, không đo I/O của handler
+
+    legacy_us, legacy_errors = bench(LegacyEntityExtractor().extract_all, texts, args.repeat)
+    current_us, current_errors = bench(EntityExtractor().extract_all, texts, args.repeat)
+
+    print(f"Utterances: {len(texts)} x {args.repeat}")
+    print(f"Legacy multi-pass : {legacy_us:8.2f} us/utterance ({legacy_errors} lỗi)")
+    print(f"Single-pass scan  : {current_us:8.2f} us/utterance ({current_errors} lỗi)")
+    print(f"Speedup           : {legacy_us / current_us:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
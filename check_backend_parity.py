@@ -0,0 +1,82 @@
+"""
+Backend Parity Check - PyTorch eager vs ONNX Runtime
+Kiểm tra backend ONNX cho cùng argmax label với PyTorch trên toàn bộ dataset
+Chạy: python check_backend_parity.py [--model-path models/phobert-intent-v3/final]
+"""
+
+import argparse
+import sys
+import time
+
+import pandas as pd
+from transformers import AutoTokenizer
+
+from app.services.inference_backends import TorchBackend, OnnxBackend, softmax_argmax
+from app.utils.logger import configure_logging
+
+
+def predict_all(backend, tokenizer, texts, batch_size):
+    label_ids = []
+    started = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        batch = texts[i:i + batch_size]
+        inputs = tokenizer(batch, padding=True, truncation=True, max_length=256, return_tensors='pt')
+        ids, _ = softmax_argmax(backend.predict_logits(dict(inputs)))
+        label_ids.extend(ids)
+    elapsed = time.perf_counter() - started
+    return label_ids, elapsed
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description="So sánh argmax label giữa backend torch và onnx")
+    parser.add_argument('--model-path', default='models/phobert-intent-v3/final')
+    parser.add_argument('--dataset', default='data/extended_dataset_v2.csv')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--force-export', action='store_true', help='Export lại ONNX kể cả khi đã có cache')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("BACKEND PARITY CHECK - TORCH vs ONNX")
+    print("=" * 70)
+
+    df = pd.read_csv(args.dataset)
+    texts = df['text'].astype(str).tolist()
+    print(f"\n[1] Dataset: {args.dataset} ({len(texts)} samples)")
+
+    print(f"\n[2] Loading backends from {args.model_path}...")
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+    if args.force_export:
+        from app.services.inference_backends import export_onnx
+        export_onnx(args.model_path, force=True)
+    torch_backend = TorchBackend(args.model_path)
+    onnx_backend = OnnxBackend(args.model_path)
+    print(f"  ONNX model: {onnx_backend.onnx_path}")
+
+    print("\n[3] Running inference...")
+    torch_ids, torch_time = predict_all(torch_backend, tokenizer, texts, args.batch_size)
+    onnx_ids, onnx_time = predict_all(onnx_backend, tokenizer, texts, args.batch_size)
+    print(f"  torch: {torch_time:.2f}s ({len(texts) / torch_time:.1f} samples/s)")
+    print(f"  onnx : {onnx_time:.2f}s ({len(texts) / onnx_time:.1f} samples/s)")
+
+    id2label = torch_backend.id2label
+    mismatches = [
+        (text, id2label[int(t)], id2label[int(o)])
+        for text, t, o in zip(texts, torch_ids, onnx_ids)
+        if t != o
+    ]
+
+    print("\n[4] Result:")
+    if mismatches:
+        print(f"  [FAIL] {len(mismatches)}/{len(texts)} argmax mismatches")
+        for text, t, o in mismatches[:20]:
+            print(f"    '{text}': torch={t} onnx={o}")
+        print("=" * 70)
+        sys.exit(1)
+
+    print(f"  [OK] All {len(texts)} argmax labels match")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
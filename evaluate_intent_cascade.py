@@ -0,0 +1,66 @@
+"""
+Intent Cascade Evaluation - chọn ngưỡng stage 1
+Train stage 1 (TF-IDF + logistic regression) trên phần train, đo trên tập
+validation (cùng cách chia với train_intent_model.py) tỉ lệ utterance được
+stage 1 trả lời (bỏ qua PhoBERT) và accuracy của các dự đoán đó theo từng ngưỡng.
+Chạy: python evaluate_intent_cascade.py --thresholds 0.6,0.7,0.8,0.9,0.95
+"""
+
+import argparse
+import json
+
+from sklearn.model_selection import train_test_split
+
+from app.services.intent_cascade import (
+    INTENT_CASCADE_DATASETS, INTENT_CASCADE_MAX_WORDS, IntentCascade, load_dataset
+)
+from app.utils.logger import configure_logging
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Đánh giá coverage/accuracy của cascade stage 1")
+    parser.add_argument('--datasets', default=",".join(INTENT_CASCADE_DATASETS))
+    parser.add_argument('--thresholds', default="0.5,0.6,0.7,0.8,0.85,0.9,0.95")
+    parser.add_argument('--max-words', type=int, default=INTENT_CASCADE_MAX_WORDS)
+    parser.add_argument('--output', help="Ghi báo cáo JSON ra file")
+    args = parser.parse_args()
+
+    texts, labels = load_dataset([p.strip() for p in args.datasets.split(",") if p.strip()])
+    train_x, val_x, train_y, val_y = train_test_split(
+        texts, labels, test_size=0.1, stratify=labels, random_state=42
+    )
+
+    cascade = IntentCascade(enabled=True)
+    cascade.fit(train_x, train_y)
+    preds, scores = cascade.predict_batch(val_x)
+    overall_acc = sum(p == y for p, y in zip(preds, val_y)) / len(val_y)
+    print(f"Train: {len(train_x)} | Val: {len(val_x)} | Stage-1 accuracy (no cutoff): {overall_acc:.4f}")
+
+    rows = []
+    print(f"\n{'threshold':>9} | {'skip_rate':>9} | {'accepted':>8} | {'acc_accepted':>12}")
+    for threshold in [float(t) for t in args.thresholds.split(",")]:
+        accepted = [
+            (p, y) for text, p, s, y in zip(val_x, preds, scores, val_y)
+            if s >= threshold and p != "unknown"
+            and (not args.max_words or len(text.split()) <= args.max_words)
+        ]
+        correct = sum(p == y for p, y in accepted)
+        row = {
+            'threshold': threshold,
+            'accepted': len(accepted),
+            'skip_rate': len(accepted) / len(val_x),
+            'accuracy_accepted': correct / len(accepted) if accepted else None,
+        }
+        rows.append(row)
+        acc = f"{row['accuracy_accepted']:.4f}" if accepted else "-"
+        print(f"{threshold:>9.2f} | {row['skip_rate']:>9.2%} | {len(accepted):>8} | {acc:>12}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'overall_accuracy': overall_acc, 'max_words': args.max_words, 'thresholds': rows}, f, indent=2)
+        print(f"\nĐã ghi báo cáo: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""
+Intent Model Quantization Script - Dynamic int8
+Tạo biến thể int8 (Linear layers) từ checkpoint đã train, chấm điểm trên tập
+validation của extended_dataset_v2.csv và chỉ xuất artifact khi accuracy
+không giảm quá ngưỡng cho phép.
+Chạy: python quantize_intent_model.py --model-path models/phobert-intent-v3/final
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import torch
+from sklearn.metrics import accuracy_score, classification_report
+from sklearn.model_selection import train_test_split
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+from app.services.inference_backends import (
+    QUANTIZED_WEIGHTS_FILENAME, QUANTIZATION_CONFIG_FILENAME, quantize_dynamic_int8
+)
+from app.services.model_manager import int8_variant_path
+from app.utils.logger import configure_logging
+
+
+def load_val_split(dataset_path, label2id):
+    """Cùng cách chia train/val với train_intent_model.py (test_size=0.1, random_state=42)"""
+    df = pd.read_csv(dataset_path)
+    df = df[df['label'].isin(label2id)].copy()
+    df['label_id'] = df['label'].map(label2id)
+    _, val_df = train_test_split(df, test_size=0.1, stratify=df['label_id'], random_state=42)
+    return val_df['text'].astype(str).tolist(), val_df['label_id'].tolist()
+
+
+def predict(model, tokenizer, texts, batch_size=32):
+    preds = []
+    with torch.no_grad():
+        for i in range(0, len(texts), batch_size):
+            inputs = tokenizer(texts[i:i + batch_size], truncation=True, padding=True, max_length=128, return_tensors='pt')
+            preds.extend(model(**inputs).logits.argmax(dim=-1).tolist())
+    return preds
+
+
+def measure_latency(model, tokenizer, texts, warmup=10):
+    """Latency batch-size-1 trên CPU (ms)"""
+    timings = []
+    with torch.no_grad():
+        for i, text in enumerate(texts):
+            inputs = tokenizer(text, truncation=True, max_length=128, return_tensors='pt')
+            started = time.perf_counter()
+            model(**inputs)
+            if i >= warmup:
+                timings.append((time.perf_counter() - started) * 1000)
+    timings = np.array(timings)
+    return {
+        'mean_ms': float(timings.mean()),
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+    }
+
+
+def state_dict_size_mb(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / (1024 * 1024)
+
+
+def evaluate(model, tokenizer, texts, labels, id2label):
+    preds = predict(model, tokenizer, texts)
+    label_ids = sorted(set(labels))
+    report = classification_report(
+        labels, preds,
+        labels=label_ids,
+        target_names=[id2label[i] for i in label_ids],
+        output_dict=True,
+        zero_division=0
+    )
+    f1 = {id2label[i]: report[id2label[i]]['f1-score'] for i in label_ids}
+    return accuracy_score(labels, preds), f1
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Dynamic int8 quantization cho intent model")
+    parser.add_argument('--model-path', default='models/phobert-intent-v3/final')
+    parser.add_argument('--output', default=None, help='Mặc định: <model-dir>-int8/final')
+    parser.add_argument('--dataset', default='data/extended_dataset_v2.csv')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='Accuracy được phép giảm tối đa (tuyệt đối)')
+    parser.add_argument('--latency-samples', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=1, help='torch intra-op threads khi đo latency')
+    args = parser.parse_args()
+
+    output_dir = args.output or int8_variant_path(args.model_path)
+    torch.set_num_threads(args.threads)
+
+    print("=" * 70)
+    print("INTENT MODEL QUANTIZATION - DYNAMIC INT8")
+    print("=" * 70)
+
+    print(f"\n[1] Loading checkpoint from {args.model_path}...")
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+    model = AutoModelForSequenceClassification.from_pretrained(args.model_path)
+    model.eval()
+    id2label = {int(k): v for k, v in model.config.id2label.items()}
+    label2id = {v: k for k, v in id2label.items()}
+
+    print("\n[2] Quantizing Linear layers to int8...")
+    qmodel = quantize_dynamic_int8(model)
+
+    texts, labels = load_val_split(args.dataset, label2id)
+    print(f"\n[3] Evaluating on {len(texts)} validation samples...")
+    fp32_acc, fp32_f1 = evaluate(model, tokenizer, texts, labels, id2label)
+    int8_acc, int8_f1 = evaluate(qmodel, tokenizer, texts, labels, id2label)
+    accuracy_delta = int8_acc - fp32_acc
+    print(f"  fp32 accuracy: {fp32_acc:.4f}")
+    print(f"  int8 accuracy: {int8_acc:.4f} (delta {accuracy_delta:+.4f})")
+
+    print(f"\n[4] Measuring CPU latency ({args.threads} thread(s))...")
+    latency_texts = texts[:args.latency_samples]
+    fp32_latency = measure_latency(model, tokenizer, latency_texts)
+    int8_latency = measure_latency(qmodel, tokenizer, latency_texts)
+    speedup = fp32_latency['p50_ms'] / max(int8_latency['p50_ms'], 1e-9)
+    print(f"  fp32 p50: {fp32_latency['p50_ms']:.2f} ms, int8 p50: {int8_latency['p50_ms']:.2f} ms ({speedup:.2f}x)")
+
+    fp32_size = state_dict_size_mb(model)
+    int8_size = state_dict_size_mb(qmodel)
+    print(f"  size: fp32 {fp32_size:.1f} MB -> int8 {int8_size:.1f} MB")
+
+    passed = -accuracy_delta <= args.tolerance
+    report = {
+        'source_model': args.model_path,
+        'output_dir': output_dir if passed else None,
+        'dataset': args.dataset,
+        'val_samples': len(texts),
+        'tolerance': args.tolerance,
+        'passed': passed,
+        'accuracy': {'fp32': fp32_acc, 'int8': int8_acc, 'delta': accuracy_delta},
+        'f1_per_intent': {
+            intent: {'fp32': fp32_f1[intent], 'int8': int8_f1[intent], 'delta': int8_f1[intent] - fp32_f1[intent]}
+            for intent in fp32_f1
+        },
+        'size_mb': {'fp32': fp32_size, 'int8': int8_size},
+        'latency_cpu': {'threads': args.threads, 'fp32': fp32_latency, 'int8': int8_latency, 'speedup_p50': speedup},
+        'date': datetime.now().isoformat(),
+    }
+
+    report_path = os.path.join(args.model_path, 'quantization_report.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print("\n[5] Per-intent F1 delta:")
+    for intent, values in report['f1_per_intent'].items():
+        print(f"  {intent}: {values['fp32']:.4f} -> {values['int8']:.4f} ({values['delta']:+.4f})")
+
+    print("\n" + "=" * 70)
+    if not passed:
+        print(f"[REJECTED] Accuracy drop {-accuracy_delta:.4f} > tolerance {args.tolerance:.4f}")
+        print(f"[*] Report: {report_path}")
+        print("=" * 70)
+        sys.exit(1)
+
+    os.makedirs(output_dir, exist_ok=True)
+    model.config.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    torch.save(qmodel.state_dict(), os.path.join(output_dir, QUANTIZED_WEIGHTS_FILENAME))
+    with open(os.path.join(output_dir, QUANTIZATION_CONFIG_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump({'method': 'dynamic', 'dtype': 'qint8', 'modules': ['Linear'], 'source_model': args.model_path}, f, indent=2)
+    # Giữ training_config.json (confidence thresholds) của checkpoint gốc
+    training_config = os.path.join(args.model_path, 'training_config.json')
+    if os.path.exists(training_config):
+        shutil.copy(training_config, output_dir)
+    shutil.copy(report_path, output_dir)
+
+    print("[SUCCESS] QUANTIZATION COMPLETED!")
+    print(f"[+] Quantized model saved to: {output_dir}")
+    print(f"[*] Report: {report_path}")
+    print("\n[INFO] Load it by restarting with INTENT_PREFER_INT8=true")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
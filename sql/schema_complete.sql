@@ -53,6 +53,9 @@ CREATE TABLE IF NOT EXISTS conversation_logs (
     text text NOT NULL,
     intent text,
     confidence double precision,
+    sentiment text,
+    entities jsonb,
+    scored_model text,
     created_at timestamptz DEFAULT now()
 );
 
@@ -87,13 +90,33 @@ CREATE TABLE IF NOT EXISTS feedback (
 CREATE TABLE IF NOT EXISTS reports (
     id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
     workflow_id uuid REFERENCES workflows(id) ON DELETE CASCADE,
+    bucket text NOT NULL DEFAULT 'all',
     total_calls integer DEFAULT 0,
+    success_calls integer DEFAULT 0,
+    positive_calls integer DEFAULT 0,
+    duration_sum double precision DEFAULT 0,
+    duration_calls integer DEFAULT 0,
     success_rate double precision,
     avg_duration double precision,
     positive_intent_rate double precision,
+    applied_through timestamptz,
+    updated_at timestamptz,
     created_at timestamptz DEFAULT now()
 );
 
+CREATE TABLE IF NOT EXISTS report_state (
+    name text PRIMARY KEY,
+    watermark timestamptz,
+    lease_owner text,
+    lease_until double precision DEFAULT 0,
+    updated_at timestamptz
+);
+
+-- Database tạo trước khi job reports có lease / applied_through
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS applied_through timestamptz;
+ALTER TABLE report_state ADD COLUMN IF NOT EXISTS lease_owner text;
+ALTER TABLE report_state ADD COLUMN IF NOT EXISTS lease_until double precision DEFAULT 0;
+
 CREATE TABLE IF NOT EXISTS rl_feedback (
     id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
     call_id text NOT NULL,
@@ -108,11 +131,24 @@ CREATE TABLE IF NOT EXISTS rl_feedback (
 -- =====================================================
 
 CREATE INDEX IF NOT EXISTS idx_calls_workflow_id ON calls(workflow_id);
+CREATE INDEX IF NOT EXISTS idx_calls_end_time ON calls(end_time);
 CREATE INDEX IF NOT EXISTS idx_convlogs_call_id ON conversation_logs(call_id);
+-- Khóa upsert của call analytics (cột đầu call_id phục vụ luôn truy vấn theo cuộc gọi)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_call_intents_call_intent ON call_intents(call_id, intent_name);
+-- NULLS NOT DISTINCT (PG15+): value NULL cũng trùng khóa, upsert gộp thay vì chèn thêm dòng
+DROP INDEX IF EXISTS uq_call_entities_call_entity_value;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_call_entities_call_entity_value_nn
+    ON call_entities(call_id, entity_name, value) NULLS NOT DISTINCT;
 CREATE INDEX IF NOT EXISTS idx_feedback_call_id ON feedback(call_id);
 CREATE INDEX IF NOT EXISTS idx_rl_feedback_call_id ON rl_feedback(call_id);
 CREATE INDEX IF NOT EXISTS idx_rl_feedback_created_at ON rl_feedback(created_at);
 CREATE INDEX IF NOT EXISTS idx_rl_feedback_reward ON rl_feedback(reward);
+-- Keyset pagination theo (created_at, id) của các endpoint danh sách
+CREATE INDEX IF NOT EXISTS idx_workflows_user_created ON workflows(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_workflow_versions_workflow_created ON workflow_versions(workflow_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_convlogs_call_created ON conversation_logs(call_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_feedback_created ON feedback(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_feedback_reviewed_created ON feedback(reviewed, created_at, id);
 
 -- =====================================================
 -- RLS: CHỈ BẬT CHO ACCOUNTS (Đăng ký công khai)
@@ -145,6 +181,7 @@ ALTER TABLE call_intents DISABLE ROW LEVEL SECURITY;
 ALTER TABLE call_entities DISABLE ROW LEVEL SECURITY;
 ALTER TABLE feedback DISABLE ROW LEVEL SECURITY;
 ALTER TABLE reports DISABLE ROW LEVEL SECURITY;
+ALTER TABLE report_state DISABLE ROW LEVEL SECURITY;
 ALTER TABLE rl_feedback DISABLE ROW LEVEL SECURITY;
 
 -- =====================================================
@@ -208,6 +245,27 @@ BEGIN
     END IF;
 END $$;
 
+-- =====================================================
+-- FIX: Cột kết quả NLP cho backfill (nếu thiếu)
+-- =====================================================
+
+ALTER TABLE conversation_logs ADD COLUMN IF NOT EXISTS sentiment text;
+ALTER TABLE conversation_logs ADD COLUMN IF NOT EXISTS entities jsonb;
+ALTER TABLE conversation_logs ADD COLUMN IF NOT EXISTS scored_model text;
+
+-- =====================================================
+-- FIX: Tổng cộng dồn cho reports (job cập nhật tăng dần)
+-- =====================================================
+
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS bucket text NOT NULL DEFAULT 'all';
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS success_calls integer DEFAULT 0;
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS positive_calls integer DEFAULT 0;
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS duration_sum double precision DEFAULT 0;
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS duration_calls integer DEFAULT 0;
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS updated_at timestamptz;
+-- Khóa upsert (on_conflict=workflow_id,bucket) và đọc báo cáo theo workflow
+CREATE UNIQUE INDEX IF NOT EXISTS idx_reports_workflow_bucket ON reports(workflow_id, bucket);
+
 -- =====================================================
 -- VERIFY: Kiểm tra kết quả
 -- =====================================================
@@ -0,0 +1,135 @@
+-- SQLite stand-in cho schema_complete.sql (DB_BACKEND=sqlite, chạy/load-test offline)
+-- uuid/timestamptz -> TEXT, jsonb -> JSON (text), boolean -> BOOLEAN (0/1).
+-- id và created_at do app/db/sqlite.py sinh khi insert.
+
+CREATE TABLE IF NOT EXISTS accounts (
+    id TEXT PRIMARY KEY,
+    email TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    role TEXT DEFAULT 'user',
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS workflows (
+    id TEXT PRIMARY KEY,
+    user_id TEXT REFERENCES accounts(id) ON DELETE SET NULL,
+    name TEXT NOT NULL,
+    description TEXT,
+    current_version_id TEXT,
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS workflow_versions (
+    id TEXT PRIMARY KEY,
+    workflow_id TEXT REFERENCES workflows(id) ON DELETE CASCADE,
+    user_id TEXT REFERENCES accounts(id) ON DELETE SET NULL,
+    workflow_json JSON NOT NULL,
+    change_description TEXT,
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS calls (
+    id TEXT PRIMARY KEY,
+    workflow_id TEXT REFERENCES workflows(id) ON DELETE SET NULL,
+    customer_phone TEXT,
+    status TEXT DEFAULT 'pending',
+    start_time TEXT,
+    end_time TEXT,
+    duration REAL,
+    last_intent TEXT,
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS conversation_logs (
+    id TEXT PRIMARY KEY,
+    call_id TEXT REFERENCES calls(id) ON DELETE CASCADE,
+    speaker TEXT NOT NULL,
+    text TEXT NOT NULL,
+    intent TEXT,
+    confidence REAL,
+    sentiment TEXT,
+    entities JSON,
+    scored_model TEXT,
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS call_intents (
+    id TEXT PRIMARY KEY,
+    call_id TEXT REFERENCES calls(id) ON DELETE CASCADE,
+    intent_name TEXT NOT NULL,
+    count INTEGER DEFAULT 1,
+    accuracy REAL
+);
+
+CREATE TABLE IF NOT EXISTS call_entities (
+    id TEXT PRIMARY KEY,
+    call_id TEXT REFERENCES calls(id) ON DELETE CASCADE,
+    entity_name TEXT NOT NULL,
+    -- SQLite không có NULLS NOT DISTINCT: không cho NULL để unique index gộp được mọi giá trị
+    value TEXT NOT NULL DEFAULT ''
+);
+
+CREATE TABLE IF NOT EXISTS feedback (
+    id TEXT PRIMARY KEY,
+    call_id TEXT REFERENCES calls(id) ON DELETE SET NULL,
+    user_id TEXT REFERENCES accounts(id) ON DELETE SET NULL,
+    text TEXT NOT NULL,
+    intent TEXT,
+    confidence REAL,
+    corrected BOOLEAN DEFAULT 0,
+    approved BOOLEAN DEFAULT 0,
+    reviewed BOOLEAN DEFAULT 0,
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS reports (
+    id TEXT PRIMARY KEY,
+    workflow_id TEXT REFERENCES workflows(id) ON DELETE CASCADE,
+    bucket TEXT NOT NULL DEFAULT 'all',
+    total_calls INTEGER DEFAULT 0,
+    success_calls INTEGER DEFAULT 0,
+    positive_calls INTEGER DEFAULT 0,
+    duration_sum REAL DEFAULT 0,
+    duration_calls INTEGER DEFAULT 0,
+    success_rate REAL,
+    avg_duration REAL,
+    positive_intent_rate REAL,
+    applied_through TEXT,
+    updated_at TEXT,
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS report_state (
+    name TEXT PRIMARY KEY,
+    watermark TEXT,
+    lease_owner TEXT,
+    lease_until REAL DEFAULT 0,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS rl_feedback (
+    id TEXT PRIMARY KEY,
+    call_id TEXT NOT NULL,
+    reward REAL NOT NULL,
+    final_intent TEXT,
+    notes TEXT,
+    created_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_calls_workflow_id ON calls(workflow_id);
+CREATE INDEX IF NOT EXISTS idx_calls_end_time ON calls(end_time);
+CREATE INDEX IF NOT EXISTS idx_convlogs_call_id ON conversation_logs(call_id);
+-- Khóa upsert của call analytics (cột đầu call_id phục vụ luôn truy vấn theo cuộc gọi)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_call_intents_call_intent ON call_intents(call_id, intent_name);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_call_entities_call_entity_value ON call_entities(call_id, entity_name, value);
+CREATE INDEX IF NOT EXISTS idx_feedback_call_id ON feedback(call_id);
+CREATE INDEX IF NOT EXISTS idx_rl_feedback_call_id ON rl_feedback(call_id);
+CREATE INDEX IF NOT EXISTS idx_rl_feedback_created_at ON rl_feedback(created_at);
+CREATE INDEX IF NOT EXISTS idx_rl_feedback_reward ON rl_feedback(reward);
+-- Keyset pagination theo (created_at, id) của các endpoint danh sách
+CREATE INDEX IF NOT EXISTS idx_workflows_user_created ON workflows(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_workflow_versions_workflow_created ON workflow_versions(workflow_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_convlogs_call_created ON conversation_logs(call_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_feedback_created ON feedback(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_feedback_reviewed_created ON feedback(reviewed, created_at, id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_reports_workflow_bucket ON reports(workflow_id, bucket);
@@ -0,0 +1,26 @@
+"""
+Cấu hình chung cho unit test: chạy offline (SQLite, log ra thư mục tạm), không
+cần model, Supabase hay server đang chạy (khác với test_system.py).
+"""
+
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+# Đặt trước khi import app.*: các module đọc biến môi trường lúc import
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("LOG_DIR", os.path.join(tempfile.gettempdir(), "voiceai-test-logs"))
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """SQLite riêng cho mỗi test, đặt làm DB toàn cục của app.db"""
+    import app.db
+    from app.db.sqlite import SQLiteDatabase
+
+    database = SQLiteDatabase(path=str(tmp_path / "test.db"))
+    monkeypatch.setattr(app.db, "_db", database)
+    yield database
+    asyncio.run(database.close())
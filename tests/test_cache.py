@@ -0,0 +1,71 @@
+import pytest
+
+from app.utils import cache as cache_module
+from app.utils.cache import TTLCache
+
+
+def test_max_bytes_requires_sizeof():
+    with pytest.raises(ValueError):
+        TTLCache(max_bytes=100)
+
+
+def test_evicts_least_recently_used_until_under_max_bytes():
+    cache = TTLCache(max_entries=100, ttl_seconds=None, sizeof=len, max_bytes=10)
+    cache.set("a", "xxxx")
+    cache.set("b", "xxxx")
+    assert cache.get("a") == "xxxx"  # "b" thành cũ nhất
+    cache.set("c", "xxxxxx")
+    assert cache.get("b") is None
+    assert cache.get("a") == "xxxx"
+    assert cache.get("c") == "xxxxxx"
+    assert cache.stats()["bytes"] == 10
+    assert cache.stats()["max_bytes"] == 10
+    assert cache.evictions == 1
+
+
+def test_value_larger_than_max_bytes_is_not_cached():
+    cache = TTLCache(max_entries=100, ttl_seconds=None, sizeof=len, max_bytes=10)
+    cache.set("a", "xxxx")
+    cache.set("big", "x" * 11)
+    assert cache.get("big") is None
+    assert cache.get("a") == "xxxx"
+    assert cache.stats()["bytes"] == 4
+    assert cache.evictions == 0
+
+
+def test_byte_accounting_on_overwrite_pop_and_clear():
+    cache = TTLCache(max_entries=100, ttl_seconds=None, sizeof=len, max_bytes=100)
+    cache.set("a", "xxxx")
+    cache.set("a", "xx")
+    assert cache.stats()["bytes"] == 2
+    cache.set("b", "xxx")
+    assert cache.pop("a") == "xx"
+    assert cache.stats()["bytes"] == 3
+    cache.clear()
+    assert cache.stats()["bytes"] == 0
+    assert len(cache) == 0
+
+
+def test_max_entries_evicts_oldest():
+    cache = TTLCache(max_entries=2, ttl_seconds=None)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+    assert cache.get("a") is None
+    assert (cache.get("b"), cache.get("c")) == (2, 3)
+    assert "bytes" not in cache.stats()
+
+
+def test_expired_entry_is_dropped_and_frees_bytes(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache = TTLCache(max_entries=10, ttl_seconds=5, sizeof=len, max_bytes=100)
+    cache.set("a", "xxxx")
+    now[0] += 4
+    assert cache.get("a") == "xxxx"
+    now[0] += 2
+    assert cache.get("a", "miss") == "miss"
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["bytes"] == 0
+    assert (stats["hits"], stats["misses"]) == (1, 1)
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from app.services.call_analytics import CallAggregate, merge_call_rows, merge_intent_rows, write_call_rows
+
+
+def _intent(call_id, name, count, accuracy):
+    return {"call_id": call_id, "intent_name": name, "count": count, "accuracy": accuracy}
+
+
+def _intents(database, call_id):
+    rows = asyncio.run(database.select(
+        "call_intents", "intent_name, count, accuracy", where=[("call_id", "eq", call_id)], order="intent_name",
+    ))
+    return [(r["intent_name"], r["count"], r["accuracy"]) for r in rows]
+
+
+def _add_call(database, call_id):
+    asyncio.run(database.insert("calls", {"id": call_id, "status": "in_progress"}))
+
+
+def test_merge_intent_rows_sums_counts_and_weights_accuracy():
+    existing = [_intent("c1", "greeting", 1, 0.9), _intent("c1", "other", 5, 0.5)]
+    delta = [_intent("c1", "greeting", 3, 0.5), _intent("c2", "greeting", 2, 0.8)]
+    merged = {(r["call_id"], r["intent_name"]): r for r in merge_intent_rows(existing, delta)}
+    # Chỉ các khóa có trong delta: dòng "other" không bị ghi lại
+    assert set(merged) == {("c1", "greeting"), ("c2", "greeting")}
+    assert merged["c1", "greeting"]["count"] == 4
+    assert merged["c1", "greeting"]["accuracy"] == pytest.approx((0.9 + 3 * 0.5) / 4, abs=1e-4)
+    assert merged["c2", "greeting"] == _intent("c2", "greeting", 2, 0.8)
+
+
+def test_merge_intent_rows_combines_duplicate_delta_keys():
+    delta = [_intent("c1", "greeting", 1, 1.0), _intent("c1", "greeting", 1, 0.0)]
+    assert merge_intent_rows([], delta) == [_intent("c1", "greeting", 2, 0.5)]
+
+
+def test_flush_then_resume_updates_the_same_rows(database):
+    _add_call(database, "c1")
+    first = CallAggregate()
+    first.add("greeting", 0.9, {"phone": "0909123456"})
+    first.add("greeting", 0.7, None)
+    asyncio.run(merge_call_rows(database, "call_intents", first.intent_rows("c1")))
+    asyncio.run(merge_call_rows(database, "call_entities", first.entity_rows("c1")))
+
+    # Cuộc gọi bị flush vì idle rồi có lượt mới: delta thứ hai cộng vào cùng dòng
+    resumed = CallAggregate()
+    resumed.add("greeting", 0.5, {"phone": "0909123456", "email": "a@example.com"})
+    resumed.add("booking", 0.8, None)
+    asyncio.run(merge_call_rows(database, "call_intents", resumed.intent_rows("c1")))
+    asyncio.run(merge_call_rows(database, "call_entities", resumed.entity_rows("c1")))
+
+    assert _intents(database, "c1") == [("booking", 1, 0.8), ("greeting", 3, 0.7)]
+    entities = asyncio.run(database.select("call_entities", "entity_name, value", where=[("call_id", "eq", "c1")]))
+    assert sorted((r["entity_name"], r["value"]) for r in entities) == [
+        ("email", "a@example.com"), ("phone", "0909123456"),
+    ]
+
+
+def test_entity_batch_with_duplicates_writes_one_row(database):
+    _add_call(database, "c1")
+    row = {"call_id": "c1", "entity_name": "phone", "value": "0909123456"}
+    asyncio.run(merge_call_rows(database, "call_entities", [dict(row), dict(row)]))
+    assert len(asyncio.run(database.select("call_entities", "id"))) == 1
+
+
+def test_entities_without_value_merge_into_one_row(database):
+    _add_call(database, "c1")
+    row = {"call_id": "c1", "entity_name": "phone", "value": None}
+    asyncio.run(merge_call_rows(database, "call_entities", [dict(row)]))
+    asyncio.run(merge_call_rows(database, "call_entities", [dict(row), {**row, "value": ""}]))
+    rows = asyncio.run(database.select("call_entities", "value"))
+    assert [r["value"] for r in rows] == [""]
+
+
+def test_merge_rejects_unknown_table(database):
+    with pytest.raises(ValueError):
+        asyncio.run(merge_call_rows(database, "calls", []))
+
+
+def test_write_call_rows_without_app_loop_uses_global_db(database):
+    _add_call(database, "c1")
+    write_call_rows("call_intents", [_intent("c1", "greeting", 2, 0.6)])
+    write_call_rows("call_intents", [_intent("c1", "greeting", 2, 0.8)])
+    assert _intents(database, "c1") == [("greeting", 4, 0.7)]
@@ -0,0 +1,113 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.entity_extractor import EntityExtractor
+from benchmark_entity_extractor import LegacyEntityExtractor
+
+extractor = EntityExtractor()
+legacy = LegacyEntityExtractor()
+
+
+def _comparable(entities):
+    """Bản cũ có thể trả trùng (nhiều pattern cùng khớp); so sánh theo tập giá trị.
+
+    Đầu vào so khớp tránh các lỗi đã sửa của bản cũ ("mai" trong "email",
+    "sáng 9 giờ", dd/mm không có năm) - các trường hợp đó có test riêng bên dưới.
+    """
+    return {
+        "times": {(t["hour"], t["minute"]) for t in entities["times"]},
+        "dates": {d["date"] for d in entities["dates"]},
+        "phones": {p["value"] for p in entities["phones"]},
+        "emails": {e["value"] for e in entities["emails"]},
+    }
+
+
+PARITY_CASES = [
+    "Cho tôi hẹn 9 giờ 30 phút ngày mai",
+    "Gọi lại số 0909 123 4567 lúc 14:30 ngày 15 tháng 10",
+    "Địa chỉ của tôi là Nguyen.Van.A@Example.com, hẹn 15/10/2025 lúc 9h30",
+    "chiều nay 3 giờ được không",
+    "tối 8h gọi lại nhé",
+    "số của tôi là +84 909123456",
+    "hôm nay bận rồi, ngày kia nhé",
+    "ngày 31 tháng 2 có được không",
+    "không có gì đâu",
+    "",
+]
+
+
+@pytest.mark.parametrize("text", PARITY_CASES)
+def test_single_pass_scan_matches_legacy_extractor(text):
+    assert _comparable(extractor.extract_all(text)) == _comparable(legacy.extract_all(text))
+
+
+def _fragment(rng):
+    kind = rng.choice(["time", "date", "phone", "email", "none"])
+    if kind == "time":
+        hour, minute = rng.randint(0, 23), rng.randint(0, 59)
+        return rng.choice([
+            f"{hour} giờ", f"{hour} giờ {minute} phút", f"{hour}h{minute:02d}", f"{hour}h", f"{hour}:{minute:02d}",
+        ])
+    if kind == "date":
+        day, month = rng.randint(1, 31), rng.randint(1, 12)
+        return rng.choice([
+            f"ngày {day} tháng {month}", f"{day}/{month}/{rng.randint(2024, 2027)}", "hôm nay", "ngày mai", "ngày kia",
+        ])
+    if kind == "phone":
+        digits = "".join(str(rng.randint(0, 9)) for _ in range(9))
+        return rng.choice([f"0{digits}", f"+84{digits}", f"0{digits[:3]} {digits[3:6]} {digits[6:]}0"])
+    if kind == "email":
+        return f"{rng.choice(['an', 'Binh.Tran', 'khach_hang'])}{rng.randint(1, 99)}@{rng.choice(['example.com', 'Post.VN'])}"
+    return rng.choice(["vâng", "được ạ", "để tôi xem", "chiều", "tối"])
+
+
+def test_fuzz_single_pass_scan_matches_legacy_extractor():
+    rng = random.Random(20261017)
+    fillers = ["lúc", "nhé", "hoặc", "và", "cho tôi", "anh ơi", "gọi lại"]
+    for _ in range(2000):
+        parts = [_fragment(rng) for _ in range(rng.randint(1, 4))]
+        # Xen từ nối giữa các mảnh: hai mảnh số dính liền nhau ("9 giờ 0909...") không phải câu thật
+        text = f" {rng.choice(fillers)} ".join(parts)
+        if rng.random() < 0.3:
+            text = text.upper()
+        assert _comparable(extractor.extract_all(text)) == _comparable(legacy.extract_all(text)), text
+
+
+def test_mai_inside_a_word_is_not_tomorrow():
+    # Bản cũ coi "email" chứa "mai" là ngày mai
+    assert extractor.extract_date("gửi email cho tôi") == []
+
+
+def test_period_before_hour_does_not_drop_entities():
+    # Bản cũ gọi int('sáng') và mất toàn bộ entity của lượt
+    entities = extractor.extract_all("sáng 9 giờ gọi số 0909123456")
+    assert [(t["hour"], t["minute"]) for t in entities["times"]] == [(9, 0)]
+    assert [p["value"] for p in entities["phones"]] == ["0909123456"]
+    evening = extractor.extract_time("tối 8 giờ")
+    assert [(t["hour"], t["minute"]) for t in evening] == [(20, 0)]
+
+
+def test_overlapping_patterns_emit_one_entity():
+    entities = extractor.extract_all("gọi 0909123456 lúc 9 giờ 30 phút")
+    assert len(entities["phones"]) == 1
+    assert len(entities["times"]) == 1
+
+
+def test_day_month_without_year_uses_current_year():
+    dates = extractor.extract_date("hẹn 15/10 nhé")
+    assert [d["date"] for d in dates] == [f"{datetime.now().year}-10-15"]
+
+
+def test_relative_dates_come_first_and_once():
+    tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    dates = extractor.extract_date("ngày 20 tháng 11 hoặc mai, ngày mai cũng được")
+    assert [d.get("relative") for d in dates] == ["tomorrow", None]
+    assert dates[0]["date"] == tomorrow
+
+
+def test_text_without_digits_or_keywords_has_no_entities():
+    assert extractor.extract_all("tôi muốn hỏi thông tin sản phẩm") == {
+        "times": [], "dates": [], "phones": [], "emails": [],
+    }
@@ -0,0 +1,159 @@
+import json
+import os
+import time
+
+import pytest
+
+from app.services.feedback_journal import (
+    ACTIVE_SUFFIX,
+    FeedbackJournal,
+    InvalidJournalCursor,
+    list_segments,
+    parse_cursor,
+    read_since,
+)
+from app.utils.file_lock import try_lock, unlock
+
+
+def _journal(tmp_path, **kwargs):
+    kwargs.setdefault("fsync_interval_ms", 10)
+    return FeedbackJournal(directory=tmp_path, **kwargs)
+
+
+def _write(journal, count, start=0):
+    for n in range(start, start + count):
+        assert journal.append({"n": n})
+    journal.stop()
+
+
+def _numbers(tmp_path, cursor=None, limit=None):
+    return [record["n"] for record, _ in read_since(cursor, limit, directory=tmp_path)]
+
+
+def _foreign_segment(tmp_path, name, records):
+    # Segment ".open" của một worker khác (đã chết hoặc còn sống)
+    path = tmp_path / f"active-99999-{name}{ACTIVE_SUFFIX}"
+    path.write_text("".join(json.dumps(r) + "\n" for r in records), encoding="utf-8")
+    return path
+
+
+def test_parse_cursor():
+    assert parse_cursor(None) == (None, 0)
+    assert parse_cursor("0000000000001-1-000001") == ("0000000000001-1-000001", 0)
+    assert parse_cursor("0000000000001-1-000001:42") == ("0000000000001-1-000001", 42)
+    with pytest.raises(InvalidJournalCursor):
+        parse_cursor("0000000000001-1-000001:abc")
+
+
+def test_stop_seals_active_segment_and_records_read_back(tmp_path):
+    journal = _journal(tmp_path)
+    _write(journal, 5)
+    assert not list(tmp_path.glob(f"*{ACTIVE_SUFFIX}"))
+    assert len(list_segments(tmp_path)) == 1
+    assert _numbers(tmp_path) == [0, 1, 2, 3, 4]
+    assert journal.stats()["written"] == 5
+    assert not journal.append({"n": 5})
+
+
+def test_read_since_resumes_from_cursor_across_segments(tmp_path):
+    # segment_bytes nhỏ: mỗi bản ghi một segment riêng
+    journal = _journal(tmp_path, segment_bytes=1)
+    _write(journal, 6)
+    assert len(list_segments(tmp_path)) == 6
+
+    seen, cursor = [], None
+    while True:
+        batch = list(read_since(cursor, limit=4, directory=tmp_path))
+        if not batch:
+            break
+        assert len(batch) <= 4
+        seen.extend(record["n"] for record, _ in batch)
+        cursor = batch[-1][1]
+    assert seen == [0, 1, 2, 3, 4, 5]
+    assert _numbers(tmp_path, cursor) == []
+
+
+def test_cursor_within_segment_skips_read_records(tmp_path):
+    _write(_journal(tmp_path), 5)
+    records = list(read_since(directory=tmp_path))
+    assert _numbers(tmp_path, records[1][1]) == [2, 3, 4]
+    stem = records[0][1].split(":")[0]
+    assert _numbers(tmp_path, stem, limit=2) == [0, 1]
+
+
+def test_unlocked_open_segment_is_recovered(tmp_path):
+    _foreign_segment(tmp_path, "crashed", [{"n": 100}, {"n": 101}])
+    journal = _journal(tmp_path)
+    _write(journal, 1)
+    assert journal.stats()["recovered"] == 1
+    assert not list(tmp_path.glob(f"*{ACTIVE_SUFFIX}"))
+    assert _numbers(tmp_path) == [100, 101, 0]
+
+
+def test_locked_open_segment_is_left_to_its_writer(tmp_path):
+    path = _foreign_segment(tmp_path, "alive", [{"n": 100}])
+    with path.open("rb") as held:
+        # Khóa gắn với open file description: handle thứ hai trong cùng process cũng bị chặn
+        assert try_lock(held)
+        journal = _journal(tmp_path)
+        _write(journal, 1)
+        assert path.exists()
+        assert journal.stats()["recovered"] == 0
+        assert _numbers(tmp_path) == [0]
+        unlock(held)
+
+
+def test_empty_open_segment_is_removed_only_after_grace(tmp_path):
+    fresh = _foreign_segment(tmp_path, "fresh", [])
+    stale = _foreign_segment(tmp_path, "stale", [])
+    old = time.time() - 3600
+    os.utime(stale, (old, old))
+    _write(_journal(tmp_path), 1)
+    assert fresh.exists()
+    assert not stale.exists()
+
+
+def test_compaction_keeps_cursors_valid(tmp_path):
+    pytest.importorskip("pyarrow")
+    journal = _journal(tmp_path, segment_bytes=1)
+    _write(journal, 3)
+    cursor = list(read_since(limit=1, directory=tmp_path))[-1][1]
+
+    assert journal.compact(older_than_seconds=0) == 3
+    segments = list_segments(tmp_path)
+    assert [p.suffix for p in segments] == [".parquet"] * 3
+    assert not list(tmp_path.glob("*.jsonl"))
+    assert _numbers(tmp_path) == [0, 1, 2]
+    assert _numbers(tmp_path, cursor) == [1, 2]
+    assert journal.compact(older_than_seconds=0) == 0
+
+
+def test_malformed_segment_does_not_stop_compaction(tmp_path):
+    pytest.importorskip("pyarrow")
+    journal = _journal(tmp_path, segment_bytes=1)
+    _write(journal, 2)
+    broken = list_segments(tmp_path)[0]
+    with broken.open("a", encoding="utf-8") as f:
+        f.write("{không phải json\n")
+
+    assert journal.compact(older_than_seconds=0) == 1
+    assert [p.suffix for p in list_segments(tmp_path)] == [".jsonl", ".parquet"]
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_compaction_without_pyarrow_is_a_no_op(tmp_path, monkeypatch):
+    import builtins
+
+    real_import = builtins.__import__
+
+    def no_pyarrow(name, *args, **kwargs):
+        if name.startswith("pyarrow"):
+            raise ImportError("No module named 'pyarrow'")
+        return real_import(name, *args, **kwargs)
+
+    journal = _journal(tmp_path)
+    _write(journal, 1)
+    monkeypatch.setattr(builtins, "__import__", no_pyarrow)
+    assert journal.compact(older_than_seconds=0) == 0
+    assert journal.compact(older_than_seconds=0) == 0
+    assert _numbers(tmp_path) == [0]
@@ -0,0 +1,105 @@
+import csv
+import unicodedata
+
+import pytest
+
+from app.services.intent_rules import IntentRuleMatcher
+
+
+def _write_rules(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["intent", "phrase", "priority"])
+        writer.writerows(rows)
+    return str(path)
+
+
+@pytest.fixture
+def matcher(tmp_path):
+    def build(rows):
+        return IntentRuleMatcher(_write_rules(tmp_path / "rules.csv", rows))
+    return build
+
+
+def test_lowest_priority_wins_regardless_of_position(matcher):
+    rules = matcher([
+        ("hoi_gia", "bao nhiêu", 5),
+        ("tu_choi", "không", 1),
+    ])
+    assert rules.match("giá bao nhiêu vậy, thôi không mua").intent == "tu_choi"
+    assert rules.match("bao nhiêu tiền").intent == "hoi_gia"
+
+
+def test_ties_go_to_the_earlier_row(matcher):
+    rules = matcher([
+        ("dong_y", "được", 2),
+        ("xac_nhan", "ok", 2),
+    ])
+    assert rules.match("ok được đó").intent == "dong_y"
+
+
+def test_longer_phrase_with_better_priority_beats_its_substring(matcher):
+    rules = matcher([
+        ("dong_y", "có", 3),
+        ("tu_choi", "không có", 1),
+    ])
+    assert rules.match("tôi không có nhu cầu").intent == "tu_choi"
+    assert rules.match("có chứ").intent == "dong_y"
+
+
+def test_suffix_match_found_through_failure_links(matcher):
+    # "xin chào" khớp dở "xin chờ" trước khi tới "chào": phải nhảy theo fail link
+    rules = matcher([
+        ("cho_doi", "xin chờ", 1),
+        ("chao_hoi", "chào", 2),
+    ])
+    assert rules.match("xin chào anh").intent == "chao_hoi"
+
+
+def test_only_whole_words_match(matcher):
+    rules = matcher([("phan_nan", "tệ", 1)])
+    assert rules.match("gửi tệp cho tôi") is None
+    assert rules.match("dịch vụ tệ quá").intent == "phan_nan"
+    assert rules.match("tệ!").intent == "phan_nan"
+
+
+def test_text_is_normalized_like_the_rules(matcher):
+    rules = matcher([("dong_y", "đồng ý", 1)])
+    decomposed = unicodedata.normalize("NFD", "ĐỒNG   Ý")
+    assert rules.match(decomposed).intent == "dong_y"
+
+
+def test_no_match_returns_none(matcher):
+    rules = matcher([("dong_y", "đồng ý", 1)])
+    assert rules.match("") is None
+    assert rules.match("để tôi suy nghĩ") is None
+
+
+def test_match_reports_rule_details(matcher):
+    rules = matcher([("tu_choi", "Không Cần", 4)])
+    match = rules.match("không cần đâu")
+    assert (match.intent, match.phrase, match.priority) == ("tu_choi", "không cần", 4)
+
+
+def test_reload_swaps_rules_and_bumps_version(tmp_path):
+    path = _write_rules(tmp_path / "rules.csv", [("dong_y", "được", 1)])
+    rules = IntentRuleMatcher(path)
+    assert rules.version == 1
+    _write_rules(tmp_path / "rules.csv", [("tu_choi", "được", 1)])
+    stats = rules.reload()
+    assert stats["version"] == 2
+    assert rules.match("được").intent == "tu_choi"
+
+
+def test_failed_reload_keeps_the_previous_automaton(tmp_path):
+    rules = IntentRuleMatcher(_write_rules(tmp_path / "rules.csv", [("dong_y", "được", 1)]))
+    with pytest.raises(FileNotFoundError):
+        rules.reload(str(tmp_path / "missing.csv"))
+    assert rules.match("được").intent == "dong_y"
+    assert rules.last_error
+
+
+def test_bundled_rule_table_compiles():
+    rules = IntentRuleMatcher("data/intent_rules.csv")
+    assert rules.rule_count > 0
+    assert rules.last_error is None
@@ -0,0 +1,162 @@
+import threading
+import time
+
+import pytest
+
+from app.services.micro_batcher import MicroBatcher
+
+
+def _make_batcher(batch_fn, **kwargs):
+    kwargs.setdefault("name", f"test_{id(batch_fn)}")
+    return MicroBatcher(batch_fn, **kwargs)
+
+
+def test_results_return_to_their_callers_in_order():
+    batches = []
+
+    def double(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = _make_batcher(double, max_batch_size=8, max_wait_ms=50)
+    try:
+        futures = [batcher.submit(i) for i in range(5)]
+        assert [f.result(timeout=2) for f in futures] == [0, 2, 4, 6, 8]
+    finally:
+        batcher.stop()
+    assert sum(len(b) for b in batches) == 5
+
+
+def test_batch_is_capped_at_max_batch_size():
+    release = threading.Event()
+    sizes = []
+
+    def record(items):
+        release.wait(timeout=2)
+        sizes.append(len(items))
+        return items
+
+    batcher = _make_batcher(record, max_batch_size=3, max_wait_ms=200)
+    try:
+        futures = [batcher.submit(i) for i in range(7)]
+        release.set()
+        assert [f.result(timeout=2) for f in futures] == list(range(7))
+    finally:
+        batcher.stop()
+    assert max(sizes) <= 3
+    assert sum(sizes) == 7
+
+
+def test_partial_batch_is_flushed_after_max_wait():
+    batcher = _make_batcher(lambda items: items, max_batch_size=64, max_wait_ms=20)
+    try:
+        started = time.monotonic()
+        assert batcher(42, timeout=2) == 42
+        elapsed = time.monotonic() - started
+    finally:
+        batcher.stop()
+    # Không chờ đủ 64 request: cửa sổ 20ms hết thì chạy batch một phần tử
+    assert elapsed < 1.0
+
+
+def test_concurrent_submits_are_grouped():
+    sizes = []
+
+    def record(items):
+        sizes.append(len(items))
+        return items
+
+    batcher = _make_batcher(record, max_batch_size=16, max_wait_ms=100)
+    barrier = threading.Barrier(8)
+    results = {}
+
+    def worker(i):
+        barrier.wait()
+        results[i] = batcher(i, timeout=2)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        batcher.stop()
+    assert results == {i: i for i in range(8)}
+    assert len(sizes) < 8
+
+
+def test_batch_error_is_raised_in_every_caller():
+    def boom(items):
+        raise ValueError("model lỗi")
+
+    batcher = _make_batcher(boom, max_batch_size=4, max_wait_ms=20)
+    try:
+        futures = [batcher.submit(i) for i in range(3)]
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result(timeout=2)
+    finally:
+        batcher.stop()
+
+
+def test_wrong_result_count_fails_the_batch():
+    batcher = _make_batcher(lambda items: items[:-1], max_batch_size=4, max_wait_ms=20)
+    try:
+        with pytest.raises(RuntimeError):
+            batcher(1, timeout=2)
+    finally:
+        batcher.stop()
+
+
+def test_submit_after_stop_raises():
+    batcher = _make_batcher(lambda items: items)
+    batcher(1, timeout=2)
+    batcher.stop()
+    with pytest.raises(RuntimeError):
+        batcher.submit(2)
+
+
+def test_stop_drains_pending_requests():
+    gate = threading.Event()
+
+    def slow(items):
+        gate.wait(timeout=2)
+        return items
+
+    batcher = _make_batcher(slow, max_batch_size=2, max_wait_ms=1)
+    futures = [batcher.submit(i) for i in range(6)]
+    gate.set()
+    batcher.stop()
+    assert [f.result(timeout=2) for f in futures] == list(range(6))
+
+
+def test_submit_racing_stop_is_either_rejected_or_served():
+    batcher = _make_batcher(lambda items: items, max_batch_size=4, max_wait_ms=1)
+    accepted, rejected = [], []
+    start = threading.Barrier(5)
+
+    def client(offset):
+        start.wait()
+        for i in range(200):
+            try:
+                accepted.append(batcher.submit(offset + i))
+            except RuntimeError:
+                rejected.append(offset + i)
+
+    threads = [threading.Thread(target=client, args=(n * 1000,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    batcher.stop()
+    for thread in threads:
+        thread.join()
+    # Không request nào lọt vào sau _STOP mà bị bỏ quên
+    for future in accepted:
+        future.result(timeout=2)
+    assert len(accepted) + len(rejected) == 800
+
+
+def test_max_batch_size_must_be_positive():
+    with pytest.raises(ValueError):
+        MicroBatcher(lambda items: items, max_batch_size=0, name="test_invalid")
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from app.db.pagination import (
+    API_PAGE_SIZE_DEFAULT,
+    API_PAGE_SIZE_MAX,
+    InvalidCursor,
+    clamp_limit,
+    decode_cursor,
+    encode_cursor,
+    paginate,
+)
+
+
+def test_cursor_roundtrip_is_url_safe():
+    token = encode_cursor(["2026-10-17T03:46:41+00:00", "Trạng thái/ß?"])
+    assert "=" not in token and "+" not in token and "/" not in token
+    assert decode_cursor(token) == ["2026-10-17T03:46:41+00:00", "Trạng thái/ß?"]
+    assert decode_cursor(encode_cursor([1, "x", 2.5]), size=3) == [1, "x", 2.5]
+
+
+@pytest.mark.parametrize("token", [
+    "không-phải-base64",
+    encode_cursor(["2026-10-17"]),           # thiếu cột
+    encode_cursor(["2026-10-17", None]),     # giá trị null
+    encode_cursor(["2026-10-17", "w1"])[:-4],  # bị cắt
+    "e30",                                   # "{}": không phải list
+])
+def test_invalid_cursor_raises(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token)
+
+
+def test_invalid_cursor_is_a_value_error():
+    assert issubclass(InvalidCursor, ValueError)
+
+
+def test_clamp_limit():
+    assert clamp_limit(None) == API_PAGE_SIZE_DEFAULT
+    assert clamp_limit(0) == API_PAGE_SIZE_DEFAULT
+    assert clamp_limit(-5) == API_PAGE_SIZE_DEFAULT
+    assert clamp_limit(7) == 7
+    assert clamp_limit(API_PAGE_SIZE_MAX + 1) == API_PAGE_SIZE_MAX
+
+
+@pytest.fixture
+def workflows(database):
+    # Ba dòng cùng created_at: thứ tự phải phân định bằng id
+    rows = [
+        {"id": f"w{i}", "name": f"Workflow {i}", "created_at": created_at}
+        for i, created_at in enumerate([
+            "2026-10-01T00:00:00+00:00", "2026-10-02T00:00:00+00:00", "2026-10-02T00:00:00+00:00",
+            "2026-10-02T00:00:00+00:00", "2026-10-03T00:00:00+00:00", "2026-10-04T00:00:00+00:00",
+            "2026-10-05T00:00:00+00:00",
+        ])
+    ]
+    asyncio.run(database.insert("workflows", rows))
+    return rows
+
+
+def _all_pages(database, limit, desc, where=None):
+    pages, cursor = [], None
+    while True:
+        page = asyncio.run(paginate(database, "workflows", "id, name", where=where, limit=limit, cursor=cursor, desc=desc))
+        pages.append([item["id"] for item in page["items"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("desc", [True, False])
+@pytest.mark.parametrize("limit", [1, 2, 3, 7, 50])
+def test_pages_cover_every_row_once_in_order(database, workflows, limit, desc):
+    expected = [r["id"] for r in sorted(workflows, key=lambda r: (r["created_at"], r["id"]), reverse=desc)]
+    pages = _all_pages(database, limit, desc)
+    assert [item for page in pages for item in page] == expected
+    assert all(len(page) == limit for page in pages[:-1])
+    assert pages[-1]
+
+
+def test_page_selects_requested_and_cursor_columns(database, workflows):
+    page = asyncio.run(paginate(database, "workflows", "name", limit=2))
+    assert set(page["items"][0]) == {"name", "created_at", "id"}
+    assert decode_cursor(page["next_cursor"]) == ["2026-10-04T00:00:00+00:00", "w5"]
+
+
+def test_where_filter_applies_on_every_page(database, workflows):
+    where = [("created_at", "eq", "2026-10-02T00:00:00+00:00")]
+    assert _all_pages(database, 2, True, where=where) == [["w3", "w2"], ["w1"]]
+
+
+def test_paginate_rejects_bad_cursor_before_querying(database):
+    with pytest.raises(InvalidCursor):
+        asyncio.run(paginate(database, "workflows", "id", cursor="e30"))
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.services import reports
+from app.services.reports import ALL_TIME_BUCKET, ReportAggregator, ReportSums, accumulate, parse_time
+
+
+def _ago(**delta):
+    return (datetime.now(timezone.utc) - timedelta(**delta)).isoformat()
+
+
+def _call(call_id, end_time, status="completed", duration=10.0, last_intent=None, workflow_id="wf1"):
+    return {
+        "id": call_id, "workflow_id": workflow_id, "status": status, "duration": duration,
+        "last_intent": last_intent, "end_time": end_time,
+    }
+
+
+def _setup(database, *calls):
+    async def run():
+        await database.insert("workflows", {"id": "wf1", "name": "Demo"})
+        if calls:
+            await database.insert("calls", list(calls))
+    asyncio.run(run())
+
+
+def _report(database, bucket=ALL_TIME_BUCKET):
+    return asyncio.run(database.select_one("reports", where={"workflow_id": "wf1", "bucket": bucket}))
+
+
+def test_accumulate_adds_all_time_and_day_buckets():
+    calls = [
+        _call("c1", "2026-10-01T10:00:00+00:00", duration=10, last_intent="xac_nhan"),
+        _call("c2", "2026-10-02T23:30:00+07:00", status="failed", duration=None),
+        _call("c3", "2026-10-02T01:00:00+00:00", workflow_id=None),
+    ]
+    sums = accumulate(calls)
+    assert set(sums) == {("wf1", ALL_TIME_BUCKET), ("wf1", "2026-10-01"), ("wf1", "2026-10-02")}
+    row = sums["wf1", ALL_TIME_BUCKET].to_row("wf1", ALL_TIME_BUCKET)
+    assert (row["total_calls"], row["success_calls"], row["positive_calls"]) == (2, 1, 1)
+    assert (row["success_rate"], row["avg_duration"], row["positive_intent_rate"]) == (50.0, 10.0, 50.0)
+
+
+def test_accumulate_skips_calls_already_applied_to_a_row():
+    calls = [_call("c1", "2026-10-01T10:00:00+00:00"), _call("c2", "2026-10-01T12:00:00+00:00")]
+    applied = {("wf1", ALL_TIME_BUCKET): parse_time("2026-10-01T11:00:00+00:00")}
+    sums = accumulate(calls, applied=applied)
+    assert sums["wf1", ALL_TIME_BUCKET].total_calls == 1
+    assert sums["wf1", "2026-10-01"].total_calls == 2
+
+
+def test_report_sums_merge_and_from_row_roundtrip():
+    sums = ReportSums(total_calls=2, success_calls=1, duration_sum=5.0, duration_calls=1)
+    sums.merge(ReportSums.from_row(sums.to_row("wf1", ALL_TIME_BUCKET)))
+    assert (sums.total_calls, sums.success_calls, sums.duration_sum, sums.duration_calls) == (4, 2, 10.0, 2)
+
+
+def test_run_delta_adds_new_calls_and_moves_watermark(database):
+    _setup(database, _call("c1", _ago(hours=2)), _call("c2", _ago(hours=1), status="failed"),
+           {"id": "c3", "workflow_id": "wf1", "status": "in_progress"})
+    aggregator = ReportAggregator(settle_seconds=0)
+
+    first = asyncio.run(aggregator.run_delta())
+    assert first["calls"] == 2
+    total = _report(database)
+    assert (total["total_calls"], total["success_calls"]) == (2, 1)
+    assert total["applied_through"] == first["watermark"]
+
+    # Cuộc gọi kết thúc sau watermark của lần chạy trước
+    asyncio.run(database.update("calls", {"status": "completed", "end_time": _ago(seconds=0)}, {"id": "c3"}))
+    time.sleep(0.01)
+    second = asyncio.run(aggregator.run_delta())
+    assert second["calls"] == 1
+    assert _report(database)["total_calls"] == 3
+    state = asyncio.run(database.select_one("report_state", where={"name": "reports"}))
+    assert state["watermark"] == second["watermark"]
+    assert state["lease_until"] == 0
+
+
+def test_rerun_after_unsaved_watermark_does_not_double_count(database):
+    _setup(database, _call("c1", _ago(hours=2)), _call("c2", _ago(hours=1)))
+    aggregator = ReportAggregator(settle_seconds=0)
+    asyncio.run(aggregator.run_delta())
+    # Lần chạy trước đã ghi dòng nhưng chết trước khi dời watermark
+    asyncio.run(database.update("report_state", {"watermark": None}, {"name": "reports"}))
+
+    result = asyncio.run(aggregator.run_delta())
+    assert result["calls"] == 2
+    assert _report(database)["total_calls"] == 2
+
+
+def test_run_is_skipped_while_another_process_holds_the_lease(database):
+    _setup(database, _call("c1", _ago(hours=1)))
+    asyncio.run(database.upsert(
+        "report_state", {"name": "reports", "lease_owner": "other", "lease_until": time.time() + 60}, on_conflict="name",
+    ))
+    aggregator = ReportAggregator(settle_seconds=0)
+    assert asyncio.run(aggregator.run_delta())["skipped"] == "lease_held"
+    assert asyncio.run(aggregator.rebuild())["skipped"] == "lease_held"
+    assert _report(database) is None
+    assert aggregator.stats()["lease_skips"] == 2
+
+    # Lease hết hạn: process này lấy lại được
+    asyncio.run(database.update("report_state", {"lease_until": time.time() - 1}, {"name": "reports"}))
+    assert asyncio.run(aggregator.run_delta())["calls"] == 1
+
+
+def test_rebuild_replaces_drifted_rows(database):
+    _setup(database, _call("c1", _ago(days=1)), _call("c2", _ago(hours=1)))
+    aggregator = ReportAggregator(settle_seconds=0)
+    asyncio.run(aggregator.run_delta())
+    asyncio.run(database.update("reports", {"total_calls": 99}, {"workflow_id": "wf1", "bucket": ALL_TIME_BUCKET}))
+    asyncio.run(database.insert("reports", {"workflow_id": "wf1", "bucket": "2000-01-01", "total_calls": 5}))
+
+    result = asyncio.run(aggregator.rebuild())
+    assert result["calls"] == 2
+    assert _report(database)["total_calls"] == 2
+    assert _report(database, "2000-01-01") is None
+    # Watermark mới: job delta tiếp theo không cộng lại các cuộc gọi cũ
+    assert asyncio.run(aggregator.run_delta())["calls"] == 0
+    assert _report(database)["total_calls"] == 2
+
+
+def test_existing_rows_are_loaded_in_key_chunks(database, monkeypatch):
+    monkeypatch.setattr(reports, "KEY_CHUNK_SIZE", 1)
+    _setup(database, _call("c1", _ago(days=2)), _call("c2", _ago(days=1)))
+    aggregator = ReportAggregator(settle_seconds=0)
+    asyncio.run(aggregator.run_delta())
+    asyncio.run(database.update("report_state", {"watermark": None}, {"name": "reports"}))
+
+    # Mọi dòng đã có (mỗi khóa một truy vấn) đều được nạp: chạy lại không cộng trùng
+    assert asyncio.run(aggregator.run_delta())["calls"] == 2
+    rows = asyncio.run(database.select("reports", "bucket, total_calls", where={"workflow_id": "wf1"}))
+    assert sorted(r["total_calls"] for r in rows) == [1, 1, 2]
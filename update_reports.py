@@ -0,0 +1,40 @@
+"""
+Reports - cập nhật bảng reports ngoài app (cron)
+Mặc định chạy một lần job delta: cộng các cuộc gọi kết thúc sau watermark.
+--full tính lại toàn bộ từ bảng calls (sửa sai lệch), --workflow-id giới hạn
+một workflow. Job trong app mặc định tắt (REPORTS_JOB_INTERVAL_SECONDS=0); nếu
+process khác đang giữ lease thì lần chạy này bỏ qua ("skipped": "lease_held").
+Chạy: python update_reports.py [--full] [--workflow-id <uuid>]
+"""
+
+import argparse
+import asyncio
+import json
+
+from app.utils.logger import configure_logging
+
+
+async def run(args):
+    from app.db import close_db
+    from app.services.reports import report_aggregator
+
+    try:
+        if args.full or args.workflow_id:
+            result = await report_aggregator.rebuild(args.workflow_id)
+        else:
+            result = await report_aggregator.run_delta()
+    finally:
+        await close_db()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+def main():
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Cập nhật bảng reports (KPI theo workflow)")
+    parser.add_argument('--full', action='store_true', help="Tính lại toàn bộ thay vì chỉ phần delta")
+    parser.add_argument('--workflow-id', help="Chỉ tính lại một workflow (ngụ ý --full)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()